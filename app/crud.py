@@ -1,3 +1,4 @@
+from sqlalchemy import cast, update, Integer, String
 from sqlalchemy.orm import Session, joinedload
 from . import models, schemas
 from passlib.context import CryptContext
@@ -160,31 +161,22 @@ def create_booking(db: Session, booking_data: schemas.BookingCreate, user_id: in
         return None # Conflicto: la pista ya está ocupada
     
     # 3. Determinar el ID del precio aplicable según el horario (Schedule) y la demanda activa en el momento de la reserva
-    day_of_week = start_dt.weekday()
-    time_obj = start_dt.time()
+    # Buscamos el demand_id para ese horario (cuadrante y festivos cacheados en memoria)
+    from .services.holiday_service import get_demand_at
+    demand_id = get_demand_at(db, start_dt)
     
-    # Buscamos el demand_id para ese horario
-    schedule = db.query(models.Schedule).filter(
-        models.Schedule.day_of_week == day_of_week,
-        models.Schedule.start_time == time_obj
-    ).first()
-    
-    if not schedule:
+    if not demand_id:
         return None
     
-    # Buscamos el precio vigente para esa demanda en la fecha de la reserva
-    from sqlalchemy import or_
-    price = db.query(models.Price).filter(
-        models.Price.demand_id == schedule.demand_id,
-        models.Price.start_date <= start_dt,
-        or_(models.Price.end_date == None, models.Price.end_date > start_dt)
-    ).order_by(models.Price.start_date.desc()).first()
+    # Buscamos el precio vigente para esa demanda en la fecha de la reserva (línea temporal en memoria)
+    from .services.pricing_service import get_price_at
+    price = get_price_at(db, demand_id, start_dt)
     
-    price_id = price.price_id if price else None
+    price_id = price[0] if price else None
     
     if not price_id:
         # Esto no debería ocurrir si el sistema está bien inicializado
-        logger.info("No price found for demand_id: %s", schedule.demand_id)
+        logger.info("No price found for demand_id: %s", demand_id)
         return None 
     
     # 4. Crear el registro de la reserva
@@ -232,16 +224,179 @@ def cancel_booking_logic(db: Session, booking_id: int, user_id: int):
     
     if booking:
         booking.is_cancelled = True
+        booking.cancelled_at = datetime.utcnow()
+        # Si el día ya estaba consolidado en el agregado de estadísticas, se recalcula
+        from .services.stats_service import invalidate_daily_stats
+        invalidate_daily_stats(db, booking.start_time.date())
         db.commit()
         logger.info(f"Booking cancelled for user {user_id} on booking {booking_id}")
     
     return booking
 
-def get_all_users(db: Session):
+def _like_prefix(value: str) -> str:
+    """
+    Construye un patrón LIKE de prefijo en minúsculas, escapando los comodines del usuario.
+    Se usa con escape="\\" para que '%' y '_' se busquen literalmente.
+    """
+    escaped = value.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+def encode_booking_cursor(start_time: datetime, booking_id: int) -> str:
+    """Cursor opaco de paginación keyset: posición (start_time, booking_id) de la última fila."""
+    return f"{start_time.isoformat()}|{booking_id}"
+
+def decode_booking_cursor(cursor: str):
+    """
+    Decodifica un cursor generado por encode_booking_cursor.
+    :raises ValueError: Si el cursor no tiene el formato esperado.
+    """
+    start_raw, booking_raw = cursor.split("|", 1)
+    return datetime.fromisoformat(start_raw), int(booking_raw)
+
+def search_bookings(
+    db: Session,
+    email_prefix: str = None,
+    court_id: int = None,
+    status: str = "all",
+    date_from: datetime = None,
+    date_to: datetime = None,
+    cursor: str = None,
+    limit: int = 50,
+    descending: bool = True
+):
+    """
+    Búsqueda administrativa de reservas con filtros y paginación por cursor (keyset).
+
+    Solo proyecta las columnas necesarias (sin cargar entidades User/Price completas) y
+    recorre el índice (start_time, booking_id), por lo que el coste de cada página no
+    depende de cuántas páginas se hayan recorrido antes.
+
+    :param email_prefix: Prefijo del email del usuario (sin distinguir mayúsculas).
+    :param court_id: Pista concreta.
+    :param status: "all", "active" o "cancelled".
+    :param date_from: Inicio mínimo (incluido).
+    :param date_to: Inicio máximo (excluido).
+    :param cursor: Cursor devuelto por la página anterior (next_cursor).
+    :param limit: Tamaño de página.
+    :param descending: Orden de más reciente a más antigua (por defecto) o al revés.
+    :return: Tupla (lista de dicts, next_cursor o None).
+    :raises ValueError: Si el cursor es inválido.
+    """
+    from sqlalchemy import func, tuple_
+
+    query = db.query(
+        models.Booking.booking_id,
+        models.Booking.court_id,
+        models.Booking.start_time,
+        models.Booking.is_cancelled,
+        models.Booking.user_id,
+        models.User.email,
+        models.Price.amount
+    ).join(
+        models.User, models.Booking.user_id == models.User.user_id
+    ).outerjoin(
+        models.Price, models.Booking.price_id == models.Price.price_id
+    )
+
+    if email_prefix:
+        query = query.filter(func.lower(models.User.email).like(_like_prefix(email_prefix), escape="\\"))
+    if court_id is not None:
+        query = query.filter(models.Booking.court_id == court_id)
+    if status == "active":
+        query = query.filter(models.Booking.is_cancelled == False)
+    elif status == "cancelled":
+        query = query.filter(models.Booking.is_cancelled == True)
+    if date_from:
+        query = query.filter(models.Booking.start_time >= date_from)
+    if date_to:
+        query = query.filter(models.Booking.start_time < date_to)
+
+    position = tuple_(models.Booking.start_time, models.Booking.booking_id)
+    if cursor:
+        cursor_start, cursor_id = decode_booking_cursor(cursor)
+        query = query.filter(position < tuple_(cursor_start, cursor_id) if descending else position > tuple_(cursor_start, cursor_id))
+
+    if descending:
+        query = query.order_by(models.Booking.start_time.desc(), models.Booking.booking_id.desc())
+    else:
+        query = query.order_by(models.Booking.start_time.asc(), models.Booking.booking_id.asc())
+
+    # Pedimos una fila de más para saber si hay página siguiente
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = [{
+        "booking_id": r.booking_id,
+        "court_id": r.court_id,
+        "start_time": r.start_time.isoformat(),
+        "user_id": r.user_id,
+        "user_email": r.email,
+        "price_amount": r.amount,
+        "is_cancelled": r.is_cancelled
+    } for r in rows]
+
+    next_cursor = encode_booking_cursor(rows[-1].start_time, rows[-1].booking_id) if has_more else None
+    logger.info(f"Búsqueda de reservas: {len(results)} resultados (email={email_prefix}, pista={court_id}, estado={status})")
+    return results, next_cursor
+
+def search_users(db: Session, q: str = None, after_id: int = None, limit: int = 50, include_permissions: bool = False):
     """
-    Recupera todos los usuarios registrados.
+    Directorio de usuarios paginado para administración.
+
+    Busca por prefijo (sin distinguir mayúsculas) en nombre, apellidos o email, apoyándose en
+    los índices lower(...) de la tabla users, y pagina por cursor sobre user_id. Los permisos
+    solo se cargan (con un LEFT JOIN proyectado) si se piden.
+
+    :param q: Texto a buscar como prefijo de nombre, apellidos o email.
+    :param after_id: user_id de la última fila de la página anterior.
+    :param limit: Tamaño de página.
+    :param include_permissions: Incluir los permisos de cada usuario.
+    :return: Tupla (lista de dicts, next_cursor o None).
     """
-    return db.query(models.User).options(joinedload(models.User.permissions)).all()
+    from sqlalchemy import func, or_
+
+    columns = [models.User.user_id, models.User.name, models.User.surname, models.User.email]
+    if include_permissions:
+        columns += [
+            models.Permission.is_admin,
+            models.Permission.can_rent,
+            models.Permission.can_edit_schedule,
+            models.Permission.can_edit_price
+        ]
+
+    query = db.query(*columns)
+    if include_permissions:
+        query = query.outerjoin(models.Permission, models.Permission.user_id == models.User.user_id)
+
+    if q:
+        pattern = _like_prefix(q)
+        query = query.filter(or_(
+            func.lower(models.User.email).like(pattern, escape="\\"),
+            func.lower(models.User.name).like(pattern, escape="\\"),
+            func.lower(models.User.surname).like(pattern, escape="\\")
+        ))
+    if after_id is not None:
+        query = query.filter(models.User.user_id > after_id)
+
+    rows = query.order_by(models.User.user_id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = []
+    for r in rows:
+        user = {"user_id": r.user_id, "name": r.name, "surname": r.surname, "email": r.email}
+        if include_permissions:
+            user["permissions"] = None if r.is_admin is None else {
+                "is_admin": r.is_admin,
+                "can_rent": r.can_rent,
+                "can_edit_schedule": r.can_edit_schedule,
+                "can_edit_price": r.can_edit_price
+            }
+        results.append(user)
+
+    next_cursor = rows[-1].user_id if has_more else None
+    return results, next_cursor
 
 def update_user_password(db: Session, user_id: int, new_password: str):
     """
@@ -258,3 +413,54 @@ def update_user_password(db: Session, user_id: int, new_password: str):
         db.refresh(db_user)
         logger.info(f"Password updated for user {user_id}")
     return db_user
+
+# --- System State Operations ---
+
+def get_state_value(db: Session, key: str):
+    """
+    Lee un valor del almacén clave/valor interno (tabla system_state).
+    :return: El valor como string, o None si la clave no existe.
+    """
+    state = db.query(models.SystemState).filter(models.SystemState.key == key).first()
+    return state.value if state else None
+
+def set_state_value(db: Session, key: str, value: str):
+    """
+    Crea o actualiza un valor del almacén clave/valor interno.
+    No hace commit: se confirma junto con la transacción del llamante.
+    """
+    state = db.query(models.SystemState).filter(models.SystemState.key == key).first()
+    if state:
+        state.value = value
+    else:
+        db.add(models.SystemState(key=key, value=value))
+    logger.info(f"Estado interno actualizado: {key}={value}")
+
+def increment_state_counter(db: Session, key: str, expected: str = None):
+    """
+    Incrementa de forma atómica un contador del almacén clave/valor
+    (UPDATE ... SET value = value + 1), sin leer y escribir por separado.
+    No hace commit: se confirma junto con la transacción del llamante.
+    :param expected: Si se indica, solo incrementa si el valor actual es ese (una clave
+        inexistente cuenta como "0").
+    :return: El nuevo valor como string, o None si no coincidía con `expected`.
+    """
+    if db.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+
+    # La primera vez se crea la clave a "0"; si ya existe (o la crea otro proceso) no se toca
+    db.execute(insert(models.SystemState).values(key=key, value="0").on_conflict_do_nothing(index_elements=["key"]))
+
+    stmt = update(models.SystemState).where(models.SystemState.key == key)
+    if expected is not None:
+        stmt = stmt.where(models.SystemState.value == expected)
+    new_value = db.execute(
+        stmt.values(value=cast(cast(models.SystemState.value, Integer) + 1, String), updated_at=datetime.utcnow())
+        .returning(models.SystemState.value)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if new_value is not None:
+        logger.info(f"Estado interno actualizado: {key}={new_value}")
+    return new_value
@@ -13,6 +13,14 @@ from .templates import templates
 from .conf.config_json import initialize_lat_lon
 from .services.scheduler_service import init_scheduler, shutdown_scheduler
 from .services.task_service import process_pending_tasks
+from .services.analytics_service import shutdown_analytics
+from .services.notification_service import shutdown_smtp_pool
+from .services.email_dispatcher import shutdown_dispatcher
+from .services.notification_recorder import shutdown_recorder
+from .services.notification_digest import shutdown_coalescer
+from .services.email_templates import precompile_all as precompile_email_templates
+from .services.capacity_service import extend_capacity_calendar
+from .services.stats_service import ensure_daily_stats
 initialize_lat_lon()  # Cargamos la configuración al iniciar la aplicación
 # --- Configuración Inicial ---
 
@@ -95,6 +103,8 @@ def startup_event():
     initialize_prices(db)        # Inicializa precios base
     initialize_courts(db)        # Crea las pistas si no existen
     initialize_schedules(db)     # Genera el cuadrante horario semanal
+    extend_capacity_calendar(db) # Extiende el calendario de capacidad de las pistas
+    ensure_daily_stats(db)       # Consolida las estadísticas de los días cerrados
     initialize_lat_lon()         # Inicializa datos para el clima
     logging.info("Datos maestros inicializados.")
 
@@ -109,6 +119,9 @@ def startup_event():
         f"sender={sender_email}, sender_password_set={sender_password_present}"
     )
     
+    # Compilar las plantillas de email antes del primer envío
+    precompile_email_templates()
+    
     # Procesar cualquier tarea pendiente de reinicio anterior
     logging.info("Procesando tareas pendientes del reinicio anterior...")
     task_stats = process_pending_tasks(db)
@@ -138,6 +151,16 @@ def shutdown_event():
     
     # Detener el scheduler
     shutdown_scheduler()
+
+    # Detener el proceso worker de analítica
+    shutdown_analytics()
+
+    # Enviar los resúmenes pendientes, terminar los envíos en cola, escribir sus
+    # notificaciones y cerrar las conexiones SMTP persistentes
+    shutdown_coalescer()
+    shutdown_dispatcher()
+    shutdown_recorder()
+    shutdown_smtp_pool()
     
     logging.info("Eventos de apagón completados.")
     #logging.info("\n\n\n\n")
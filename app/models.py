@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Time, Float, Index
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Time, Float, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -25,6 +25,27 @@ class User(Base):
     # Relación One-to-Many con Bookings
     bookings = relationship("Booking", back_populates="user")
 
+    # Índice para búsquedas por prefijo de email sin distinguir mayúsculas (lower(email) LIKE 'abc%')
+    # text_pattern_ops permite usar el índice con LIKE independientemente de la collation
+    __table_args__ = (
+        Index(
+            "ix_users_email_lower",
+            func.lower(email).label("email_lower"),
+            postgresql_ops={"email_lower": "text_pattern_ops"}
+        ),
+        # Índices equivalentes para el directorio de usuarios (búsqueda por prefijo de nombre y apellidos)
+        Index(
+            "ix_users_name_lower",
+            func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"}
+        ),
+        Index(
+            "ix_users_surname_lower",
+            func.lower(surname).label("surname_lower"),
+            postgresql_ops={"surname_lower": "text_pattern_ops"}
+        ),
+    )
+
 class Permission(Base):
     """
     Almacena los permisos específicos de cada usuario.
@@ -102,13 +123,24 @@ class Schedule(Base):
     # Relación con el nivel de demanda asociado al horario
     demand = relationship("Demand")
 
+    # Un único bloque por día y hora: permite aplicar el cuadrante con un upsert
+    __table_args__ = (
+        Index("ux_schedules_day_time", "day_of_week", "start_time", unique=True),
+    )
+
 class Holiday(Base):
     """
     Almacena fechas especiales (festivos) donde el horario podría variar.
+    Por defecto un festivo usa los niveles de demanda del domingo; opcionalmente
+    puede fijar un nivel propio y reducir los bloques a la franja [open_time, close_time).
     """
     __tablename__ = "holidays"
 
     date = Column(DateTime, primary_key=True)
+    description = Column(String, nullable=True)                                 # Ej: "Navidad"
+    demand_id = Column(Integer, ForeignKey("demands.demand_id"), nullable=True) # Nivel especial (nulo = como domingo)
+    open_time = Column(Time, nullable=True)   # Primer bloque que se abre (nulo = cuadrante completo)
+    close_time = Column(Time, nullable=True)  # Los bloques deben empezar antes de esta hora
 
 class Booking(Base):
     """
@@ -127,6 +159,7 @@ class Booking(Base):
     start_time = Column(DateTime, nullable=False)          # Fecha y hora exacta del alquiler
     created_at = Column(DateTime, default=datetime.utcnow) # Cuándo se realizó la reserva
     is_cancelled = Column(Boolean, default=False)          # Flag de cancelación
+    cancelled_at = Column(DateTime, nullable=True)         # Cuándo se canceló (NULL si no está cancelada)
     
     # Relaciones para navegar entre modelos
     user = relationship("User", back_populates="bookings")
@@ -143,6 +176,13 @@ class Booking(Base):
             unique=True,
             postgresql_where=(is_cancelled == False)
         ),
+        # Índices compuestos para la búsqueda administrativa con paginación por cursor (keyset):
+        # orden (start_time, booking_id), opcionalmente filtrando por pista o por usuario
+        Index("ix_bookings_start_id", "start_time", "booking_id"),
+        Index("ix_bookings_court_start", "court_id", "start_time", "booking_id"),
+        Index("ix_bookings_user_start", "user_id", "start_time", "booking_id"),
+        # Cancelaciones recientes: refresco incremental de la instantánea de analítica
+        Index("ix_bookings_cancelled_at", "cancelled_at", postgresql_where=(cancelled_at.isnot(None))),
     )
 class Notification(Base):
     """
@@ -157,7 +197,9 @@ class Notification(Base):
     
     notification_type = Column(String, nullable=False)  # Tipo: 'booking_confirmation', 'reminder_24h', 'cancellation', 'price_update', etc.
     subject = Column(String, nullable=False)            # Asunto del email
-    content = Column(String, nullable=False)            # Body/contenido del email
+    content = Column(String, nullable=True)             # HTML completo (solo notificaciones antiguas sin plantilla)
+    template_key = Column(String, nullable=True)        # Plantilla con la que se generó el email (ver email_templates.EMAIL_TEMPLATE_FILES)
+    template_params = Column(String, nullable=True)     # Parámetros de la plantilla en JSON; el HTML se genera al consultarlo
     recipient_email = Column(String, nullable=False)    # Email del destinatario (desnormalizado para referencia)
     
     is_sent = Column(Boolean, default=False)            # ¿Fue enviado exitosamente?
@@ -165,9 +207,22 @@ class Notification(Base):
     created_at = Column(DateTime, default=datetime.utcnow) # Cuándo se creó el registro
     scheduled_for = Column(DateTime, nullable=True)     # Fecha/hora en la que se debe enviar (para tareas programadas)
     
+    # Reintentos de envío (ver notification_retry_service)
+    status = Column(String, nullable=True)              # 'sent', 'retry' (pendiente de reintento), 'dead' (agotó los reintentos); NULL en las antiguas
+    retry_count = Column(Integer, default=0, nullable=False) # Reintentos realizados
+    next_attempt_at = Column(DateTime, nullable=True)   # Cuándo toca el siguiente reintento
+    last_error = Column(String, nullable=True)          # Motivo del último fallo
+    
     # Relaciones
     user = relationship("User")
     booking = relationship("Booking")
+    
+    __table_args__ = (
+        # Cola de reintentos: notificaciones en 'retry' ordenadas por próximo intento
+        Index("ix_notifications_retry_due", "next_attempt_at", postgresql_where=(status == "retry")),
+        # Retención: selección de lotes por antigüedad
+        Index("ix_notifications_created_at", "created_at"),
+    )
 
 class ScheduledTask(Base):
     """
@@ -192,8 +247,79 @@ class ScheduledTask(Base):
     retry_count = Column(Integer, default=0)  # Veces que se intentó
     last_error = Column(String, nullable=True)  # Último error si falló
     
+    # Reclamo por un worker (ver task_service.claim_pending_tasks): nadie más la toma
+    # hasta locked_until; si el worker muere, la tarea vuelve a estar disponible
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relaciones
     user = relationship("User")
-    booking = relationship("Booking")
\ No newline at end of file
+    booking = relationship("Booking")
+    
+    __table_args__ = (
+        # Solo las tareas pendientes: el índice no crece con el histórico de tareas ejecutadas
+        Index("ix_scheduled_tasks_pending", "scheduled_for", postgresql_where=(is_executed == False)),
+    )
+
+class NotificationArchive(Base):
+    """
+    Histórico compacto de notificaciones antiguas (ver services/retention_service.py).
+    Sin claves foráneas, para poder borrar usuarios o reservas sin tocar el archivo,
+    y sin el HTML: plantilla + parámetros (o el HTML antiguo comprimido como 'legacy_html').
+    """
+    __tablename__ = "notifications_archive"
+
+    notification_id = Column(Integer, primary_key=True)  # Mismo ID que tenía en notifications
+    user_id = Column(Integer, nullable=False, index=True)
+    booking_id = Column(Integer, nullable=True)
+    notification_type = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    recipient_email = Column(String, nullable=False)
+    template_key = Column(String, nullable=True)
+    template_params = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    is_sent = Column(Boolean, default=False)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class DailyBookingStat(Base):
+    """
+    Agregado diario de reservas por pista y nivel de demanda.
+    Se alimenta desde la tabla de reservas (ver services/stats_service.py) y permite
+    servir estadísticas de rangos largos (ej. un año) sin recorrer reserva a reserva.
+    """
+    __tablename__ = "booking_daily_stats"
+
+    stat_date = Column(Date, primary_key=True)                                   # Día de inicio de las reservas
+    court_id = Column(Integer, ForeignKey("courts.court_id"), primary_key=True)
+    demand_id = Column(Integer, ForeignKey("demands.demand_id"), primary_key=True)
+
+    bookings = Column(Integer, nullable=False, default=0)   # Reservas activas (no canceladas)
+    cancelled = Column(Integer, nullable=False, default=0)  # Reservas canceladas
+    income = Column(Float, nullable=False, default=0.0)     # Ingresos de las reservas activas
+
+class CourtCapacity(Base):
+    """
+    Calendario de capacidad: número de franjas reservables por día y pista.
+    Se precalcula a partir del cuadrante (Schedule), el mantenimiento de las pistas y los festivos
+    (ver services/capacity_service.py) para obtener porcentajes de ocupación exactos.
+    """
+    __tablename__ = "court_capacity"
+
+    cap_date = Column(Date, primary_key=True)
+    court_id = Column(Integer, ForeignKey("courts.court_id"), primary_key=True)
+    slots = Column(Integer, nullable=False, default=0)  # Franjas reservables ese día en esa pista
+
+class SystemState(Base):
+    """
+    Almacén clave/valor para el estado interno de procesos batch
+    (marcas de agua de agregados, versiones de configuración, etc).
+    """
+    __tablename__ = "system_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from httpcore import request
 from sqlalchemy.orm import Session, joinedload
 import logging
+from typing import List
 from .. import crud, schemas, models
 from ..dependencies import get_db, get_current_user
 from ..database import engine
 from ..templates import templates
+from ..services import stats_service
 
 
 # Configuración del logger para este módulo
@@ -61,12 +63,17 @@ async def admin_reservas_page(request: Request):
 @router.get("/prices")
 def get_prices(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """
-    Lista todos los precios vigentes (is_active=True).
+    Lista el precio vigente ahora mismo para cada nivel de demanda
+    (según la línea temporal de precios, incluidas las versiones programadas que ya entraron en vigor).
     """
     if not current_user.permissions.is_admin:
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
-    prices = db.query(models.Price).options(joinedload(models.Price.demand)).filter(models.Price.is_active == True).all()
+    from ..services.pricing_service import get_current_price_ids
+    current_ids = list(get_current_price_ids(db).values())
+    prices = db.query(models.Price).options(joinedload(models.Price.demand)).filter(
+        models.Price.price_id.in_(current_ids)
+    ).order_by(models.Price.demand_id).all()
     logger.info("Precios obtenidos correctamente")
     # Retornamos los campos necesarios para el frontend
     return [{
@@ -80,255 +87,335 @@ def get_prices(current_user: models.User = Depends(get_current_user), db: Sessio
 @router.post("/prices/update")
 def update_price(data: schemas.PriceUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """
-    Actualiza un precio aplicando lógica de versionado:
-    1. Busca el precio actual para ese demand_id.
-    2. Le pone fecha_fin (end_date) y lo desactiva.
-    3. Crea uno nuevo con el nuevo importe y la fecha_inicio proporcionada.
+    Programa una nueva versión de precio para un nivel de demanda:
+    1. Si start_date ya ha pasado, el cambio es inmediato.
+    2. Si es futura, el precio actual sigue vigente hasta esa fecha.
+    3. Se pueden encadenar varias versiones futuras (se insertan en orden de fecha).
     """
     if not current_user.permissions.is_admin or not current_user.permissions.can_edit_price:
         raise HTTPException(status_code=403, detail="No tienes permisos para editar precios")
 
-    # 1. Buscar el precio actual (activo) para ese demand_id
-    current_price = db.query(models.Price).filter(
-        models.Price.demand_id == data.demand_id,
-        models.Price.is_active == True
-    ).first()
+    from ..services import pricing_service
+    try:
+        new_price = pricing_service.schedule_price_version(db, data.demand_id, data.amount, data.start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if not current_price:
+    if not new_price:
         raise HTTPException(status_code=404, detail="Precio actual no encontrado")
 
-    # 2. Cerrar el precio antiguo
-    # Ponemos la fecha de fin igual a la fecha de inicio del nuevo precio
-    current_price.end_date = data.start_date
-    current_price.is_active = False
-
-    # 3. Crear el nuevo precio
-    new_price = models.Price(
-        amount=data.amount,
-        start_date=data.start_date,
-        end_date=None,
-        description=current_price.description, # Mantenemos la descripción (Alta, Media, Baja)
-        is_active=True,
-        demand_id=data.demand_id
-    )   
-    logger.info(f"Precio actualizado correctamente: {new_price.amount} para el demand_id: {new_price.demand_id} desde {current_price.amount} a las {new_price.start_date} con la descripción {new_price.description}")
-    
-    db.add(new_price)
-    db.commit()
-    db.refresh(new_price)
+    logger.info(f"Precio actualizado correctamente: {new_price.amount} para el demand_id: {new_price.demand_id} a partir de {new_price.start_date}")
+
+    # Avisar a los usuarios con reservas futuras en ese nivel de demanda.
+    # Solo se encola una tarea: la búsqueda y los envíos los hace el worker.
+    from ..services.task_service import schedule_price_update_fanout
+    fanout_task = schedule_price_update_fanout(
+        db,
+        demand_id=new_price.demand_id,
+        price_id=new_price.price_id,
+        amount=new_price.amount,
+        start_date=new_price.start_date,
+        requested_by=current_user.user_id
+    )
+
+    return {"msg": "Precio actualizado correctamente", "new_price_id": new_price.price_id, "fanout_task_id": fanout_task.task_id}
+
+@router.get("/prices/versions")
+def get_price_versions(demand_id: int = None, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Lista todas las versiones de precio (pasadas, vigente, programadas y canceladas).
+    Opcional: filtrar por demand_id.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..services.pricing_service import list_price_versions
+    return list_price_versions(db, demand_id)
+
+@router.put("/prices/versions/{price_id}")
+def edit_price_version(price_id: int, data: schemas.PriceVersionUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Modifica el importe y/o la fecha de una versión programada que aún no ha entrado en vigor.
+    La versión se sustituye por otra nueva (nuevo price_id).
+    """
+    if not current_user.permissions.is_admin or not current_user.permissions.can_edit_price:
+        raise HTTPException(status_code=403, detail="No tienes permisos para editar precios")
+
+    from ..services import pricing_service
+    try:
+        new_price = pricing_service.update_scheduled_price(db, price_id, data.amount, data.start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not new_price:
+        raise HTTPException(status_code=404, detail="Versión de precio no encontrada")
+
+    logger.info(f"Versión de precio {price_id} sustituida por {new_price.price_id} ({new_price.amount} desde {new_price.start_date})")
+    return {"msg": "Versión de precio actualizada", "price_id": new_price.price_id}
+
+@router.delete("/prices/versions/{price_id}")
+def cancel_price_version(price_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Cancela una versión de precio programada que aún no ha entrado en vigor.
+    """
+    if not current_user.permissions.is_admin or not current_user.permissions.can_edit_price:
+        raise HTTPException(status_code=403, detail="No tienes permisos para editar precios")
+
+    from ..services import pricing_service
+    try:
+        price = pricing_service.cancel_scheduled_price(db, price_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not price:
+        raise HTTPException(status_code=404, detail="Versión de precio no encontrada")
 
-    return {"msg": "Precio actualizado correctamente", "new_price_id": new_price.price_id}
+    logger.info(f"Versión de precio {price_id} cancelada por {current_user.email}")
+    return {"msg": "Versión de precio cancelada", "price_id": price_id}
+
+def _require_schedule_editor(current_user: models.User):
+    """Lanza un 403 si el usuario no puede editar el cuadrante."""
+    if not current_user.permissions.is_admin or not current_user.permissions.can_edit_schedule:
+        raise HTTPException(status_code=403, detail="No tienes permisos para editar el cuadrante")
+
+@router.get("/schedule")
+def get_schedule(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Devuelve el cuadrante semanal como matriz 7x10 (días x bloques) de demand_id.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..services import schedule_service
+    return {
+        "slots": schedule_service.SLOT_LABELS,
+        "matrix": schedule_service.get_schedule_matrix(db),
+        "version": schedule_service.get_schedule_version(db)
+    }
+
+@router.put("/schedule")
+def replace_schedule(data: schemas.ScheduleMatrixUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Sustituye el cuadrante completo (matriz 7x10 de demand_id) en una sola operación.
+    """
+    _require_schedule_editor(current_user)
+
+    from ..services import schedule_service
+    try:
+        changes = schedule_service.matrix_to_changes(data.matrix)
+        result = schedule_service.apply_schedule_changes(db, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Cuadrante sustituido por {current_user.email} (versión {result['version']})")
+    return {"msg": "Cuadrante actualizado correctamente", **result}
+
+@router.patch("/schedule")
+def patch_schedule(data: schemas.SchedulePatch, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Aplica solo los bloques indicados sobre el cuadrante actual, en una sola operación.
+    """
+    _require_schedule_editor(current_user)
+
+    from ..services import schedule_service
+    changes = [(c.day_of_week, c.start_time, c.demand_id) for c in data.changes]
+    try:
+        result = schedule_service.apply_schedule_changes(db, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Cuadrante modificado por {current_user.email}: {len(changes)} bloques (versión {result['version']})")
+    return {"msg": "Cuadrante actualizado correctamente", **result}
+
+@router.get("/demand-tiers/settings")
+def get_demand_tier_settings(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Configuración de la asignación automática de niveles de demanda."""
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..services.demand_tier_service import get_settings
+    return get_settings(db)
+
+@router.put("/demand-tiers/settings")
+def update_demand_tier_settings(data: schemas.DemandTierSettings, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Actualiza los umbrales y límites de la asignación automática."""
+    _require_schedule_editor(current_user)
+
+    from ..services.demand_tier_service import save_settings
+    try:
+        settings = save_settings(db, data.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Configuración de niveles de demanda actualizada por {current_user.email}")
+    return settings
+
+@router.get("/demand-tiers/preview")
+def preview_demand_tiers(last: bool = False, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Muestra la propuesta de niveles de demanda como diferencia con el cuadrante actual.
+    - last=true: la última propuesta guardada por el job nocturno.
+    - por defecto: se recalcula ahora con la configuración vigente.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..services import demand_tier_service
+    if last:
+        proposal = demand_tier_service.get_last_proposal(db)
+        if not proposal:
+            raise HTTPException(status_code=404, detail="Todavía no hay ninguna propuesta guardada")
+        return proposal
+    return demand_tier_service.build_proposal(db)
+
+@router.post("/demand-tiers/apply")
+def apply_demand_tiers(data: schemas.DemandTierApply, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Aplica la propuesta de niveles de demanda que el administrador revisó. Solo se
+    aplica si el cuadrante sigue en la misma versión y la propuesta (la última guardada
+    o una recalculada ahora) coincide con la huella previsualizada.
+    """
+    _require_schedule_editor(current_user)
+
+    from ..services import demand_tier_service, schedule_service
+    if schedule_service.get_schedule_version(db) != data.schedule_version:
+        raise HTTPException(status_code=409, detail="El cuadrante ha cambiado desde la previsualización")
+    proposal = demand_tier_service.find_previewed_proposal(db, data.schedule_version, data.proposal_hash)
+    if proposal is None:
+        raise HTTPException(status_code=409, detail="La propuesta ha cambiado desde la previsualización; vuelve a revisarla")
+    if not proposal["changes"]:
+        return {"msg": "No hay cambios que aplicar", "updated": 0, "version": proposal["schedule_version"]}
+
+    try:
+        result = demand_tier_service.apply_proposal(db, proposal)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(f"Niveles de demanda aplicados por {current_user.email}: {result['updated']} bloques")
+    return {"msg": "Niveles de demanda aplicados", **result}
+
+@router.get("/holidays")
+def get_holidays(year: int = None, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Lista los festivos (opcionalmente de un año) con su nivel de demanda y horario.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..services.holiday_service import list_holidays
+    return list_holidays(db, year)
+
+@router.post("/holidays/import")
+def import_holidays(data: schemas.HolidayImport, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Importa en bloque los festivos (ej. los de un año) en una sola operación.
+    Con replace_year se sustituye el calendario completo de ese año.
+    """
+    _require_schedule_editor(current_user)
+
+    from ..services import holiday_service
+    try:
+        result = holiday_service.import_holidays(
+            db, [h.model_dump() for h in data.holidays], replace_year=data.replace_year
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Festivos importados por {current_user.email}: {result['imported']}")
+    return {"msg": "Festivos importados correctamente", **result}
+
+def _parse_date_param(value: str):
+    """
+    Convierte un parámetro de fecha (YYYY-MM-DD) a date, o None si no se indicó.
+    Lanza un 400 si el formato es inválido.
+    """
+    if not value:
+        return None
+    from datetime import datetime
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
 
 @router.get("/stats-data")
-def get_stats(period: int = 30, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_stats(
+    period: int = 30,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    granularity: str = "day",
+    refresh: bool = False,
+    current_user: models.User = Depends(get_current_user)
+):
     """
-    Calcula estadísticas avanzadas de uso e ingresos: comparativas, tendencias, heatmap de ocupación, KPIs.
+    Devuelve estadísticas avanzadas de uso e ingresos: comparativas, tendencias, heatmap de ocupación, KPIs.
+    Las respuestas se cachean por periodo y rango (stale-while-revalidate); "computed_at" indica cuándo se calcularon.
     
     Args:
         period: Número de días a considerar (30, 60, 90 por defecto 30)
+        from / to: Rango arbitrario de fechas (YYYY-MM-DD, ambos incluidos). Si se indican, se ignora 'period'
+        granularity: Agrupación de la serie temporal del rango ("day", "week", "month")
+        refresh: Fuerza el recálculo ignorando la caché
     """
     if not current_user.permissions.is_admin:
         raise HTTPException(status_code=403, detail="Acceso denegado")
-    
-    from sqlalchemy import func, desc, extract, cast, Integer, Date
-    from datetime import datetime, timedelta
 
-    # Validar periodo
-    if period not in [30, 60, 90]:
-        period = 30
-
-    now = datetime.utcnow()
-    period_start = now - timedelta(days=period)
-    previous_period_start = now - timedelta(days=period * 2)
-    previous_period_end = period_start
-
-    # === PERÍODO ACTUAL ===
-    current_bookings = db.query(models.Booking).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).count()
-
-    current_income = db.query(
-        func.sum(models.Price.amount)
-    ).join(
-        models.Booking, models.Booking.price_id == models.Price.price_id
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).scalar() or 0.0
-
-    # === PERÍODO ANTERIOR ===
-    previous_bookings = db.query(models.Booking).filter(
-        models.Booking.start_time >= previous_period_start,
-        models.Booking.start_time < previous_period_end,
-        models.Booking.is_cancelled == False
-    ).count()
-
-    previous_income = db.query(
-        func.sum(models.Price.amount)
-    ).join(
-        models.Booking, models.Booking.price_id == models.Price.price_id
-    ).filter(
-        models.Booking.start_time >= previous_period_start,
-        models.Booking.start_time < previous_period_end,
-        models.Booking.is_cancelled == False
-    ).scalar() or 0.0
-
-    # Calcular variaciones porcentuales
-    booking_variation = 0.0
-    income_variation = 0.0
-    if previous_bookings > 0:
-        booking_variation = round(((current_bookings - previous_bookings) / previous_bookings) * 100, 1)
-    if previous_income > 0:
-        income_variation = round(((current_income - previous_income) / previous_income) * 100, 1)
-
-    # === TASA DE CANCELACIÓN ===
-    total_all_time = db.query(models.Booking).count()
-    total_cancelled = db.query(models.Booking).filter(models.Booking.is_cancelled == True).count()
-    cancellation_rate = 0.0
-    if total_all_time > 0:
-        cancellation_rate = round((total_cancelled / total_all_time) * 100, 1)
-
-    # === INGRESOS POR DEMANDA ===
-    income_by_demand_query = db.query(
-        models.Demand.description,
-        func.sum(models.Price.amount)
-    ).select_from(models.Booking).join(
-        models.Price, models.Booking.price_id == models.Price.price_id
-    ).join(
-        models.Demand, models.Price.demand_id == models.Demand.demand_id
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by(models.Demand.description).all()
+    if not date_from and not date_to:
+        return stats_service.get_stats_cached(period, force_refresh=refresh)
+
+    from datetime import datetime
+    range_from = _parse_date_param(date_from)
+    range_to = _parse_date_param(date_to) or datetime.utcnow().date()
+
+    if range_from is None:
+        raise HTTPException(status_code=400, detail="El parámetro 'from' es obligatorio al indicar un rango")
+    if range_from > range_to:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior o igual a 'to'")
+    if (range_to - range_from).days + 1 > stats_service.MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {stats_service.MAX_RANGE_DAYS} días")
+    if granularity not in stats_service.ALLOWED_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularidad inválida. Valores admitidos: {stats_service.ALLOWED_GRANULARITIES}")
+
+    return stats_service.get_range_stats_cached(range_from, range_to, granularity, force_refresh=refresh)
+
+@router.get("/analytics/{analysis}")
+def get_analytics(
+    analysis: str,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    months: int = 12,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Análisis pesados calculados con NumPy sobre la instantánea columnar de reservas
+    (en un proceso worker, sin lanzar consultas agregadas contra la base de datos).
 
-    income_by_demand = {desc: round(amount or 0, 2) for desc, amount in income_by_demand_query}
+    Args:
+        analysis: "heatmap" (día × franja × pista), "lead-time" (antelación) o "cohorts" (retención)
+        from / to: Rango de fechas de inicio de las reservas (YYYY-MM-DD, ambos incluidos)
+        months: Número de meses de seguimiento en el análisis de cohortes
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
 
-    # === OCUPACIÓN POR PISTA ===
-    occupancy_by_court = db.query(
-        models.Booking.court_id, func.count(models.Booking.booking_id)
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by(models.Booking.court_id).all()
-    
-    court_stats = {f"Pista {c_id}": count for c_id, count in occupancy_by_court}
+    from datetime import datetime, timedelta
+    from ..services import analytics_service
+
+    range_from = _parse_date_param(date_from)
+    range_to = _parse_date_param(date_to)
+    params = {
+        "date_from": datetime.combine(range_from, datetime.min.time()) if range_from else None,
+        "date_to": datetime.combine(range_to + timedelta(days=1), datetime.min.time()) if range_to else None,
+        "max_months": max(1, min(months, 36))
+    }
 
-    # === HORAS PUNTA ===
-    peak_hours_query = db.query(
-        extract('hour', models.Booking.start_time).label('hour'),
-        func.count(models.Booking.booking_id).label('count')
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by('hour').order_by(desc('count')).limit(3).all()
-
-    peak_hours = [{"hour": int(h), "count": c} for h, c in peak_hours_query]
-
-    # === TOP USUARIOS ===
-    top_users_query = db.query(
-        models.User.email,
-        models.User.name,
-        models.User.surname,
-        func.count(models.Booking.booking_id).label('count')
-    ).join(
-        models.Booking, models.Booking.user_id == models.User.user_id
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by(models.User.user_id).order_by(desc('count')).limit(5).all()
-
-    top_users = [
-        {"email": u.email, "name": f"{u.name} {u.surname}", "count": u.count} 
-        for u in top_users_query
-    ]
-
-    # === DATOS DIARIOS (TENDENCIA) ===
-    daily_data = db.query(
-        cast(models.Booking.start_time, Date).label('date'),
-        func.sum(models.Price.amount).label('daily_income'),
-        func.count(models.Booking.booking_id).label('daily_bookings')
-    ).join(
-        models.Price, models.Booking.price_id == models.Price.price_id
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by(cast(models.Booking.start_time, Date)).all()
-
-    # Procesar datos diarios por fecha
-    daily_income_trend = {}
-    for i in range(period, 0, -1):
-        date = (now - timedelta(days=i)).date().isoformat()
-        daily_income_trend[date] = 0.0
-    
-    daily_bookings_trend = {k: 0 for k in daily_income_trend.keys()}
-    
-    # === OCUPACIÓN POR PISTA Y HORA (HEATMAP) ===
-    occupancy_matrix = db.query(
-        models.Booking.court_id,
-        extract('hour', models.Booking.start_time).label('hour'),
-        func.count(models.Booking.booking_id).label('count')
-    ).filter(
-        models.Booking.start_time >= period_start,
-        models.Booking.is_cancelled == False
-    ).group_by(models.Booking.court_id, 'hour').all()
-
-    # Estructura: {"Pista 1": {8: 2, 9: 5, ...}, ...}
-    heatmap = {}
-    for court_id, hour, count in occupancy_matrix:
-        court_label = f"Pista {court_id}"
-        if court_label not in heatmap:
-            heatmap[court_label] = {}
-        heatmap[court_label][int(hour)] = count
-
-    # === MÉTRICAS KPI ===
-    total_slots = 30 * 9 * len(set([c[0] for c in occupancy_by_court])) if occupancy_by_court else 1  # Aprox.
-    avg_occupancy = round((current_bookings / total_slots) * 100, 1) if total_slots > 0 else 0.0
-    avg_ticket = round(current_income / max(current_bookings, 1), 2)
-
-    # === PISTAS MENOS USADAS (ALERTAS) ===
-    all_courts = db.query(models.Court).all()
-    court_usage = {c.court_id: 0 for c in all_courts}
-    for court_id, count in occupancy_by_court:
-        court_usage[court_id] = count
-    
-    underutilized_courts = [cid for cid, count in court_usage.items() if count < (current_bookings / len(all_courts) * 0.3)]
+    name = analysis.replace("-", "_")
+    if name not in ("heatmap", "lead_time", "cohorts"):
+        raise HTTPException(status_code=404, detail="Análisis no encontrado")
 
-    return {
-        # Período actual
-        "total_bookings_30d": current_bookings,
-        "total_income": round(current_income, 2),
-        "period": period,
-        
-        # Período anterior (comparativa)
-        "previous_bookings_30d": previous_bookings,
-        "previous_income": round(previous_income, 2),
-        "booking_variation": booking_variation,
-        "income_variation": income_variation,
-        
-        # Tasas y ratios
-        "cancellation_rate": cancellation_rate,
-        "avg_occupancy": avg_occupancy,
-        "avg_ticket": avg_ticket,
-        
-        # Ocupación
-        "court_occupancy": court_stats,
-        "occupancy_by_hour_and_court": heatmap,
-        
-        # Demanda
-        "income_by_demand": income_by_demand,
-        
-        # Tendencias
-        "peak_hours": peak_hours,
-        "daily_income_trend": daily_income_trend,
-        "daily_bookings_trend": daily_bookings_trend,
-        
-        # Top
-        "top_users": top_users,
-        
-        # Alertas
-        "underutilized_courts": underutilized_courts
-    }
+    try:
+        return analytics_service.run_analysis(name, **params)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="El análisis ha tardado demasiado")
 
 @router.get("/courts")
 def list_courts(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -356,6 +443,10 @@ def toggle_maintenance(court_id: int, current_user: models.User = Depends(get_cu
     court.is_maintenance = not court.is_maintenance
     db.commit()
     db.refresh(court)
+
+    # El calendario de capacidad de esta pista cambia a partir de hoy
+    from ..services.capacity_service import rebuild_future_capacity
+    rebuild_future_capacity(db, court_id=court_id)
     
     return {"msg": f"Pista {court_id} {'en mantenimiento' if court.is_maintenance else 'activa'}", "is_maintenance": court.is_maintenance}
 
@@ -399,6 +490,106 @@ def get_daily_bookings(date: str, current_user: models.User = Depends(get_curren
     
     return results
 
+@router.get("/bookings/search")
+def search_bookings(
+    email: str = None,
+    court_id: int = None,
+    status: str = "all",
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    cursor: str = None,
+    limit: int = 50,
+    order: str = "desc",
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Búsqueda de reservas para recepción: filtros por prefijo de email, pista, estado y rango
+    de fechas, con paginación por cursor (keyset). Para pedir la página siguiente se pasa
+    el 'next_cursor' devuelto en la respuesta anterior.
+
+    Args:
+        email: Prefijo del email del usuario (sin distinguir mayúsculas)
+        court_id: Pista concreta
+        status: "all", "active" o "cancelled"
+        from / to: Rango de fechas de inicio (YYYY-MM-DD, ambos incluidos)
+        cursor: Cursor de la página anterior
+        limit: Tamaño de página (máximo 200)
+        order: "desc" (más recientes primero) o "asc"
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from datetime import datetime, timedelta
+
+    if status not in ("all", "active", "cancelled"):
+        raise HTTPException(status_code=400, detail="Estado inválido. Valores admitidos: ['all', 'active', 'cancelled']")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Orden inválido. Valores admitidos: ['asc', 'desc']")
+
+    range_from = _parse_date_param(date_from)
+    range_to = _parse_date_param(date_to)
+    limit = max(1, min(limit, 200))
+
+    try:
+        items, next_cursor = crud.search_bookings(
+            db,
+            email_prefix=email.strip() if email else None,
+            court_id=court_id,
+            status=status,
+            date_from=datetime.combine(range_from, datetime.min.time()) if range_from else None,
+            date_to=datetime.combine(range_to + timedelta(days=1), datetime.min.time()) if range_to else None,
+            cursor=cursor,
+            limit=limit,
+            descending=(order == "desc")
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
+
+@router.get("/bookings/export")
+def export_bookings(
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    status: str = "all",
+    compress: str = "none",
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Exporta las reservas a CSV en streaming (cursor de servidor), opcionalmente comprimido con gzip.
+    La memoria del servidor se mantiene constante independientemente del número de filas.
+
+    Args:
+        from / to: Rango de fechas de inicio de las reservas (YYYY-MM-DD, ambos incluidos)
+        status: "all", "active" o "cancelled"
+        compress: "none" o "gzip"
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from fastapi.responses import StreamingResponse
+    from ..services import export_service
+
+    range_from = _parse_date_param(date_from)
+    range_to = _parse_date_param(date_to)
+    if range_from and range_to and range_from > range_to:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior o igual a 'to'")
+    if status not in export_service.EXPORT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Estado inválido. Valores admitidos: {export_service.EXPORT_STATUSES}")
+    if compress not in ("none", "gzip"):
+        raise HTTPException(status_code=400, detail="Compresión inválida. Valores admitidos: ['none', 'gzip']")
+
+    gzip_output = compress == "gzip"
+    filename = f"reservas_{range_from or 'inicio'}_{range_to or 'fin'}_{status}.csv" + (".gz" if gzip_output else "")
+    logger.info(f"Exportando reservas: from={range_from}, to={range_to}, status={status}, compress={compress}")
+
+    return StreamingResponse(
+        export_service.iter_bookings_csv(range_from, range_to, status, compress=gzip_output),
+        media_type="application/gzip" if gzip_output else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.post("/reset-database")
 def reset_database(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """
@@ -434,16 +625,36 @@ async def admin_users_page(request: Request):
                 )
 
 @router.get("/users-list")
-def list_users(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def list_users(
+    q: str = None,
+    cursor: int = None,
+    limit: int = 50,
+    include_permissions: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Lista todos los usuarios registrados.
+    Directorio paginado de usuarios registrados.
+
+    Args:
+        q: Prefijo de nombre, apellidos o email (sin distinguir mayúsculas)
+        cursor: 'next_cursor' de la página anterior
+        limit: Tamaño de página (máximo 200)
+        include_permissions: Incluir los permisos de cada usuario
     """
     if not current_user.permissions.is_admin:
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
-    users = crud.get_all_users(db)
+    limit = max(1, min(limit, 200))
+    users, next_cursor = crud.search_users(
+        db,
+        q=q.strip() if q else None,
+        after_id=cursor,
+        limit=limit,
+        include_permissions=include_permissions
+    )
     # Devolvemos solo la información necesaria
-    return [{"user_id": u.user_id, "name": u.name, "surname": u.surname, "email": u.email} for u in users]
+    return {"items": users, "next_cursor": next_cursor, "limit": limit}
 
 @router.post("/users/reset-password")
 def reset_user_password(data: schemas.UserPasswordReset, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -504,4 +715,155 @@ def get_task_statistics(current_user: models.User = Depends(get_current_user), d
     
     return {
         "scheduled_tasks": stats
-    }
\ No newline at end of file
+    }
+
+@router.get("/notifications/dispatcher-stats")
+def get_dispatcher_statistics(current_user: models.User = Depends(get_current_user)):
+    """
+    Métricas del envío de emails: despachador concurrente (cola, emails/s, latencia),
+    pool de conexiones SMTP, buffer de registro de notificaciones y agrupación en resúmenes.
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.email_dispatcher import get_dispatcher
+    from ..services.notification_service import smtp_pool
+    from ..services.notification_recorder import get_recorder
+    from ..services.notification_digest import get_coalescer
+    
+    return {
+        "dispatcher": get_dispatcher().stats(),
+        "smtp_pool": smtp_pool.stats(),
+        "recorder": get_recorder().stats(),
+        "digest": get_coalescer().stats()
+    }
+
+
+@router.get("/notifications")
+def list_notifications(
+    user_id: int = None,
+    booking_id: int = None,
+    cursor: int = None,
+    limit: int = 50,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Historial paginado de notificaciones (más recientes primero), sin el contenido.
+    El HTML de cada una se obtiene con /admin/notifications/{id}/content.
+
+    Args:
+        user_id: Filtrar por usuario
+        booking_id: Filtrar por reserva
+        cursor: 'next_cursor' de la página anterior
+        limit: Tamaño de página (máximo 200)
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    limit = max(1, min(limit, 200))
+    query = db.query(
+        models.Notification.notification_id,
+        models.Notification.user_id,
+        models.Notification.booking_id,
+        models.Notification.notification_type,
+        models.Notification.subject,
+        models.Notification.recipient_email,
+        models.Notification.is_sent,
+        models.Notification.sent_at,
+        models.Notification.created_at
+    )
+    if user_id is not None:
+        query = query.filter(models.Notification.user_id == user_id)
+    if booking_id is not None:
+        query = query.filter(models.Notification.booking_id == booking_id)
+    if cursor is not None:
+        query = query.filter(models.Notification.notification_id < cursor)
+    
+    rows = query.order_by(models.Notification.notification_id.desc()).limit(limit + 1).all()
+    items = [dict(row._mapping) for row in rows[:limit]]
+    next_cursor = items[-1]["notification_id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
+
+
+@router.get("/notifications/{notification_id}/content", response_class=HTMLResponse)
+def get_notification_content(notification_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    HTML de una notificación, generado a partir de su plantilla y parámetros.
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.notification_service import render_notification_content
+    
+    notification = db.query(models.Notification).filter(
+        models.Notification.notification_id == notification_id
+    ).first()
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notificación no encontrada")
+    
+    return HTMLResponse(render_notification_content(notification))
+
+
+@router.get("/notifications/retries")
+def get_notification_retries(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Estado de la cola de reintentos de emails (pendientes, vencidos y descartados).
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.notification_retry_service import get_retry_statistics
+    
+    return {"retries": get_retry_statistics(db)}
+
+
+@router.post("/notifications/retries/process")
+def process_notification_retries(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Reintenta ahora un lote de notificaciones vencidas (lo mismo que hace el task worker).
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.notification_retry_service import process_notification_retries
+    
+    return {"message": "Reintentos procesados", "statistics": process_notification_retries(db)}
+
+
+@router.post("/notifications/retries/requeue")
+def requeue_dead_notifications(notification_ids: List[int] = None, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Vuelve a poner en cola las notificaciones descartadas (todas, o las indicadas).
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.notification_retry_service import requeue_dead
+    
+    return {"requeued": requeue_dead(db, notification_ids)}
+
+
+@router.get("/maintenance/retention")
+def get_retention_statistics(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Tamaño de las tablas de notificaciones y tareas y métricas de la última retención.
+    
+    Solo administradores pueden acceder.
+    """
+    if not current_user.permissions.is_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    from ..services.retention_service import get_retention_statistics
+    
+    return {"retention": get_retention_statistics(db)}
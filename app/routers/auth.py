@@ -9,8 +9,6 @@ from .. import crud, schemas, dependencies, database, models
 from ..dependencies import ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
 from ..services.notification_service import (
     send_and_record_notification,
-    generate_welcome_email,
-    generate_password_reset_email,
 )
 from ..templates import templates
 from jose import JWTError, jwt
@@ -80,14 +78,13 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     logging.info(f"Nuevo usuario registrado: {new_user.email}")
 
     try:
-        html_content = generate_welcome_email(new_user.name)
         email_sent = send_and_record_notification(
             db=db,
             user_id=new_user.user_id,
             recipient_email=new_user.email,
             notification_type="welcome_email",
             subject="¡Bienvenido a Reserva de Pistas!",
-            html_content=html_content,
+            template_params={"user_name": new_user.name},
         )
         if not email_sent:
             logging.warning(f"No se pudo enviar el email de bienvenida a {new_user.email}")
@@ -118,8 +115,6 @@ def password_reset_request(data: schemas.PasswordResetRequest, request: Request,
 
     reset_token = create_password_reset_token(user.email)
     reset_url = f"{request.url_for('password_reset_page')}?token={quote(reset_token, safe='')}"
-    html_content = generate_password_reset_email(user.name, reset_url)
-
     try:
         send_and_record_notification(
             db=db,
@@ -127,7 +122,7 @@ def password_reset_request(data: schemas.PasswordResetRequest, request: Request,
             recipient_email=user.email,
             notification_type="password_reset",
             subject="Restablece tu contraseña",
-            html_content=html_content,
+            template_params={"user_name": user.name, "reset_link": reset_url},
         )
     except Exception as exc:
         logging.error(f"Error al enviar el email de restablecimiento a {user.email}: {exc}")
@@ -6,9 +6,7 @@ from .. import crud, schemas, models
 from ..dependencies import get_db, get_current_user
 from .. import weather_service
 from ..services.notification_service import (
-    send_and_record_notification,
-    generate_booking_confirmation_email,
-    generate_cancellation_email
+    dispatch_and_record_notification
 )
 from ..services.task_service import schedule_reminder_task, cancel_pending_task
 
@@ -63,22 +61,20 @@ def book_court(booking: schemas.BookingCreate, current_user: models.User = Depen
         end_datetime = start_datetime + timedelta(minutes=90)
         price = new_booking.get('price_amount', 0)
         
-        html_content = generate_booking_confirmation_email(
-            user_name=current_user.name,
-            court_number=new_booking['court_id'],
-            start_time=start_datetime.strftime("%d/%m/%Y %H:%M"),
-            end_time=end_datetime.strftime("%H:%M"),
-            price=price
-        )
-        
-        send_and_record_notification(
-            db=db,
+        # El envío y su registro se hacen en segundo plano (despachador de emails)
+        dispatch_and_record_notification(
             user_id=current_user.user_id,
             recipient_email=current_user.email,
             notification_type="booking_confirmation",
             subject=f"✓ Reserva Confirmada - Pista {new_booking['court_id']}",
-            html_content=html_content,
-            booking_id=new_booking['booking_id']
+            booking_id=new_booking['booking_id'],
+            template_params={
+                "user_name": current_user.name,
+                "court_number": new_booking['court_id'],
+                "start_time": start_datetime.strftime("%d/%m/%Y %H:%M"),
+                "end_time": end_datetime.strftime("%H:%M"),
+                "price": price
+            }
         )
         
         # 4. Programar recordatorio para 24h antes
@@ -91,7 +87,7 @@ def book_court(booking: schemas.BookingCreate, current_user: models.User = Depen
             start_time=start_datetime
         )
         
-        logging.info(f"Notificaciones enviadas para reserva {new_booking['booking_id']}")
+        logging.info(f"Notificaciones encoladas para reserva {new_booking['booking_id']}")
     except Exception as e:
         logging.error(f"Error al enviar notificaciones para reserva {new_booking['booking_id']}: {str(e)}")
     
@@ -107,17 +103,9 @@ def search_available_slots(date: str, db: Session = Depends(get_db)):
     3. Obtiene el precio dinámico aplicable según el horario (Schedule).
     """
     from datetime import datetime, timedelta, time as dt_time
-    from sqlalchemy import or_
-    
-    # Bloques horarios definidos en el sistema
-    start_times = [
-        "08:00", "09:30", "11:00", "12:30", "14:00", 
-        "15:30", "17:00", "18:30", "20:00", "21:30"
-    ]
     
     # Parseo de la fecha objetivo
     target_date = datetime.strptime(date, "%Y-%m-%d").date()
-    day_of_week = target_date.weekday()  # 0=Lunes, 6=Domingo
     
     # Rango del día para filtros
     start_of_day = datetime.combine(target_date, dt_time.min)
@@ -138,28 +126,18 @@ def search_available_slots(date: str, db: Session = Depends(get_db)):
     # Creamos un set de claves "pista_hora" para una búsqueda rápida en memoria
     booked_keys = {f"{b.court_id}_{b.start_time.strftime('%H:%M')}" for b in existing_bookings}
     
-    # Obtenemos los horarios para el día de la semana
-    schedules = db.query(models.Schedule).filter(models.Schedule.day_of_week == day_of_week).all()
-    
-    # Mapa de demanda por hora
-    time_demand_map = {s.start_time.strftime('%H:%M'): s.demand_id for s in schedules}
+    # Bloques del día con su demanda (cuadrante y festivos cacheados en memoria).
+    # En festivo se aplican los niveles del domingo o los del festivo, y su horario reducido.
+    from ..services.holiday_service import get_day_slots
+    time_demand_map = dict(get_day_slots(db, target_date))
     
-    # Optimizacion: Obtenemos los precios vigentes para esa fecha una sola vez
-    # Buscamos los precios que cubren el rango del día solicitado
-    prices_query = db.query(models.Price).filter(
-        models.Price.start_date <= end_of_day,
-        or_(models.Price.end_date == None, models.Price.end_date > start_of_day)
-    ).order_by(models.Price.start_date.desc()).all()
-    
-    # Creamos un mapa de demand_id -> price_amount (el más reciente/vigente)
-    demand_price_map = {}
-    for p in prices_query:
-        if p.demand_id not in demand_price_map:
-            demand_price_map[p.demand_id] = p.amount
+    # Líneas temporales de precios en memoria: el precio de cada franja es una búsqueda binaria
+    from ..services.pricing_service import get_price_timelines
+    timelines = get_price_timelines(db)
     
     # Generamos la matriz de disponibilidad (Pistas x Horarios)
     for court in courts:
-        for t_str in start_times:
+        for t_str in time_demand_map:
             key = f"{court.court_id}_{t_str}"
             is_taken = key in booked_keys
             
@@ -173,7 +151,8 @@ def search_available_slots(date: str, db: Session = Depends(get_db)):
             
             # Recuperamos el ID de demanda para este bloque
             demand_id = time_demand_map.get(t_str)
-            price_amount = demand_price_map.get(demand_id) if demand_id else None
+            price = timelines[demand_id].lookup(start_dt) if demand_id in timelines else None
+            price_amount = price[1] if price else None
             
             available_slots.append(schemas.SlotBase(
                 court_id=court.court_id,
@@ -187,6 +166,27 @@ def search_available_slots(date: str, db: Session = Depends(get_db)):
     
     return available_slots
 
+@router.post("/quote", response_model=schemas.QuoteResponse)
+def quote_slots(data: schemas.QuoteRequest, db: Session = Depends(get_db)):
+    """
+    Presupuesta varias franjas (fecha, hora) de una vez.
+    Devuelve el importe y el price_id que se registraría al reservar cada una,
+    sin consultas por franja: cuadrante cacheado y una línea temporal de precios por demanda.
+    """
+    from ..services import pricing_service
+
+    if len(data.slots) > pricing_service.MAX_QUOTE_SLOTS:
+        raise HTTPException(status_code=400, detail=f"Máximo {pricing_service.MAX_QUOTE_SLOTS} franjas por petición")
+
+    try:
+        items = pricing_service.quote_slots(db, [(s.date, s.time_slot) for s in data.slots])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    total = sum(item["amount"] for item in items if item["amount"] is not None)
+    logging.info(f"Presupuesto de {len(items)} franjas: total {total:.2f}")
+    return {"items": items, "total": round(total, 2)}
+
 @router.post("/cancel/{booking_id}")
 def cancel_booking(booking_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """
@@ -213,27 +213,24 @@ def cancel_booking(booking_id: int, current_user: models.User = Depends(get_curr
     
     # 3. Enviar notificación de cancelación
     try:
-        html_content = generate_cancellation_email(
-            user_name=current_user.name,
-            court_number=court_number,
-            start_time=start_time.strftime("%d/%m/%Y %H:%M"),
-            refund_amount=price_amount
-        )
-        
-        send_and_record_notification(
-            db=db,
+        dispatch_and_record_notification(
             user_id=current_user.user_id,
             recipient_email=current_user.email,
             notification_type="cancellation",
             subject=f"✗ Reserva Cancelada - Pista {court_number}",
-            html_content=html_content,
-            booking_id=booking_id
+            booking_id=booking_id,
+            template_params={
+                "user_name": current_user.name,
+                "court_number": court_number,
+                "start_time": start_time.strftime("%d/%m/%Y %H:%M"),
+                "refund_amount": price_amount
+            }
         )
         
         # 4. Cancelar el recordatorio programado
         cancel_pending_task(db, booking_id)
         
-        logging.info(f"Notificación de cancelación enviada para reserva {booking_id}")
+        logging.info(f"Notificación de cancelación encolada para reserva {booking_id}")
     except Exception as e:
         logging.error(f"Error al enviar notificación de cancelación para reserva {booking_id}: {str(e)}")
     
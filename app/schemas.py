@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-from datetime import datetime, time
+from datetime import date, datetime, time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -102,6 +102,29 @@ class BookingResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class QuoteSlot(BaseModel):
+    """Franja a presupuestar."""
+    date: str       # Formato "YYYY-MM-DD"
+    time_slot: str  # Formato "HH:MM" (hora de inicio)
+
+class QuoteRequest(BaseModel):
+    """Lista de franjas a presupuestar de una vez (ej. reservas recurrentes o carrito)."""
+    slots: List[QuoteSlot]
+
+class QuoteItem(BaseModel):
+    """Precio resuelto para una franja."""
+    date: str
+    time_slot: str
+    start_time: datetime
+    demand_id: Optional[int] = None
+    price_id: Optional[int] = None   # Precio que quedaría registrado al reservar
+    amount: Optional[float] = None   # None si la franja no existe o no tiene precio
+
+class QuoteResponse(BaseModel):
+    """Presupuesto de varias franjas con su total."""
+    items: List[QuoteItem]
+    total: float
+
 # --- Esquemas de Precios ---
 
 class PriceUpdate(BaseModel):
@@ -110,6 +133,57 @@ class PriceUpdate(BaseModel):
     amount: float
     start_date: datetime # Fecha de inicio del nuevo precio
 
+class PriceVersionUpdate(BaseModel):
+    """Cambios sobre una versión de precio programada (los campos omitidos no cambian)."""
+    amount: Optional[float] = None
+    start_date: Optional[datetime] = None
+
+# --- Esquemas del Cuadrante Horario ---
+
+class ScheduleMatrixUpdate(BaseModel):
+    """Cuadrante completo: 7 filas (Lunes..Domingo) de 10 bloques con su demand_id."""
+    matrix: List[List[int]]
+
+class ScheduleChange(BaseModel):
+    """Cambio de un bloque concreto del cuadrante."""
+    day_of_week: int  # 0=Lunes, 6=Domingo
+    start_time: time  # Hora de inicio del bloque (ej. 08:00)
+    demand_id: int
+
+class SchedulePatch(BaseModel):
+    """Lista de cambios a aplicar sobre el cuadrante actual."""
+    changes: List[ScheduleChange]
+
+class DemandTierSettings(BaseModel):
+    """Umbrales y límites de la asignación automática de niveles de demanda."""
+    lookback_days: int = 90
+    high_threshold: float = 0.75
+    low_threshold: float = 0.35
+    min_capacity: int = 40
+    max_step: int = 1
+    locked: List[List] = []     # Bloques que nunca se cambian: [[día, "HH:MM"], ...]
+    auto_apply: bool = False
+
+class DemandTierApply(BaseModel):
+    """Confirmación de una propuesta: versión del cuadrante y huella de la propuesta revisada."""
+    schedule_version: str
+    proposal_hash: str
+
+# --- Esquemas de Festivos ---
+
+class HolidayItem(BaseModel):
+    """Festivo con su nivel de demanda y horario opcionales."""
+    date: date
+    description: Optional[str] = None
+    demand_id: Optional[int] = None     # Nulo: niveles de demanda del domingo
+    open_time: Optional[time] = None    # Nulo: desde el primer bloque
+    close_time: Optional[time] = None   # Nulo: hasta el último bloque
+
+class HolidayImport(BaseModel):
+    """Importación en bloque de festivos (ej. el calendario de un año)."""
+    holidays: List[HolidayItem]
+    replace_year: Optional[int] = None  # Si se indica, elimina los festivos de ese año que no vengan en la lista
+
 class UserPasswordReset(BaseModel):
     """Esquema para el reseteo de contraseña por un administrador."""
     user_id: int
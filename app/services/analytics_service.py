@@ -0,0 +1,469 @@
+"""
+Motor de analítica en proceso sobre una instantánea columnar de las reservas.
+
+En lugar de lanzar muchas consultas GROUP BY contra la base de datos principal,
+se mantiene una copia de las reservas en arrays de NumPy (una columna por campo)
+y los análisis pesados se calculan de forma vectorizada:
+- Heatmap día de la semana × franja horaria × pista
+- Distribución de antelación (tiempo entre creación e inicio de la reserva)
+- Retención por cohortes mensuales de usuarios
+
+La instantánea vive en un proceso worker dedicado (ProcessPoolExecutor) para no
+bloquear el servidor web, y se refresca de forma incremental con dos marcas de
+agua: booking_id para las reservas nuevas y cancelled_at para las cancelaciones,
+de modo que solo se leen las reservas nuevas y los identificadores de las
+canceladas desde el último refresco.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import models, database
+
+logger = logging.getLogger(__name__)
+
+# Franjas horarias del sistema, en minutos desde medianoche (08:00, 09:30, ... 21:30)
+SLOT_MINUTES = np.array([8 * 60 + 90 * i for i in range(10)], dtype=np.int64)
+SLOT_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in SLOT_MINUTES.tolist()]
+WEEKDAY_LABELS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+# Límites (en horas) de los tramos del histograma de antelación
+LEAD_TIME_BINS_HOURS = [0, 1, 3, 6, 12, 24, 48, 72, 168, 336]
+
+# Segundos mínimos entre dos refrescos de la instantánea
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv("ANALYTICS_SNAPSHOT_REFRESH_SECONDS", 30))
+# Tiempo máximo de espera de un análisis (segundos)
+ANALYTICS_TIMEOUT_SECONDS = int(os.getenv("ANALYTICS_TIMEOUT_SECONDS", 60))
+# Filas leídas por lote al refrescar
+SNAPSHOT_FETCH_SIZE = 10000
+# Solape al releer cancelaciones: cubre transacciones que hacen commit después de
+# otras con un cancelled_at posterior y el desfase de reloj entre procesos
+SNAPSHOT_CANCEL_OVERLAP = timedelta(minutes=5)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_epoch(value: Optional[datetime]) -> int:
+    """Convierte un datetime naive (UTC) a segundos desde 1970."""
+    if value is None:
+        return 0
+    return int((value - _EPOCH).total_seconds())
+
+
+class BookingSnapshot:
+    """
+    Copia columnar de la tabla de reservas.
+
+    Columnas (mismo índice = misma reserva, ordenadas por booking_id):
+        booking_id, court_id, start_epoch, created_epoch, amount, user_id, cancelled
+    """
+
+    def __init__(self):
+        self.booking_id = np.empty(0, dtype=np.int64)
+        self.court_id = np.empty(0, dtype=np.int16)
+        self.start_epoch = np.empty(0, dtype=np.int64)
+        self.created_epoch = np.empty(0, dtype=np.int64)
+        self.amount = np.empty(0, dtype=np.float32)
+        self.user_id = np.empty(0, dtype=np.int32)
+        self.cancelled = np.empty(0, dtype=bool)
+        self.watermark = 0  # Mayor booking_id incluido en la instantánea
+        self.cancel_watermark = None  # Cancelaciones anteriores a este instante ya aplicadas
+        self.refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.booking_id)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Refresca la instantánea de forma incremental.
+
+        1. Añade las reservas con booking_id > marca de agua.
+        2. Marca como canceladas las reservas ya cargadas cuyo cancelled_at sea
+           posterior al último refresco (menos SNAPSHOT_CANCEL_OVERLAP). Volver a
+           marcar una reserva es inocuo: en la aplicación una cancelación nunca se revierte.
+
+        Returns:
+            int: Número de reservas nuevas añadidas
+        """
+        previous_watermark = self.watermark
+        previous_cancel_watermark = self.cancel_watermark
+        # Antes de leer: lo que se cancele durante el refresco entra en el siguiente
+        refresh_started = datetime.utcnow()
+
+        query = db.query(
+            models.Booking.booking_id,
+            models.Booking.court_id,
+            models.Booking.start_time,
+            models.Booking.created_at,
+            models.Price.amount,
+            models.Booking.user_id,
+            models.Booking.is_cancelled
+        ).outerjoin(
+            models.Price, models.Booking.price_id == models.Price.price_id
+        ).filter(
+            models.Booking.booking_id > previous_watermark
+        ).order_by(models.Booking.booking_id).yield_per(SNAPSHOT_FETCH_SIZE)
+
+        chunks = []
+        batch = []
+        for row in query:
+            batch.append(row)
+            if len(batch) >= SNAPSHOT_FETCH_SIZE:
+                chunks.append(self._to_columns(batch))
+                batch = []
+        if batch:
+            chunks.append(self._to_columns(batch))
+
+        added = sum(len(chunk[0]) for chunk in chunks)
+        if chunks:
+            columns = [np.concatenate([getattr(self, name)] + [chunk[i] for chunk in chunks])
+                       for i, name in enumerate(self._column_names())]
+            for name, values in zip(self._column_names(), columns):
+                setattr(self, name, values)
+            self.watermark = int(self.booking_id[-1])
+
+        # Sincronizar cancelaciones de reservas ya cargadas (solo se leen identificadores)
+        if previous_watermark > 0 and previous_cancel_watermark is not None:
+            cancelled_ids = np.fromiter(
+                (row[0] for row in db.query(models.Booking.booking_id).filter(
+                    models.Booking.cancelled_at >= previous_cancel_watermark - SNAPSHOT_CANCEL_OVERLAP,
+                    models.Booking.booking_id <= previous_watermark
+                )),
+                dtype=np.int64
+            )
+            if len(cancelled_ids):
+                # booking_id está ordenado: searchsorted localiza las posiciones sin recorrer
+                positions = np.minimum(np.searchsorted(self.booking_id, cancelled_ids), len(self) - 1)
+                found = self.booking_id[positions] == cancelled_ids
+                self.cancelled[positions[found]] = True
+
+        self.cancel_watermark = refresh_started
+        self.refreshed_at = time.time()
+        logger.info(f"Instantánea de reservas refrescada: +{added} reservas, total={len(self)}, watermark={self.watermark}")
+        return added
+
+    @staticmethod
+    def _column_names():
+        return ["booking_id", "court_id", "start_epoch", "created_epoch", "amount", "user_id", "cancelled"]
+
+    @staticmethod
+    def _to_columns(rows: list) -> list:
+        """Convierte un lote de filas en arrays tipados (uno por columna)."""
+        return [
+            np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r[1] or 0 for r in rows), dtype=np.int16, count=len(rows)),
+            np.fromiter((_to_epoch(r[2]) for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((_to_epoch(r[3] or r[2]) for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r[4] or 0.0 for r in rows), dtype=np.float32, count=len(rows)),
+            np.fromiter((r[5] or 0 for r in rows), dtype=np.int32, count=len(rows)),
+            np.fromiter((bool(r[6]) for r in rows), dtype=bool, count=len(rows)),
+        ]
+
+    def active_mask(self, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> np.ndarray:
+        """Máscara de reservas no canceladas cuyo inicio cae en [date_from, date_to)."""
+        mask = ~self.cancelled
+        if date_from is not None:
+            mask &= self.start_epoch >= _to_epoch(date_from)
+        if date_to is not None:
+            mask &= self.start_epoch < _to_epoch(date_to)
+        return mask
+
+
+# ============================================================
+# ANÁLISIS VECTORIZADOS
+# ============================================================
+
+def compute_capacity_matrix(capacity_rows: list, slot_grid: np.ndarray, n_courts: int,
+                            day_grids: Optional[dict] = None) -> np.ndarray:
+    """
+    Franjas reservables por día de la semana × franja horaria × pista, a partir del calendario
+    de capacidad: cada día abierto de una pista aporta una unidad a las franjas de su cuadrante,
+    o a las de su propio horario si es un festivo (día en day_grids).
+
+    Args:
+        capacity_rows: Tuplas (cap_date, court_id, slots) del calendario
+        slot_grid: Matriz booleana [7][n_franjas] con las franjas que existen cada día de la semana
+        n_courts: Número de pistas
+        day_grids: {fecha: array booleano [n_franjas]} con las franjas de los días que no
+            siguen el cuadrante (festivos)
+
+    Returns:
+        np.ndarray: Matriz [7][n_franjas][n_pistas]
+    """
+    if not capacity_rows or n_courts == 0:
+        return np.zeros((7, len(SLOT_MINUTES), n_courts), dtype=np.int64)
+
+    days = np.array([r[0] for r in capacity_rows], dtype="datetime64[D]").astype(np.int64)
+    courts = np.fromiter((r[1] for r in capacity_rows), dtype=np.int64, count=len(capacity_rows))
+    open_day = np.fromiter((r[2] > 0 for r in capacity_rows), dtype=bool, count=len(capacity_rows))
+
+    weekday = (days + 3) % 7
+    valid = open_day & (courts >= 1) & (courts <= n_courts)
+
+    day_grids = day_grids or {}
+    special_days = np.array(list(day_grids), dtype="datetime64[D]").astype(np.int64)
+    special = valid & np.isin(days, special_days)
+    regular = valid & ~special
+
+    open_days = np.bincount(weekday[regular] * n_courts + (courts[regular] - 1), minlength=7 * n_courts).reshape(7, n_courts)
+    capacity = slot_grid[:, :, None].astype(np.int64) * open_days[:, None, :]
+
+    if special.any():
+        # Cada festivo abierto suma las franjas de su propio horario a su pista
+        grids = np.array(list(day_grids.values()), dtype=np.int64)
+        position = {day: i for i, day in enumerate(special_days.tolist())}
+        grid_index = np.fromiter((position[day] for day in days[special].tolist()), dtype=np.int64)
+        np.add.at(capacity.transpose(0, 2, 1), (weekday[special], courts[special] - 1), grids[grid_index])
+    return capacity
+
+
+def compute_heatmap(snapshot: BookingSnapshot, date_from: Optional[datetime], date_to: Optional[datetime],
+                    capacity: Optional[np.ndarray] = None) -> dict:
+    """
+    Cuenta reservas activas por día de la semana × franja horaria × pista y, si se indica
+    la matriz de capacidad, el porcentaje de ocupación de cada celda.
+
+    Returns:
+        dict: {"weekdays", "slots", "courts", "counts": [7][10][n_pistas], "occupancy": [7][10][n_pistas]}
+    """
+    mask = snapshot.active_mask(date_from, date_to)
+    start = snapshot.start_epoch[mask]
+    courts = snapshot.court_id[mask].astype(np.int64)
+
+    n_courts = int(snapshot.court_id.max()) if len(snapshot) else 0
+    n_slots = len(SLOT_MINUTES)
+
+    days = start // 86400
+    weekday = (days + 3) % 7  # 1970-01-01 fue jueves -> lunes = 0
+    minutes = (start % 86400) // 60
+    slot = np.searchsorted(SLOT_MINUTES, minutes, side="right") - 1
+
+    valid = (slot >= 0) & (courts >= 1)
+    flat = (weekday[valid] * n_slots + slot[valid]) * n_courts + (courts[valid] - 1)
+    counts = np.bincount(flat, minlength=7 * n_slots * n_courts).reshape(7, n_slots, n_courts) \
+        if n_courts else np.zeros((7, n_slots, 0), dtype=np.int64)
+
+    result = {
+        "weekdays": WEEKDAY_LABELS,
+        "slots": SLOT_LABELS,
+        "courts": list(range(1, n_courts + 1)),
+        "counts": counts.tolist(),
+        "total": int(valid.sum())
+    }
+
+    if capacity is not None and capacity.shape == counts.shape:
+        occupancy = np.where(capacity > 0, counts / np.maximum(capacity, 1) * 100, 0.0)
+        result["occupancy"] = np.round(occupancy, 1).tolist()
+        result["capacity"] = capacity.tolist()
+
+    return result
+
+
+def compute_lead_time(snapshot: BookingSnapshot, date_from: Optional[datetime], date_to: Optional[datetime]) -> dict:
+    """
+    Distribución de la antelación con la que se hacen las reservas (horas entre creación e inicio).
+
+    Returns:
+        dict: Histograma por tramos y percentiles principales
+    """
+    mask = snapshot.active_mask(date_from, date_to)
+    lead_hours = (snapshot.start_epoch[mask] - snapshot.created_epoch[mask]) / 3600.0
+    lead_hours = np.clip(lead_hours, 0, None)
+
+    edges = np.array(LEAD_TIME_BINS_HOURS + [np.inf], dtype=np.float64)
+    histogram, _ = np.histogram(lead_hours, bins=edges)
+    labels = [f"{lo}-{hi}h" for lo, hi in zip(LEAD_TIME_BINS_HOURS[:-1], LEAD_TIME_BINS_HOURS[1:])]
+    labels.append(f">{LEAD_TIME_BINS_HOURS[-1]}h")
+
+    if len(lead_hours):
+        p50, p90, p99 = np.percentile(lead_hours, [50, 90, 99]).tolist()
+        mean = float(lead_hours.mean())
+    else:
+        p50 = p90 = p99 = mean = 0.0
+
+    return {
+        "bins": labels,
+        "counts": histogram.tolist(),
+        "total": int(len(lead_hours)),
+        "mean_hours": round(mean, 2),
+        "p50_hours": round(p50, 2),
+        "p90_hours": round(p90, 2),
+        "p99_hours": round(p99, 2)
+    }
+
+
+def compute_cohorts(snapshot: BookingSnapshot, max_months: int = 12) -> dict:
+    """
+    Retención por cohortes: los usuarios se agrupan por el mes de su primera reserva
+    y se mide qué porcentaje vuelve a reservar en cada uno de los meses siguientes.
+
+    Returns:
+        dict: {"cohorts": [...], "sizes": [...], "retention": [[% mes 0, % mes 1, ...], ...]}
+    """
+    mask = ~snapshot.cancelled
+    users = snapshot.user_id[mask].astype(np.int64)
+    if len(users) == 0:
+        return {"cohorts": [], "sizes": [], "retention": []}
+
+    # Meses desde 1970 de cada reserva
+    months = snapshot.start_epoch[mask].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+    first_month = np.full(int(users.max()) + 1, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_month, users, months)
+    cohort = first_month[users]
+    offset = months - cohort
+
+    keep = offset < max_months
+    # Pares únicos (usuario, mes relativo): un usuario cuenta una vez por mes
+    pairs = np.unique(users[keep] * max_months + offset[keep])
+    pair_users = pairs // max_months
+    pair_offsets = pairs % max_months
+    pair_cohorts = first_month[pair_users]
+
+    cohort_values = np.unique(pair_cohorts)
+    cohort_index = np.searchsorted(cohort_values, pair_cohorts)
+    matrix = np.zeros((len(cohort_values), max_months), dtype=np.int64)
+    np.add.at(matrix, (cohort_index, pair_offsets), 1)
+
+    sizes = matrix[:, 0]
+    retention = np.round(matrix / np.maximum(sizes, 1)[:, None] * 100, 1)
+
+    labels = [str(np.datetime64(int(m), "M")) for m in cohort_values]
+    return {
+        "cohorts": labels,
+        "sizes": sizes.tolist(),
+        "retention": retention.tolist()
+    }
+
+
+# ============================================================
+# PROCESO WORKER
+# ============================================================
+
+# Instantánea propia del proceso worker (cada proceso mantiene la suya)
+_snapshot: Optional[BookingSnapshot] = None
+
+def _heatmap_with_capacity(snapshot: BookingSnapshot, params: dict, db: Session) -> dict:
+    """Heatmap con ocupación exacta según el calendario de capacidad del rango analizado."""
+    from . import capacity_service, holiday_service
+
+    n_courts = int(snapshot.court_id.max()) if len(snapshot) else 0
+    mask = snapshot.active_mask(params.get("date_from"), params.get("date_to"))
+    if not mask.any():
+        return compute_heatmap(snapshot, params.get("date_from"), params.get("date_to"))
+
+    # Rango de días: el solicitado o, si no se indicó, el de las reservas analizadas
+    first_day = params["date_from"].date() if params.get("date_from") else \
+        datetime.utcfromtimestamp(int(snapshot.start_epoch[mask].min())).date()
+    last_day = (params["date_to"] - timedelta(days=1)).date() if params.get("date_to") else \
+        datetime.utcfromtimestamp(int(snapshot.start_epoch[mask].max())).date()
+
+    # Franjas que existen en el cuadrante de cada día de la semana
+    slot_grid = np.zeros((7, len(SLOT_MINUTES)), dtype=bool)
+    for day_of_week, start_time in db.query(models.Schedule.day_of_week, models.Schedule.start_time).all():
+        slot = int(np.searchsorted(SLOT_MINUTES, start_time.hour * 60 + start_time.minute))
+        if slot < len(SLOT_MINUTES) and SLOT_MINUTES[slot] == start_time.hour * 60 + start_time.minute:
+            slot_grid[day_of_week, slot] = True
+
+    # Los festivos tienen su propio horario (completo o reducido)
+    slot_index = {label: index for index, label in enumerate(SLOT_LABELS)}
+    day_grids = {}
+    for day in holiday_service.get_holiday_map(db):
+        if first_day <= day <= last_day:
+            grid = np.zeros(len(SLOT_MINUTES), dtype=bool)
+            grid[[slot_index[label] for label, _ in holiday_service.get_day_slots(db, day) if label in slot_index]] = True
+            day_grids[day] = grid
+
+    capacity = compute_capacity_matrix(
+        capacity_service.get_capacity_rows(db, first_day, last_day), slot_grid, n_courts, day_grids
+    )
+    return compute_heatmap(snapshot, params.get("date_from"), params.get("date_to"), capacity)
+
+
+_ANALYSES = {
+    "heatmap": _heatmap_with_capacity,
+    "lead_time": lambda snap, params, db: compute_lead_time(snap, params.get("date_from"), params.get("date_to")),
+    "cohorts": lambda snap, params, db: compute_cohorts(snap, params.get("max_months", 12)),
+}
+
+
+def _init_worker():
+    """Inicializador del proceso worker: crea la instantánea vacía."""
+    global _snapshot
+    _snapshot = BookingSnapshot()
+
+
+def _run_analysis(name: str, params: dict) -> dict:
+    """
+    Punto de entrada en el proceso worker: refresca la instantánea si procede y ejecuta el análisis.
+    """
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = BookingSnapshot()
+
+    db = database.session_local()
+    try:
+        if time.time() - _snapshot.refreshed_at >= SNAPSHOT_REFRESH_SECONDS:
+            _snapshot.refresh(db)
+        result = _ANALYSES[name](_snapshot, params, db)
+    finally:
+        db.close()
+
+    result["snapshot_rows"] = len(_snapshot)
+    result["snapshot_watermark"] = _snapshot.watermark
+    return result
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Crea (una sola vez) el pool de un proceso que aloja la instantánea."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 'spawn' evita heredar conexiones de BD e hilos del proceso web
+            _executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            logger.info("Proceso worker de analítica iniciado")
+        return _executor
+
+
+def run_analysis(name: str, **params) -> dict:
+    """
+    Ejecuta un análisis en el proceso worker y espera su resultado.
+
+    Args:
+        name: "heatmap", "lead_time" o "cohorts"
+        **params: Parámetros del análisis (date_from, date_to, max_months)
+
+    Returns:
+        dict: Resultado del análisis (serializable a JSON)
+    """
+    if name not in _ANALYSES:
+        raise ValueError(f"Análisis desconocido: {name}")
+    future = _get_executor().submit(_run_analysis, name, params)
+    return future.result(timeout=ANALYTICS_TIMEOUT_SECONDS)
+
+
+def shutdown_analytics():
+    """Detiene el proceso worker de analítica. Se llama al shutdown de la aplicación."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+            logger.info("Proceso worker de analítica detenido")
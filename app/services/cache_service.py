@@ -0,0 +1,198 @@
+"""
+Caché en memoria con semántica stale-while-revalidate.
+
+Pensada para respuestas caras de calcular (estadísticas del panel de administración):
+- Mientras una entrada es "fresca" (edad < ttl) se devuelve directamente.
+- Si está "caducada" pero dentro de la ventana de tolerancia (edad < max_stale),
+  se devuelve el valor antiguo y se lanza un recálculo en segundo plano.
+- Si no existe (o es demasiado antigua) se calcula de forma síncrona.
+
+En todos los casos se aplica single-flight: si varias peticiones piden la misma
+clave a la vez, solo una ejecuta el cálculo y el resto espera su resultado.
+
+Con `max_entries` la caché queda acotada: al superarlo se descartan las entradas
+usadas hace más tiempo (LRU), de modo que claves elegidas por el cliente (ej. rangos
+de fechas) no la hacen crecer sin límite.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pool compartido para los recálculos en segundo plano de todas las cachés
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="swr-refresh")
+
+
+class StaleWhileRevalidateCache:
+    """
+    Caché por clave con TTL, refresco en segundo plano y single-flight.
+
+    Cada entrada guarda el valor calculado y el instante (UTC) en que se calculó,
+    de modo que el llamante pueda exponer un "computed_at" al cliente.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_stale_seconds: float,
+                 max_entries: Optional[int] = None):
+        """
+        Args:
+            name: Nombre de la caché (solo para logs)
+            ttl_seconds: Segundos durante los que una entrada se considera fresca
+            max_stale_seconds: Edad máxima a la que aún se sirve un valor caducado
+                mientras se recalcula en segundo plano
+            max_entries: Entradas máximas (None = sin límite); se descartan las menos usadas
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max(max_stale_seconds, ttl_seconds)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, datetime]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any], force_refresh: bool = False) -> Tuple[Any, datetime]:
+        """
+        Devuelve el valor asociado a la clave, calculándolo con `loader` si hace falta.
+
+        Args:
+            key: Clave de la entrada (ej. ("stats", 30))
+            loader: Función sin argumentos que calcula el valor
+            force_refresh: Ignora la entrada existente y recalcula de forma síncrona
+
+        Returns:
+            Tuple[Any, datetime]: (valor, instante UTC en que se calculó)
+        """
+        now = datetime.utcnow()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+            if entry and not force_refresh:
+                value, computed_at = entry
+                age = (now - computed_at).total_seconds()
+
+                if age < self.ttl_seconds:
+                    return value, computed_at
+
+                if age < self.max_stale_seconds:
+                    # Servimos el valor antiguo y refrescamos en segundo plano (una sola vez)
+                    if key not in self._in_flight:
+                        future = Future()
+                        self._in_flight[key] = future
+                        _refresh_executor.submit(self._run_loader, key, loader, future)
+                        logger.debug(f"[{self.name}] Refresco en segundo plano lanzado para {key}")
+                    return value, computed_at
+
+            # Sin valor utilizable: o nos unimos al cálculo en curso o lo lanzamos nosotros
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if owner:
+            self._run_loader(key, loader, future)
+        else:
+            logger.debug(f"[{self.name}] Esperando cálculo en curso para {key}")
+
+        return future.result()
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        Elimina una entrada concreta o, si no se indica clave, toda la caché.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        logger.info(f"[{self.name}] Caché invalidada ({'completa' if key is None else key})")
+
+    def _run_loader(self, key: Hashable, loader: Callable[[], Any], future: Future) -> None:
+        """
+        Ejecuta el cálculo, guarda el resultado y despierta a quienes esperaban.
+        Si falla, el error se propaga a los que esperan y la entrada antigua se conserva.
+        """
+        try:
+            value = loader()
+            computed_at = datetime.utcnow()
+            with self._lock:
+                self._entries[key] = (value, computed_at)
+                self._entries.move_to_end(key)
+                while self.max_entries is not None and len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            future.set_result((value, computed_at))
+            logger.info(f"[{self.name}] Entrada {key} recalculada")
+        except Exception as e:
+            logger.error(f"[{self.name}] Error recalculando {key}: {str(e)}", exc_info=True)
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+
+class VersionedCache:
+    """
+    Caché de un único valor ligado a un número de versión guardado en base de datos.
+
+    El valor se reutiliza mientras la versión no cambie. Para no consultar la versión
+    en cada petición, solo se comprueba cada `check_interval_seconds`; así, un cambio
+    hecho desde otro proceso se detecta como mucho con ese retraso, y uno hecho desde
+    este proceso se aplica al momento llamando a `invalidate()`.
+    """
+
+    def __init__(self, name: str, check_interval_seconds: float):
+        """
+        Args:
+            name: Nombre de la caché (solo para logs)
+            check_interval_seconds: Segundos mínimos entre comprobaciones de la versión
+        """
+        self.name = name
+        self.check_interval_seconds = check_interval_seconds
+        self._value: Any = None
+        self._version: Optional[str] = None
+        self._checked_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def get(self, version_loader: Callable[[], Optional[str]], loader: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor cacheado, recargándolo si la versión en base de datos ha cambiado.
+
+        Args:
+            version_loader: Función que devuelve la versión actual
+            loader: Función que calcula el valor completo
+
+        Returns:
+            Any: El valor vigente
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            if self._checked_at and (now - self._checked_at).total_seconds() < self.check_interval_seconds:
+                return self._value
+
+            version = version_loader()
+            if self._checked_at is None or version != self._version:
+                # La carga se hace bajo el lock: las peticiones concurrentes esperan a un único cálculo
+                self._value = loader()
+                self._version = version
+                logger.info(f"[{self.name}] Valor recargado (versión {version})")
+
+            self._checked_at = now
+            return self._value
+
+    @property
+    def version(self) -> Optional[str]:
+        """Versión del valor actualmente cacheado."""
+        return self._version
+
+    def invalidate(self) -> None:
+        """Fuerza la comprobación de la versión (y recarga) en el próximo acceso."""
+        with self._lock:
+            self._checked_at = None
+        logger.info(f"[{self.name}] Caché invalidada")
@@ -0,0 +1,200 @@
+"""
+Servicio del calendario de capacidad de las pistas.
+
+Precalcula, para cada día y pista, cuántas franjas se pueden reservar realmente:
+- Franjas definidas en el cuadrante semanal (Schedule) para ese día de la semana.
+- En festivos, las franjas de su horario (completo o reducido, ver holiday_service).
+- 0 franjas en días futuros para pistas en mantenimiento (Court.is_maintenance).
+
+El calendario se guarda en la tabla court_capacity y se extiende cada día (job del
+scheduler), de modo que los porcentajes de ocupación se obtienen con un SUM sobre
+unas pocas filas en lugar de estimaciones fijas.
+
+Varios procesos pueden extender o regenerar el calendario a la vez (arranque de cada
+worker web, job nocturno): en PostgreSQL se serializan con un advisory lock y, en
+cualquier base, las filas se escriben con INSERT ... ON CONFLICT, así que nunca chocan
+con la clave primaria.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+import logging
+import os
+from .. import models
+from .holiday_service import get_day_slots
+
+logger = logging.getLogger(__name__)
+
+# Días hacia delante que se mantienen precalculados
+CAPACITY_HORIZON_DAYS = int(os.getenv("CAPACITY_HORIZON_DAYS", 120))
+
+# Clave del advisory lock de PostgreSQL que serializa las escrituras en court_capacity
+CAPACITY_LOCK_ID = 72012
+
+
+def _lock_capacity(db: Session) -> None:
+    """
+    Serializa las escrituras en court_capacity entre procesos (advisory lock de
+    PostgreSQL hasta el final de la transacción). En otras bases no hace nada.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": CAPACITY_LOCK_ID})
+
+
+# Filas por sentencia INSERT (limita los parámetros en la primera carga del histórico)
+CAPACITY_INSERT_CHUNK = 1000
+
+
+def _write_rows(db: Session, rows: list, overwrite: bool) -> None:
+    """Escribe las filas en bloques de CAPACITY_INSERT_CHUNK con INSERT ... ON CONFLICT."""
+    for index in range(0, len(rows), CAPACITY_INSERT_CHUNK):
+        db.execute(_upsert_statement(db, rows[index:index + CAPACITY_INSERT_CHUNK], overwrite))
+
+
+def _upsert_statement(db: Session, rows: list, overwrite: bool):
+    """INSERT ... ON CONFLICT (cap_date, court_id) según el dialecto: DO UPDATE o DO NOTHING."""
+    if db.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+
+    stmt = insert(models.CourtCapacity).values(rows)
+    if overwrite:
+        return stmt.on_conflict_do_update(
+            index_elements=["cap_date", "court_id"], set_={"slots": stmt.excluded.slots}
+        )
+    return stmt.on_conflict_do_nothing(index_elements=["cap_date", "court_id"])
+
+
+def build_capacity_rows(db: Session, date_from: date, date_to: date, court_ids: Optional[list] = None) -> list:
+    """
+    Genera las filas del calendario (sin guardarlas) para un rango de días.
+
+    Args:
+        db: Sesión de base de datos
+        date_from: Primer día (incluido)
+        date_to: Último día (incluido)
+        court_ids: Limitar a estas pistas (por defecto todas)
+
+    Returns:
+        list: Lista de dicts {cap_date, court_id, slots}
+    """
+    courts = db.query(models.Court).all()
+    if court_ids is not None:
+        courts = [c for c in courts if c.court_id in court_ids]
+
+    today = datetime.utcnow().date()
+
+    rows = []
+    day = date_from
+    while day <= date_to:
+        day_slots = len(get_day_slots(db, day))
+        for court in courts:
+            # El mantenimiento solo se conoce "ahora": se aplica a hoy y a los días futuros
+            in_maintenance = court.is_maintenance and day >= today
+            rows.append({
+                "cap_date": day,
+                "court_id": court.court_id,
+                "slots": 0 if in_maintenance else day_slots
+            })
+        day += timedelta(days=1)
+    return rows
+
+
+def extend_capacity_calendar(db: Session) -> int:
+    """
+    Extiende el calendario hasta hoy + CAPACITY_HORIZON_DAYS.
+
+    En la primera ejecución cubre también el histórico (desde la reserva más antigua).
+
+    Returns:
+        int: Número de filas insertadas
+    """
+    target = datetime.utcnow().date() + timedelta(days=CAPACITY_HORIZON_DAYS)
+    _lock_capacity(db)
+    last_day = db.query(func.max(models.CourtCapacity.cap_date)).scalar()
+
+    if last_day:
+        start = last_day + timedelta(days=1)
+    else:
+        first_booking = db.query(func.min(models.Booking.start_time)).scalar()
+        start = min(first_booking.date(), datetime.utcnow().date()) if first_booking else datetime.utcnow().date()
+
+    if start > target:
+        db.commit()
+        return 0
+
+    rows = build_capacity_rows(db, start, target)
+    if rows:
+        _write_rows(db, rows, overwrite=False)
+    db.commit()
+    logger.info(f"Calendario de capacidad extendido: {start} -> {target} ({len(rows)} filas)")
+    return len(rows)
+
+
+def rebuild_future_capacity(db: Session, court_id: Optional[int] = None) -> int:
+    """
+    Recalcula el calendario desde hoy en adelante (ej. tras cambiar el mantenimiento
+    de una pista, el cuadrante o los festivos). Los días pasados no se tocan.
+
+    Args:
+        db: Sesión de base de datos
+        court_id: Limitar a una pista (por defecto todas)
+
+    Returns:
+        int: Número de filas regeneradas
+    """
+    today = datetime.utcnow().date()
+    _lock_capacity(db)
+    last_day = db.query(func.max(models.CourtCapacity.cap_date)).scalar()
+    target = max(last_day or today, today + timedelta(days=CAPACITY_HORIZON_DAYS))
+
+    query = db.query(models.CourtCapacity).filter(models.CourtCapacity.cap_date >= today)
+    if court_id is not None:
+        query = query.filter(models.CourtCapacity.court_id == court_id)
+    query.delete(synchronize_session=False)
+
+    rows = build_capacity_rows(db, today, target, court_ids=[court_id] if court_id is not None else None)
+    if rows:
+        _write_rows(db, rows, overwrite=True)
+    db.commit()
+    logger.info(f"Calendario de capacidad regenerado desde {today} (pista={court_id or 'todas'}, {len(rows)} filas)")
+    return len(rows)
+
+
+def get_capacity_by_court(db: Session, date_from: date, date_to: date) -> Dict[int, int]:
+    """
+    Franjas reservables por pista en un rango de días (ambos incluidos).
+
+    Returns:
+        Dict[int, int]: {court_id: franjas}
+    """
+    rows = db.query(
+        models.CourtCapacity.court_id, func.sum(models.CourtCapacity.slots)
+    ).filter(
+        models.CourtCapacity.cap_date >= date_from,
+        models.CourtCapacity.cap_date <= date_to
+    ).group_by(models.CourtCapacity.court_id).all()
+    return {court_id: int(slots or 0) for court_id, slots in rows}
+
+
+def get_total_capacity(db: Session, date_from: date, date_to: date) -> int:
+    """Franjas reservables en total (todas las pistas) en un rango de días."""
+    return sum(get_capacity_by_court(db, date_from, date_to).values())
+
+
+def get_capacity_rows(db: Session, date_from: date, date_to: date) -> list:
+    """
+    Filas del calendario en un rango, para cálculos vectorizados (ej. heatmap).
+
+    Returns:
+        list: Tuplas (cap_date, court_id, slots)
+    """
+    return db.query(
+        models.CourtCapacity.cap_date, models.CourtCapacity.court_id, models.CourtCapacity.slots
+    ).filter(
+        models.CourtCapacity.cap_date >= date_from,
+        models.CourtCapacity.cap_date <= date_to
+    ).all()
@@ -0,0 +1,280 @@
+"""
+Servicio de asignación automática de niveles de demanda al cuadrante.
+
+Calcula la tasa de ocupación histórica de cada bloque (día de la semana x hora) y
+propone el nivel de demanda que le corresponde según unos umbrales configurables:
+
+    ocupación >= high_threshold  -> Demanda alta
+    ocupación <= low_threshold   -> Demanda baja
+    en medio                     -> Demanda media
+
+La propuesta respeta los límites fijados por el administrador (bloques bloqueados,
+salto máximo de nivel por ejecución, mínimo de franjas observadas) y se puede
+revisar como diferencia antes de aplicarla con el editor de cuadrante.
+
+Los datos se agregan en SQL (reservas por día y bloque) y el resto del cálculo se
+hace de forma vectorizada con NumPy sobre matrices 7x10.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, cast, extract, Integer, Date
+from sqlalchemy.orm import Session
+import hashlib
+import json
+import logging
+import numpy as np
+from .. import crud, models
+from . import schedule_service
+from .capacity_service import get_capacity_rows
+from .holiday_service import get_holiday_map
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_KEY = "demand_tiers.settings"
+LAST_PROPOSAL_KEY = "demand_tiers.last_proposal"
+
+# Niveles de demanda (mismos IDs que initialize_demands), de mayor a menor
+HIGH_DEMAND_ID = 1
+MEDIUM_DEMAND_ID = 2
+LOW_DEMAND_ID = 3
+TIER_ORDER = [HIGH_DEMAND_ID, MEDIUM_DEMAND_ID, LOW_DEMAND_ID]
+
+DEFAULT_SETTINGS = {
+    "lookback_days": 90,      # Días de histórico que se analizan
+    "high_threshold": 0.75,   # Ocupación a partir de la cual el bloque es de demanda alta
+    "low_threshold": 0.35,    # Ocupación por debajo de la cual el bloque es de demanda baja
+    "min_capacity": 40,       # Franjas observadas mínimas para proponer un cambio en un bloque
+    "max_step": 1,            # Niveles que puede subir o bajar un bloque en cada ejecución
+    "locked": [],             # Bloques que nunca se cambian: [[día, "HH:MM"], ...]
+    "auto_apply": False       # Si el job nocturno aplica la propuesta directamente
+}
+
+
+def get_settings(db: Session) -> dict:
+    """Configuración actual (valores por defecto para las claves no guardadas)."""
+    stored = crud.get_state_value(db, SETTINGS_KEY)
+    settings = dict(DEFAULT_SETTINGS)
+    if stored:
+        settings.update(json.loads(stored))
+    return settings
+
+
+def save_settings(db: Session, settings: dict) -> dict:
+    """
+    Guarda la configuración. Lanza ValueError si los umbrales no son coherentes
+    o si algún bloque bloqueado no es un par [día, "HH:MM"] del cuadrante.
+
+    Returns:
+        dict: La configuración guardada
+    """
+    if not 0 <= settings["low_threshold"] < settings["high_threshold"] <= 1:
+        raise ValueError("Los umbrales deben cumplir 0 <= low_threshold < high_threshold <= 1")
+    if settings["lookback_days"] < 7:
+        raise ValueError("El histórico debe cubrir al menos 7 días")
+    if settings["max_step"] < 1:
+        raise ValueError("max_step debe ser al menos 1")
+    for entry in settings["locked"]:
+        if not (isinstance(entry, (list, tuple)) and len(entry) == 2
+                and isinstance(entry[0], int) and not isinstance(entry[0], bool)
+                and 0 <= entry[0] < schedule_service.DAYS_PER_WEEK
+                and entry[1] in schedule_service.SLOT_LABELS):
+            raise ValueError(f"Bloque bloqueado no válido: {entry!r} (se espera [día 0-6, \"HH:MM\"] del cuadrante)")
+    settings["locked"] = [[day, label] for day, label in settings["locked"]]
+
+    crud.set_state_value(db, SETTINGS_KEY, json.dumps(settings))
+    db.commit()
+    return settings
+
+
+def compute_fill_rates(db: Session, lookback_days: int, today: Optional[date] = None) -> dict:
+    """
+    Ocupación histórica por día de la semana y bloque.
+
+    Se excluyen los festivos (tienen sus propias reglas) y los días de hoy en adelante.
+    La capacidad sale del calendario de capacidad (capacity_service): cada día cuenta
+    las pistas que tenían franjas reservables, así que no se cuentan las pistas en
+    mantenimiento.
+
+    Returns:
+        dict: {"booked": matriz 7x10, "capacity": matriz 7x10, "fill": matriz 7x10 (NaN sin capacidad)}
+    """
+    today = today or datetime.utcnow().date()
+    date_from = today - timedelta(days=lookback_days)
+    holidays = set(get_holiday_map(db))
+    slot_index = {label: index for index, label in enumerate(schedule_service.SLOT_LABELS)}
+    n_days, n_slots = schedule_service.DAYS_PER_WEEK, len(schedule_service.SLOT_LABELS)
+
+    # 1. Reservas agregadas en SQL por día y hora de inicio
+    booking_day = func.date(models.Booking.start_time, type_=Date)
+    booking_hour = cast(extract('hour', models.Booking.start_time), Integer)
+    booking_minute = cast(extract('minute', models.Booking.start_time), Integer)
+    rows = db.query(
+        booking_day, booking_hour, booking_minute, func.count(models.Booking.booking_id)
+    ).filter(
+        models.Booking.start_time >= datetime.combine(date_from, datetime.min.time()),
+        models.Booking.start_time < datetime.combine(today, datetime.min.time()),
+        models.Booking.is_cancelled == False
+    ).group_by(booking_day, booking_hour, booking_minute).all()
+
+    booked = np.zeros((n_days, n_slots))
+    cells = [
+        (day.weekday(), slot_index[f"{hour:02d}:{minute:02d}"], count)
+        for day, hour, minute, count in rows
+        if day not in holidays and f"{hour:02d}:{minute:02d}" in slot_index
+    ]
+    if cells:
+        cells = np.array(cells, dtype=np.int64)
+        np.add.at(booked, (cells[:, 0], cells[:, 1]), cells[:, 2])
+
+    # 2. Capacidad: pistas abiertas cada día (calendario de capacidad) x bloques del cuadrante
+    open_courts = np.zeros(n_days)
+    for cap_date, _, slots in get_capacity_rows(db, date_from, today - timedelta(days=1)):
+        if slots > 0 and cap_date not in holidays:
+            open_courts[cap_date.weekday()] += 1
+
+    matrix = schedule_service.get_schedule_matrix(db)
+    in_schedule = np.array([[demand is not None for demand in row] for row in matrix], dtype=float)
+    capacity = open_courts[:, None] * in_schedule
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fill = np.where(capacity > 0, booked / capacity, np.nan)
+
+    return {"booked": booked, "capacity": capacity, "fill": fill}
+
+
+def build_proposal(db: Session, settings: Optional[dict] = None) -> dict:
+    """
+    Propone los niveles de demanda del cuadrante a partir de la ocupación histórica.
+
+    Returns:
+        dict: schedule_version (versión del cuadrante sobre la que se calculó),
+            fill_rates (matriz 7x10), changes (lista de bloques que cambian),
+            proposal_hash (huella de los cambios, ver proposal_hash) y settings
+    """
+    settings = settings or get_settings(db)
+    rates = compute_fill_rates(db, settings["lookback_days"])
+    fill, capacity = rates["fill"], rates["capacity"]
+
+    schedule_version = schedule_service.get_schedule_version(db)
+    current = np.array([
+        [demand if demand is not None else 0 for demand in row]
+        for row in schedule_service.get_schedule_matrix(db)
+    ])
+
+    # Rango de cada nivel (0=alta, 1=media, 2=baja); -1 para niveles fuera de la escala
+    rank_of = np.full(max(TIER_ORDER + [int(current.max())]) + 1, -1)
+    rank_of[TIER_ORDER] = np.arange(len(TIER_ORDER))
+    current_rank = rank_of[current]
+
+    target_rank = np.where(
+        fill >= settings["high_threshold"], 0,
+        np.where(fill <= settings["low_threshold"], 2, 1)
+    )
+    step = np.clip(target_rank - current_rank, -settings["max_step"], settings["max_step"])
+    proposed_rank = current_rank + step
+
+    # Solo se cambian bloques con nivel conocido, datos suficientes y no bloqueados
+    changeable = (current_rank >= 0) & (capacity >= settings["min_capacity"]) & ~np.isnan(fill)
+    for day, label in settings["locked"]:
+        if label in schedule_service.SLOT_LABELS and 0 <= day < schedule_service.DAYS_PER_WEEK:
+            changeable[day, schedule_service.SLOT_LABELS.index(label)] = False
+
+    proposed = np.where(changeable, np.array(TIER_ORDER)[np.clip(proposed_rank, 0, 2)], current)
+
+    changes = [{
+        "day_of_week": int(day),
+        "start_time": schedule_service.SLOT_LABELS[slot],
+        "current_demand_id": int(current[day, slot]),
+        "proposed_demand_id": int(proposed[day, slot]),
+        "fill_rate": round(float(fill[day, slot]), 4)
+    } for day, slot in zip(*np.nonzero(proposed != current))]
+
+    return {
+        "computed_at": datetime.utcnow().isoformat(),
+        "schedule_version": schedule_version,
+        "fill_rates": [
+            [None if np.isnan(value) else round(float(value), 4) for value in row]
+            for row in fill
+        ],
+        "changes": changes,
+        "proposal_hash": proposal_hash(schedule_version, changes),
+        "settings": settings
+    }
+
+
+def proposal_hash(schedule_version: str, changes: list) -> str:
+    """
+    Huella de una propuesta: versión del cuadrante y niveles de cada bloque que cambia.
+    Sirve para aplicar exactamente la diferencia que el administrador revisó.
+    """
+    key = sorted(
+        (c["day_of_week"], c["start_time"], c["current_demand_id"], c["proposed_demand_id"])
+        for c in changes
+    )
+    payload = json.dumps([schedule_version, key], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def find_previewed_proposal(db: Session, schedule_version: str, expected_hash: str) -> Optional[dict]:
+    """
+    Busca la propuesta que se previsualizó (la última guardada o una recalculada ahora)
+    por su huella.
+
+    Args:
+        db: Sesión de base de datos
+        schedule_version: Versión del cuadrante sobre la que se revisó
+        expected_hash: proposal_hash de la propuesta revisada
+
+    Returns:
+        dict o None si ninguna propuesta actual coincide con la revisada
+    """
+    for load in (get_last_proposal, build_proposal):
+        proposal = load(db)
+        if (proposal and proposal["schedule_version"] == schedule_version
+                and proposal_hash(proposal["schedule_version"], proposal["changes"]) == expected_hash):
+            return proposal
+    return None
+
+
+def apply_proposal(db: Session, proposal: dict) -> dict:
+    """
+    Aplica una propuesta con el editor de cuadrante (un único upsert y nueva versión).
+
+    Lanza ValueError si el cuadrante ha cambiado desde que se calculó la propuesta.
+    """
+    if proposal["schedule_version"] != schedule_service.get_schedule_version(db):
+        raise ValueError("El cuadrante ha cambiado desde que se calculó la propuesta")
+
+    changes = [
+        (c["day_of_week"], datetime.strptime(c["start_time"], "%H:%M").time(), c["proposed_demand_id"])
+        for c in proposal["changes"]
+    ]
+    return schedule_service.apply_schedule_changes(db, changes, expected_version=proposal["schedule_version"])
+
+
+def run_nightly_job(db: Session) -> dict:
+    """
+    Calcula la propuesta, la guarda para revisión y, si auto_apply está activo, la aplica.
+
+    Returns:
+        dict: {"changes": número de bloques propuestos, "applied": bool}
+    """
+    settings = get_settings(db)
+    proposal = build_proposal(db, settings)
+    crud.set_state_value(db, LAST_PROPOSAL_KEY, json.dumps(proposal))
+    db.commit()
+
+    applied = False
+    if settings["auto_apply"] and proposal["changes"]:
+        apply_proposal(db, proposal)
+        applied = True
+
+    logger.info(f"Propuesta de niveles de demanda: {len(proposal['changes'])} cambios (aplicada={applied})")
+    return {"changes": len(proposal["changes"]), "applied": applied}
+
+
+def get_last_proposal(db: Session) -> Optional[dict]:
+    """Última propuesta guardada por el job nocturno, o None."""
+    stored = crud.get_state_value(db, LAST_PROPOSAL_KEY)
+    return json.loads(stored) if stored else None
@@ -0,0 +1,329 @@
+"""
+Despachador concurrente de emails.
+
+Los envíos se encolan en una cola acotada y los procesa un pool de hilos:
+
+- Concurrencia configurable (EMAIL_DISPATCH_WORKERS). Conviene que no supere el
+  tamaño del pool SMTP, porque cada hilo ocupa una conexión mientras envía.
+- Backpressure: si hay EMAIL_DISPATCH_QUEUE_SIZE emails pendientes (en cola, aplazados
+  por su dominio o enviándose), `submit` espera (o falla pasado el timeout)
+  en lugar de acumular trabajo sin límite en memoria. Desde las peticiones HTTP se
+  usa un timeout corto (EMAIL_DISPATCH_SUBMIT_TIMEOUT) y, si vence, la notificación
+  se registra para reintento en lugar de bloquear la respuesta.
+- Límite de envíos por dominio destinatario (token bucket), para no superar las
+  cuotas de proveedores como gmail.com u outlook.com en las ráfagas. Un email que
+  debe esperar a su dominio se aparta en una cola de aplazados hasta su hora, y el
+  hilo sigue con los demás: un dominio lento no frena al resto.
+- Métricas: emails/s, profundidad de la cola y latencia por envío.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from . import notification_service
+
+logger = logging.getLogger(__name__)
+
+EMAIL_DISPATCH_WORKERS = int(os.getenv("EMAIL_DISPATCH_WORKERS", 4))
+EMAIL_DISPATCH_QUEUE_SIZE = int(os.getenv("EMAIL_DISPATCH_QUEUE_SIZE", 1000))
+EMAIL_DOMAIN_RATE_PER_SECOND = float(os.getenv("EMAIL_DOMAIN_RATE_PER_SECOND", 5))
+EMAIL_DOMAIN_BURST = int(os.getenv("EMAIL_DOMAIN_BURST", 10))
+EMAIL_DISPATCH_SUBMIT_TIMEOUT = float(os.getenv("EMAIL_DISPATCH_SUBMIT_TIMEOUT", 2))
+
+# Ventana (segundos) sobre la que se calcula el ritmo de envío
+THROUGHPUT_WINDOW_SECONDS = 60
+# Número de latencias recientes que se guardan para los percentiles
+LATENCY_SAMPLES = 1000
+# Cada cuánto comprueban los hilos si se ha pedido parar
+STOP_POLL_SECONDS = 0.5
+
+EmailJob = namedtuple("EmailJob", ["to_email", "subject", "html_content"])
+
+
+class DispatcherBusyError(Exception):
+    """La cola del despachador está llena y no se liberó hueco a tiempo."""
+
+
+class TokenBucket:
+    """Token bucket seguro entre hilos: `rate` tokens por segundo con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Reserva un token sin esperar.
+
+        Returns:
+            float: Segundos que faltan para poder usarlo (0 si ya hay token)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # El token queda reservado aunque el saldo pase a negativo
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class EmailDispatcher:
+    """
+    Pool de hilos que envía emails desde una cola acotada.
+    """
+
+    def __init__(self, workers: int = EMAIL_DISPATCH_WORKERS, queue_size: int = EMAIL_DISPATCH_QUEUE_SIZE,
+                 domain_rate: float = EMAIL_DOMAIN_RATE_PER_SECOND, domain_burst: int = EMAIL_DOMAIN_BURST,
+                 send_func: Optional[Callable[..., bool]] = None, name: str = "email-dispatch"):
+        """
+        Args:
+            workers: Hilos de envío
+            queue_size: Trabajos en espera como máximo (backpressure)
+            domain_rate: Emails por segundo permitidos por dominio destinatario (0 = sin límite)
+            domain_burst: Ráfaga máxima por dominio
+            send_func: Función de envío (to_email, subject, html_content) -> bool
+                (por defecto notification_service.send_email)
+            name: Prefijo de los hilos (solo para logs)
+        """
+        self.workers = workers
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.send_func = send_func
+
+        # Huecos del despachador: cada email ocupa uno desde submit hasta que termina su
+        # envío, esté en la cola, aplazado por su dominio o enviándose (backpressure)
+        self.queue_size = queue_size
+        self._capacity = threading.BoundedSemaphore(queue_size)
+        # La cola no necesita límite propio: nunca tiene más trabajos que huecos
+        self._queue = queue.Queue()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        # Emails aplazados por el límite de su dominio: heap de (no_antes_de, orden, trabajo)
+        self._delayed = []
+        self._delayed_lock = threading.Lock()
+        self._delayed_seq = itertools.count()
+        self._stop = threading.Event()
+
+        self._metrics_lock = threading.Lock()
+        self._sent_times = deque()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._submitted = 0
+        self._sent = 0
+        self._failed = 0
+        self._rate_limited_seconds = 0.0
+        self._in_flight = 0
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job: EmailJob, on_done: Optional[Callable[[EmailJob, bool], None]] = None,
+               timeout: Optional[float] = None) -> Future:
+        """
+        Encola un email. Si el despachador está lleno (emails en cola, aplazados por
+        el límite de su dominio o enviándose), espera hasta `timeout` segundos
+        (None = sin límite) y lanza DispatcherBusyError si no se libera hueco.
+
+        Args:
+            job: Email a enviar
+            on_done: Callback (job, enviado) que se ejecuta en el hilo de envío
+            timeout: Espera máxima por un hueco en la cola
+
+        Returns:
+            Future: Se resuelve con True/False según se haya enviado o no
+        """
+        future = Future()
+        if not self._capacity.acquire(timeout=timeout):
+            raise DispatcherBusyError(f"Cola de emails llena ({self.queue_size} en espera)")
+        self._queue.put((job, on_done, future, 0.0))
+        with self._metrics_lock:
+            self._submitted += 1
+        return future
+
+    def send_many(self, jobs: List[EmailJob]) -> List[bool]:
+        """Envía una lista de emails en paralelo y espera a que terminen todos."""
+        futures = [self.submit(job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def _bucket_for(self, email: str) -> Optional[TokenBucket]:
+        if self.domain_rate <= 0:
+            return None
+        domain = email.rsplit("@", 1)[-1].lower()
+        with self._buckets_lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                bucket = TokenBucket(self.domain_rate, self.domain_burst)
+                self._buckets[domain] = bucket
+            return bucket
+
+    def _next_item(self):
+        """
+        Siguiente trabajo del hilo: un email aplazado que ya puede salir o el siguiente
+        de la cola. Devuelve None cuando se ha pedido parar y no queda nada pendiente.
+        """
+        while True:
+            with self._delayed_lock:
+                now = time.monotonic()
+                if self._delayed and self._delayed[0][0] <= now:
+                    return heapq.heappop(self._delayed)[2]
+                timeout = STOP_POLL_SECONDS
+                if self._delayed:
+                    timeout = min(timeout, self._delayed[0][0] - now)
+                idle = not self._delayed
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                if self._stop.is_set() and idle:
+                    return None
+                continue
+            if item is not None:
+                return item
+            # Aviso de parada: solo despierta al hilo
+            self._queue.task_done()
+
+    def _defer(self, item: tuple, wait: float) -> None:
+        """
+        Aparta un email hasta que su dominio tenga token. Sigue ocupando su hueco
+        (y contando en wait_idle), así que los aplazados también frenan a submit.
+        """
+        with self._delayed_lock:
+            heapq.heappush(self._delayed, (time.monotonic() + wait, next(self._delayed_seq), item))
+
+    def _worker(self) -> None:
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            job, on_done, future, waited = item
+
+            # Los aplazados ya tienen su token reservado
+            if not waited:
+                bucket = self._bucket_for(job.to_email)
+                wait = bucket.reserve() if bucket else 0.0
+                if wait > 0:
+                    self._defer((job, on_done, future, wait), wait)
+                    continue
+
+            with self._metrics_lock:
+                self._in_flight += 1
+            try:
+                start = time.monotonic()
+                try:
+                    send = self.send_func or notification_service.send_email
+                    sent = bool(send(job.to_email, job.subject, job.html_content))
+                except Exception as e:
+                    logger.error(f"Error enviando email a {job.to_email}: {str(e)}", exc_info=True)
+                    sent = False
+                latency = time.monotonic() - start
+
+                with self._metrics_lock:
+                    self._latencies.append(latency)
+                    self._rate_limited_seconds += waited
+                    if sent:
+                        self._sent += 1
+                        self._sent_times.append(time.monotonic())
+                    else:
+                        self._failed += 1
+
+                if on_done:
+                    try:
+                        on_done(job, sent)
+                    except Exception as e:
+                        logger.error(f"Error en callback de envío a {job.to_email}: {str(e)}", exc_info=True)
+                future.set_result(sent)
+            finally:
+                with self._metrics_lock:
+                    self._in_flight -= 1
+                self._capacity.release()
+                self._queue.task_done()
+
+    def wait_idle(self) -> None:
+        """Bloquea hasta que todos los emails encolados se hayan procesado."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        """Métricas actuales del despachador."""
+        now = time.monotonic()
+        with self._metrics_lock:
+            while self._sent_times and now - self._sent_times[0] > THROUGHPUT_WINDOW_SECONDS:
+                self._sent_times.popleft()
+            latencies = sorted(self._latencies)
+            recent = len(self._sent_times)
+            span = (now - self._sent_times[0]) if recent > 1 else 0
+
+            def percentile(p: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "delayed": len(self._delayed),
+                "queue_capacity": self.queue_size,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "sent": self._sent,
+                "failed": self._failed,
+                "throughput_per_second": round(recent / span, 2) if span else float(recent),
+                "latency_ms": {
+                    "avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                    "p50": percentile(0.50),
+                    "p95": percentile(0.95),
+                    "max": round(latencies[-1] * 1000, 2) if latencies else None
+                },
+                "rate_limited_seconds": round(self._rate_limited_seconds, 2),
+                "domains_tracked": len(self._buckets)
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Detiene los hilos tras procesar lo que ya está en cola (sin bloquearse aunque esté llena)."""
+        self._stop.set()
+        for _ in self._threads:
+            # Despierta a los hilos parados en la cola (la cola no tiene límite: nunca bloquea)
+            self._queue.put_nowait(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        logger.info(f"Despachador de emails detenido ({self._sent} enviados, {self._failed} fallidos)")
+
+
+_dispatcher: Optional[EmailDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> EmailDispatcher:
+    """Despachador compartido del proceso (se crea en el primer uso)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = EmailDispatcher()
+            logger.info(
+                f"Despachador de emails iniciado: {EMAIL_DISPATCH_WORKERS} hilos, "
+                f"cola {EMAIL_DISPATCH_QUEUE_SIZE}, {EMAIL_DOMAIN_RATE_PER_SECOND}/s por dominio"
+            )
+        return _dispatcher
+
+
+def shutdown_dispatcher() -> None:
+    """Detiene el despachador compartido si se llegó a crear."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.shutdown()
+            _dispatcher = None
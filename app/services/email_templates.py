@@ -0,0 +1,103 @@
+"""
+Plantillas de email (Jinja2) con alternativa en texto plano.
+
+Las plantillas están en app/templates/emails/ y usan el mismo entorno Jinja2 que
+las páginas (app/templates.py), con autoescape para los datos del usuario.
+
+El entorno guarda las plantillas compiladas, pero con auto_reload comprueba en cada
+`get_template` si el fichero ha cambiado. Aquí cada plantilla se obtiene una sola vez
+y se guarda el objeto `Template`: el marcado estático queda como constantes en el
+código compilado y renderizar solo concatena los valores de cada email.
+
+El texto plano se genera a partir del HTML renderizado (sin estilos, con saltos de
+línea por bloque y los enlaces como "texto (url)").
+"""
+
+import re
+import threading
+from collections import namedtuple
+from html import unescape
+from typing import Dict
+
+from jinja2 import Template
+
+from ..templates import templates
+
+# Clave de plantilla (igual al tipo de notificación) -> fichero en app/templates/
+EMAIL_TEMPLATE_FILES = {
+    "booking_confirmation": "emails/booking_confirmation.html",
+    "welcome_email": "emails/welcome_email.html",
+    "password_reset": "emails/password_reset.html",
+    "reminder_24h": "emails/reminder_24h.html",
+    "cancellation": "emails/cancellation.html",
+    "price_update": "emails/price_update.html",
+    # Resumen de varias notificaciones del mismo tipo (ver notification_digest)
+    "digest": "emails/digest.html",
+}
+
+RenderedEmail = namedtuple("RenderedEmail", ["html", "text"])
+
+_compiled: Dict[str, Template] = {}
+_compiled_lock = threading.Lock()
+
+
+def get_template(template_key: str) -> Template:
+    """
+    Plantilla compilada (se compila en el primer uso). Lanza KeyError si no existe.
+    """
+    template = _compiled.get(template_key)
+    if template is None:
+        with _compiled_lock:
+            template = _compiled.get(template_key)
+            if template is None:
+                template = templates.env.get_template(EMAIL_TEMPLATE_FILES[template_key])
+                _compiled[template_key] = template
+    return template
+
+
+def precompile_all() -> None:
+    """Compila todas las plantillas de email (por ejemplo al arrancar)."""
+    for template_key in EMAIL_TEMPLATE_FILES:
+        get_template(template_key)
+
+
+def render_html(template_key: str, params: dict) -> str:
+    """HTML de un email."""
+    return get_template(template_key).render(**params)
+
+
+def render(template_key: str, params: dict) -> RenderedEmail:
+    """HTML y texto plano de un email."""
+    html = render_html(template_key, params)
+    return RenderedEmail(html, html_to_text(html))
+
+
+_STRIP_BLOCKS = re.compile(r"<(style|head|title|script)\b.*?</\1>", re.S | re.I)
+_LINKS = re.compile(r"<a\b[^>]*\bhref=\"([^\"]*)\"[^>]*>(.*?)</a>", re.S | re.I)
+_LIST_ITEMS = re.compile(r"<li\b[^>]*>", re.I)
+_RULES = re.compile(r"<hr\b[^>]*>", re.I)
+_BLOCK_TAGS = re.compile(r"</?(p|div|h[1-6]|ul|ol|tr|br|table)\b[^>]*>", re.I)
+_TAGS = re.compile(r"<[^>]+>")
+_SPACES = re.compile(r"[ \t\r\f\v]*\n[ \t\r\f\v]*|[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_LIST_GAPS = re.compile(r"\n{2,}(?=- )")
+
+
+def _collapse_spaces(match) -> str:
+    return "\n" if "\n" in match.group(0) else " "
+
+
+def html_to_text(html: str) -> str:
+    """
+    Texto plano equivalente a un HTML (para la parte text/plain del email):
+    un salto de línea por bloque, listas con guiones y enlaces como "texto (url)".
+    """
+    text = _STRIP_BLOCKS.sub("", html)
+    text = _LINKS.sub(lambda m: f"{m.group(2)} ({m.group(1)})", text)
+    text = _LIST_ITEMS.sub("\n- ", text)
+    text = _RULES.sub("\n----------\n", text)
+    text = _BLOCK_TAGS.sub("\n", text)
+    text = unescape(_TAGS.sub("", text))
+    text = _SPACES.sub(_collapse_spaces, text)
+    text = _LIST_GAPS.sub("\n", text)
+    return _BLANK_LINES.sub("\n\n", text).strip() + "\n"
@@ -0,0 +1,128 @@
+"""
+Servicio de exportación de reservas a CSV.
+
+Genera el CSV de forma incremental (generador) leyendo las reservas con un cursor
+de servidor (yield_per), de modo que la memoria se mantiene constante sin importar
+cuántas filas se exporten. Opcionalmente comprime la salida con gzip al vuelo.
+"""
+
+import csv
+import io
+import logging
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+
+from .. import models, database
+
+logger = logging.getLogger(__name__)
+
+# Filas leídas por viaje a la base de datos
+EXPORT_FETCH_SIZE = 1000
+# Filas acumuladas antes de emitir un bloque de salida
+EXPORT_FLUSH_ROWS = 500
+
+EXPORT_STATUSES = ["all", "active", "cancelled"]
+
+CSV_HEADER = [
+    "booking_id", "start_time", "court_id", "user_id", "user_email",
+    "price_id", "price_amount", "is_cancelled", "created_at"
+]
+
+
+def _iter_csv_chunks(date_from: Optional[date], date_to: Optional[date], status: str) -> Iterator[str]:
+    """
+    Genera el CSV en bloques de texto.
+
+    Abre su propia sesión: el generador se consume mientras se envía la respuesta,
+    cuando la sesión de la petición ya puede estar cerrada.
+    """
+    db = database.session_local()
+    exported = 0
+    try:
+        query = db.query(
+            models.Booking.booking_id,
+            models.Booking.start_time,
+            models.Booking.court_id,
+            models.Booking.user_id,
+            models.User.email,
+            models.Booking.price_id,
+            models.Price.amount,
+            models.Booking.is_cancelled,
+            models.Booking.created_at
+        ).outerjoin(
+            models.User, models.Booking.user_id == models.User.user_id
+        ).outerjoin(
+            models.Price, models.Booking.price_id == models.Price.price_id
+        )
+
+        if date_from:
+            query = query.filter(models.Booking.start_time >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            query = query.filter(models.Booking.start_time < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        if status == "active":
+            query = query.filter(models.Booking.is_cancelled == False)
+        elif status == "cancelled":
+            query = query.filter(models.Booking.is_cancelled == True)
+
+        # yield_per activa stream_results: cursor de servidor en PostgreSQL
+        query = query.order_by(models.Booking.start_time, models.Booking.booking_id).yield_per(EXPORT_FETCH_SIZE)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+
+        for row in query:
+            writer.writerow([
+                row.booking_id,
+                row.start_time.isoformat() if row.start_time else "",
+                row.court_id,
+                row.user_id,
+                row.email or "",
+                row.price_id or "",
+                f"{row.amount:.2f}" if row.amount is not None else "",
+                "1" if row.is_cancelled else "0",
+                row.created_at.isoformat() if row.created_at else ""
+            ])
+            exported += 1
+
+            if exported % EXPORT_FLUSH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        remaining = buffer.getvalue()
+        if remaining:
+            yield remaining
+
+        logger.info(f"Exportación CSV completada: {exported} reservas ({date_from} -> {date_to}, estado={status})")
+    finally:
+        db.close()
+
+
+def iter_bookings_csv(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                      status: str = "all", compress: bool = False) -> Iterator[bytes]:
+    """
+    Generador de bytes con el CSV de reservas, opcionalmente comprimido con gzip.
+
+    Args:
+        date_from: Primer día (incluido) de inicio de las reservas
+        date_to: Último día (incluido) de inicio de las reservas
+        status: "all", "active" o "cancelled"
+        compress: Si True, la salida es un flujo gzip
+
+    Yields:
+        bytes: Bloques del fichero
+    """
+    if not compress:
+        for chunk in _iter_csv_chunks(date_from, date_to, status):
+            yield chunk.encode("utf-8")
+        return
+
+    # wbits=16+MAX_WBITS -> formato gzip (cabecera y CRC) en modo streaming
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in _iter_csv_chunks(date_from, date_to, status):
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,193 @@
+"""
+Servicio de festivos (tabla Holiday).
+
+Los festivos se mantienen en memoria ligados a una versión guardada en system_state,
+igual que el cuadrante y los precios, de modo que aplicar las reglas de festivo en la
+búsqueda, el presupuesto o la reserva no añade consultas por petición.
+
+Reglas de un festivo:
+- Nivel de demanda: el indicado en el festivo o, si es nulo, el del domingo para ese bloque.
+- Cuadrante: todos los bloques o, si se indica, solo los que empiezan en [open_time, close_time).
+"""
+
+from collections import namedtuple
+from datetime import date, datetime, time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import logging
+import os
+from .. import crud, models
+from .cache_service import VersionedCache
+from .schedule_service import SLOT_LABELS, SLOT_TIMES, get_schedule_map
+
+logger = logging.getLogger(__name__)
+
+HOLIDAY_VERSION_KEY = "holiday.version"
+
+# Día de la semana cuyos niveles de demanda se aplican en festivo (6=Domingo)
+HOLIDAY_WEEKDAY = 6
+
+# Cada cuánto se comprueba si otro proceso ha cambiado los festivos
+HOLIDAY_CACHE_CHECK_SECONDS = float(os.getenv("HOLIDAY_CACHE_CHECK_SECONDS", 30))
+
+HolidayRule = namedtuple("HolidayRule", ["description", "demand_id", "open_time", "close_time"])
+
+_holiday_cache = VersionedCache("holidays", HOLIDAY_CACHE_CHECK_SECONDS)
+
+
+def get_holiday_version(db: Session) -> str:
+    """Versión actual de los festivos ("0" si nunca se han importado por API)."""
+    return crud.get_state_value(db, HOLIDAY_VERSION_KEY) or "0"
+
+
+def _load_holidays(db: Session) -> Dict[date, HolidayRule]:
+    rows = db.query(models.Holiday).all()
+    return {
+        h.date.date(): HolidayRule(h.description, h.demand_id, h.open_time, h.close_time)
+        for h in rows
+    }
+
+
+def get_holiday_map(db: Session) -> Dict[date, HolidayRule]:
+    """
+    Festivos cacheados: {fecha: regla}.
+
+    Returns:
+        Dict[date, HolidayRule]: Reglas de cada festivo
+    """
+    return _holiday_cache.get(
+        version_loader=lambda: get_holiday_version(db),
+        loader=lambda: _load_holidays(db)
+    )
+
+
+def _slot_is_open(rule: HolidayRule, slot: time) -> bool:
+    if rule.open_time is not None and slot < rule.open_time:
+        return False
+    if rule.close_time is not None and slot >= rule.close_time:
+        return False
+    return True
+
+
+def get_day_slots(db: Session, day: date) -> List[Tuple[str, int]]:
+    """
+    Bloques reservables de un día con su nivel de demanda, aplicando festivos.
+
+    Args:
+        db: Sesión de base de datos
+        day: Día a consultar
+
+    Returns:
+        List[Tuple[str, int]]: Lista ordenada de ("HH:MM", demand_id)
+    """
+    schedule_map = get_schedule_map(db)
+    rule = get_holiday_map(db).get(day)
+
+    if rule is None:
+        weekday = day.weekday()
+        return [
+            (label, schedule_map[(weekday, label)])
+            for label in SLOT_LABELS if (weekday, label) in schedule_map
+        ]
+
+    slots = []
+    for slot, label in zip(SLOT_TIMES, SLOT_LABELS):
+        if not _slot_is_open(rule, slot):
+            continue
+        demand_id = rule.demand_id or schedule_map.get((HOLIDAY_WEEKDAY, label))
+        if demand_id is not None:
+            slots.append((label, demand_id))
+    return slots
+
+
+def get_demand_at(db: Session, start_dt: datetime) -> Optional[int]:
+    """
+    Nivel de demanda de una franja concreta, o None si no es reservable
+    (no existe en el cuadrante o el festivo la cierra).
+    """
+    label = start_dt.strftime("%H:%M")
+    return dict(get_day_slots(db, start_dt.date())).get(label)
+
+
+def list_holidays(db: Session, year: Optional[int] = None) -> List[dict]:
+    """Festivos ordenados por fecha, opcionalmente de un solo año."""
+    holidays = sorted(get_holiday_map(db).items())
+    return [{
+        "date": day,
+        "description": rule.description,
+        "demand_id": rule.demand_id,
+        "open_time": rule.open_time,
+        "close_time": rule.close_time
+    } for day, rule in holidays if year is None or day.year == year]
+
+
+def _upsert_statement(db: Session, rows: list):
+    """INSERT ... ON CONFLICT (date) DO UPDATE según el dialecto."""
+    if db.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+
+    stmt = insert(models.Holiday).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["date"],
+        set_={
+            "description": stmt.excluded.description,
+            "demand_id": stmt.excluded.demand_id,
+            "open_time": stmt.excluded.open_time,
+            "close_time": stmt.excluded.close_time
+        }
+    )
+
+
+def import_holidays(db: Session, holidays: List[dict], replace_year: Optional[int] = None) -> dict:
+    """
+    Importa festivos en bloque con un único upsert y publica una nueva versión.
+
+    Args:
+        db: Sesión de base de datos
+        holidays: Lista de dicts {date, description, demand_id, open_time, close_time}
+        replace_year: Si se indica, se eliminan antes los festivos de ese año que no vengan en la lista
+
+    Returns:
+        dict: {"imported": festivos importados, "removed": festivos eliminados, "version": nueva versión}
+    """
+    demand_ids = {d for (d,) in db.query(models.Demand.demand_id).all()}
+    rows = []
+    for h in holidays:
+        if replace_year is not None and h["date"].year != replace_year:
+            raise ValueError(f"El festivo {h['date']} no pertenece al año {replace_year}")
+        if h.get("demand_id") is not None and h["demand_id"] not in demand_ids:
+            raise ValueError(f"Nivel de demanda inexistente: {h['demand_id']}")
+        if h.get("open_time") and h.get("close_time") and h["open_time"] >= h["close_time"]:
+            raise ValueError(f"Horario reducido inválido para {h['date']}")
+        rows.append({
+            "date": datetime.combine(h["date"], time.min),
+            "description": h.get("description"),
+            "demand_id": h.get("demand_id"),
+            "open_time": h.get("open_time"),
+            "close_time": h.get("close_time")
+        })
+
+    removed = 0
+    if replace_year is not None:
+        keep = [r["date"] for r in rows]
+        removed = db.query(models.Holiday).filter(
+            models.Holiday.date >= datetime(replace_year, 1, 1),
+            models.Holiday.date < datetime(replace_year + 1, 1, 1),
+            models.Holiday.date.notin_(keep)
+        ).delete(synchronize_session=False)
+
+    if rows:
+        db.execute(_upsert_statement(db, rows))
+
+    new_version = crud.increment_state_counter(db, HOLIDAY_VERSION_KEY)
+    db.commit()
+    _holiday_cache.invalidate()
+
+    # Los festivos cambian la capacidad de los días futuros
+    from .capacity_service import rebuild_future_capacity
+    rebuild_future_capacity(db)
+
+    logger.info(f"Festivos importados: {len(rows)} (eliminados {removed}), versión {new_version}")
+    return {"imported": len(rows), "removed": removed, "version": new_version}
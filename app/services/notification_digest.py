@@ -0,0 +1,240 @@
+"""
+Agrupación de notificaciones en resúmenes (digest).
+
+Un usuario que reserva tres franjas seguidas recibiría tres emails en un minuto,
+cada uno con su sesión SMTP. Con la agrupación activa, las notificaciones de un
+mismo usuario y tipo que llegan dentro de una ventana de NOTIFICATION_COALESCE_SECONDS
+(contada desde la primera) se envían juntas en un único email resumen.
+
+- Solo se agrupan los tipos de NOTIFICATION_COALESCE_TYPES, y solo las
+  notificaciones basadas en plantilla (se necesitan sus parámetros).
+- Si al cerrar la ventana solo hay una, se envía el email normal de su tipo.
+- Cada notificación se sigue registrando por separado (con su reserva y sus
+  parámetros), así que el historial no pierde información.
+- Una ventana de 0 segundos desactiva la agrupación.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from . import email_templates
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_COALESCE_SECONDS = float(os.getenv("NOTIFICATION_COALESCE_SECONDS", 0))
+NOTIFICATION_COALESCE_TYPES = [
+    t.strip() for t in os.getenv("NOTIFICATION_COALESCE_TYPES", "booking_confirmation,cancellation").split(",")
+    if t.strip()
+]
+
+# Asunto y entradilla del resumen por tipo ({count} = número de notificaciones agrupadas)
+DIGEST_TEXTS = {
+    "booking_confirmation": ("✓ {count} reservas confirmadas", "Tus reservas han sido confirmadas. Aquí están los detalles:"),
+    "cancellation": ("✗ {count} reservas canceladas", "Las siguientes reservas han sido canceladas:"),
+    "reminder_24h": ("⏰ Recordatorio de tus {count} reservas", "Tus reservas están a pocas horas. ¡No olvides los detalles!"),
+}
+DEFAULT_DIGEST_TEXTS = ("Tienes {count} notificaciones nuevas", "Resumen de tus notificaciones:")
+
+PendingNotification = namedtuple(
+    "PendingNotification",
+    ["user_id", "recipient_email", "notification_type", "subject", "template_params", "booking_id", "future"]
+)
+
+
+class NotificationCoalescer:
+    """
+    Acumula notificaciones por (usuario, tipo) y las envía agrupadas al cerrar su ventana.
+    Un único hilo vigila las ventanas abiertas.
+    """
+
+    def __init__(self, window_seconds: float = NOTIFICATION_COALESCE_SECONDS,
+                 types: Optional[List[str]] = None):
+        """
+        Args:
+            window_seconds: Duración de la ventana desde la primera notificación (0 = desactivado)
+            types: Tipos de notificación que se agrupan (por defecto NOTIFICATION_COALESCE_TYPES)
+        """
+        self.window_seconds = window_seconds
+        self.types = set(NOTIFICATION_COALESCE_TYPES if types is None else types)
+
+        self._pending: Dict[Tuple[int, str], List[PendingNotification]] = {}
+        self._deadlines: Dict[Tuple[int, str], float] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.received = 0
+        self.emails_sent = 0
+        self.digests_sent = 0
+
+        self._thread = None
+        if window_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="notification-digest", daemon=True)
+            self._thread.start()
+
+    def accepts(self, notification_type: str) -> bool:
+        """Indica si las notificaciones de este tipo se agrupan."""
+        return self.window_seconds > 0 and not self._closed and notification_type in self.types
+
+    def add(self, user_id: int, recipient_email: str, notification_type: str, subject: str,
+            template_params: dict, booking_id: int = None) -> Future:
+        """
+        Añade una notificación a la ventana de su usuario y tipo (abriéndola si no existe).
+
+        Returns:
+            Future: Se resuelve con True/False cuando se envía el email que la incluye
+        """
+        future = Future()
+        item = PendingNotification(user_id, recipient_email, notification_type, subject,
+                                   template_params, booking_id, future)
+        key = (user_id, notification_type)
+        with self._cond:
+            if key not in self._pending:
+                self._pending[key] = []
+                self._deadlines[key] = time.monotonic() + self.window_seconds
+                self._cond.notify()
+            self._pending[key].append(item)
+            self.received += 1
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [key for key, deadline in self._deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                batches = [self._pop(key) for key in due]
+
+            for items in batches:
+                self._send(items)
+
+    def _pop(self, key) -> List[PendingNotification]:
+        """Saca las notificaciones de una ventana. Debe llamarse con el lock tomado."""
+        del self._deadlines[key]
+        return self._pending.pop(key)
+
+    def _send(self, items: List[PendingNotification]) -> None:
+        """Envía las notificaciones de una ventana: el email normal si es una, un resumen si son varias."""
+        from .email_dispatcher import EmailJob, get_dispatcher
+
+        first = items[0]
+        try:
+            subject, html_content = self._compose(items)
+            get_dispatcher().submit(EmailJob(first.recipient_email, subject, html_content),
+                                    on_done=lambda job, sent: self._record(items, sent))
+        except Exception as e:
+            logger.error(f"Error enviando el resumen para {first.recipient_email}: {str(e)}", exc_info=True)
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        self.emails_sent += 1
+        if len(items) > 1:
+            self.digests_sent += 1
+            logger.info(f"Resumen de {len(items)} notificaciones '{first.notification_type}' para {first.recipient_email}")
+
+    @staticmethod
+    def _compose(items: List[PendingNotification]) -> Tuple[str, str]:
+        """Asunto y HTML del email de una ventana."""
+        from .notification_service import render_email
+
+        first = items[0]
+        if len(items) == 1:
+            subject = first.subject
+            html_content = render_email(first.notification_type, first.template_params)
+        else:
+            subject, intro = DIGEST_TEXTS.get(first.notification_type, DEFAULT_DIGEST_TEXTS)
+            subject = subject.format(count=len(items))
+            html_content = email_templates.render_html("digest", {
+                "user_name": first.template_params.get("user_name", ""),
+                "notification_type": first.notification_type,
+                "title": subject,
+                "intro": intro,
+                "items": [item.template_params for item in items],
+                "subjects": [item.subject for item in items]
+            })
+
+        return subject, html_content
+
+    @staticmethod
+    def _record(items: List[PendingNotification], email_sent: bool) -> None:
+        """Registra por separado cada notificación de la ventana y resuelve sus futures."""
+        from .notification_recorder import get_recorder
+
+        try:
+            recorder = get_recorder()
+            for item in items:
+                recorder.add(
+                    user_id=item.user_id,
+                    recipient_email=item.recipient_email,
+                    notification_type=item.notification_type,
+                    subject=item.subject,
+                    booking_id=item.booking_id,
+                    is_sent=email_sent,
+                    template_key=item.notification_type,
+                    template_params=item.template_params
+                )
+        finally:
+            for item in items:
+                item.future.set_result(email_sent)
+
+    def flush_all(self) -> None:
+        """Envía ya todas las ventanas abiertas."""
+        with self._cond:
+            batches = [self._pop(key) for key in list(self._pending)]
+        for items in batches:
+            self._send(items)
+
+    def close(self) -> None:
+        """Detiene el hilo y envía lo pendiente."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        self.flush_all()
+
+    def stats(self) -> dict:
+        """Métricas de agrupación."""
+        with self._cond:
+            return {
+                "window_seconds": self.window_seconds,
+                "types": sorted(self.types),
+                "open_windows": len(self._pending),
+                "pending": sum(len(items) for items in self._pending.values()),
+                "received": self.received,
+                "emails_sent": self.emails_sent,
+                "digests_sent": self.digests_sent
+            }
+
+
+_coalescer: Optional[NotificationCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> NotificationCoalescer:
+    """Agrupador compartido del proceso (se crea en el primer uso)."""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = NotificationCoalescer()
+        return _coalescer
+
+
+def shutdown_coalescer() -> None:
+    """Envía las ventanas abiertas y detiene el agrupador si se llegó a crear."""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is not None:
+            _coalescer.close()
+            _coalescer = None
@@ -0,0 +1,340 @@
+"""
+Registro de notificaciones en bloque.
+
+`create_notification_record` hace add + commit + refresh por cada notificación: en los
+envíos masivos (recordatorios, fan-out de precios) eso supone una transacción por email.
+Este módulo acumula los registros y los escribe con un único INSERT de varias filas:
+
+- `insert_notifications` / `update_notification_status`: escritura en bloque sobre una
+  sesión existente, sin commit (el llamador agrupa la transacción con lo demás).
+- `NotificationRecorder`: buffer seguro entre hilos con su propia sesión, que se vacía
+  al llegar a `max_batch` registros o cada `flush_interval` segundos. Lo usan los
+  hilos del despachador de emails, que no comparten sesión con la petición.
+  Si un volcado falla, sus registros se reintentan uno a uno (en ese volcado y en los
+  siguientes), de modo que una fila inválida (ej. una reserva ya borrada) no bloquea
+  al resto; tras NOTIFICATION_FLUSH_MAX_ATTEMPTS intentos se descarta y queda en el log.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+from .. import models, database
+from .notification_retry_service import initial_status_fields, retry_delay, STATUS_SENT, STATUS_RETRY
+from .task_wakeup import notify_work_due
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 200))
+NOTIFICATION_FLUSH_SECONDS = float(os.getenv("NOTIFICATION_FLUSH_SECONDS", 2))
+NOTIFICATION_FLUSH_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_FLUSH_MAX_ATTEMPTS", 5))
+
+
+def notification_row(
+    user_id: int,
+    recipient_email: str,
+    notification_type: str,
+    subject: str,
+    content: str = None,
+    booking_id: int = None,
+    scheduled_for: datetime = None,
+    is_sent: bool = False,
+    template_key: str = None,
+    template_params: dict = None
+) -> dict:
+    """
+    Fila de la tabla notifications con los mismos campos que create_notification_record.
+    Si se indica template_key, se guardan la plantilla y sus parámetros en lugar del HTML.
+    """
+    now = datetime.utcnow()
+    return {
+        "user_id": user_id,
+        "booking_id": booking_id,
+        "notification_type": notification_type,
+        "subject": subject,
+        "content": None if template_key else content,
+        "template_key": template_key,
+        "template_params": json.dumps(template_params) if template_key else None,
+        "recipient_email": recipient_email,
+        "scheduled_for": scheduled_for,
+        "is_sent": is_sent,
+        "sent_at": now if is_sent else None,
+        "created_at": now,
+        # Si no se envió queda en la cola de reintentos
+        **initial_status_fields(is_sent, now)
+    }
+
+
+def insert_notifications(db: Session, rows: List[dict], batch_size: int = NOTIFICATION_BATCH_SIZE) -> int:
+    """
+    Inserta varias notificaciones con INSERT multi-fila de hasta `batch_size` filas
+    cada uno (para no superar el límite de parámetros por sentencia). No hace commit.
+
+    Args:
+        db: Sesión de base de datos
+        rows: Filas creadas con notification_row
+        batch_size: Filas por sentencia INSERT
+
+    Returns:
+        int: Número de filas insertadas
+    """
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(models.Notification).values(rows[start:start + batch_size]))
+    # Las no enviadas entran en la cola de reintentos: avisar al task worker
+    notify_work_due(db, min((r["next_attempt_at"] for r in rows if r.get("next_attempt_at")), default=None))
+    return len(rows)
+
+
+def update_notification_status(db: Session, notification_ids: Iterable[int], is_sent: bool,
+                               sent_at: Optional[datetime] = None) -> int:
+    """
+    Actualiza is_sent/sent_at (y el estado de reintento) de varias notificaciones con
+    un único UPDATE. No hace commit.
+
+    Args:
+        db: Sesión de base de datos
+        notification_ids: IDs de las notificaciones
+        is_sent: Nuevo estado de envío
+        sent_at: Instante de envío (por defecto ahora si is_sent, None si no)
+
+    Returns:
+        int: Número de filas actualizadas
+    """
+    notification_ids = list(notification_ids)
+    if not notification_ids:
+        return 0
+    now = datetime.utcnow()
+    if is_sent and sent_at is None:
+        sent_at = now
+    first_attempt = now + retry_delay(0)
+
+    result = db.execute(
+        update(models.Notification)
+        .where(models.Notification.notification_id.in_(notification_ids))
+        .values(
+            is_sent=is_sent,
+            sent_at=sent_at if is_sent else None,
+            status=STATUS_SENT if is_sent else STATUS_RETRY,
+            # Sin enviar: conserva el reintento ya programado o aplica el primer backoff
+            next_attempt_at=None if is_sent else func.coalesce(
+                models.Notification.next_attempt_at, first_attempt
+            )
+        )
+    )
+    if not is_sent:
+        notify_work_due(db, first_attempt)
+    return result.rowcount
+
+
+class NotificationRecorder:
+    """
+    Buffer de notificaciones que se vuelca en bloque por tamaño o por tiempo.
+    """
+
+    def __init__(self, max_batch: int = NOTIFICATION_BATCH_SIZE, flush_interval: float = NOTIFICATION_FLUSH_SECONDS,
+                 session_factory: Optional[Callable[[], Session]] = None,
+                 max_attempts: int = NOTIFICATION_FLUSH_MAX_ATTEMPTS):
+        """
+        Args:
+            max_batch: Registros acumulados que provocan un volcado inmediato
+            flush_interval: Segundos máximos que un registro espera en el buffer (0 = sin volcado por tiempo)
+            session_factory: Crea la sesión con la que se escribe (por defecto database.session_local)
+            max_attempts: Intentos individuales de un registro antes de descartarlo
+        """
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+
+        self._rows: List[dict] = []
+        self._status_updates: List[tuple] = []  # (notification_id, is_sent)
+        # Registros de volcados fallidos que se reintentan uno a uno: (fila o actualización, intentos)
+        self._failed_rows: List[Tuple[dict, int]] = []
+        self._failed_updates: List[Tuple[tuple, int]] = []
+        self._lock = threading.Lock()
+        # Serializa los volcados para que no se pisen dos hilos escribiendo a la vez
+        self._flush_lock = threading.Lock()
+
+        self.rows_written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name="notification-recorder", daemon=True)
+            self._thread.start()
+
+    def add(self, **fields) -> None:
+        """Añade una notificación al buffer (mismos argumentos que notification_row)."""
+        with self._lock:
+            self._rows.append(notification_row(**fields))
+            full = len(self._rows) >= self.max_batch
+        if full:
+            self.flush()
+
+    def mark_sent(self, notification_id: int, is_sent: bool = True) -> None:
+        """Encola una actualización de is_sent/sent_at que se aplicará en el próximo volcado."""
+        with self._lock:
+            self._status_updates.append((notification_id, is_sent))
+            full = len(self._status_updates) >= self.max_batch
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        """Registros y actualizaciones a la espera de volcarse."""
+        with self._lock:
+            return (len(self._rows) + len(self._status_updates)
+                    + len(self._failed_rows) + len(self._failed_updates))
+
+    def flush(self) -> int:
+        """
+        Escribe todo lo acumulado en una transacción. Si falla, reintenta sus
+        registros uno a uno junto con los que quedaban de volcados anteriores.
+
+        Returns:
+            int: Notificaciones insertadas
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                status_updates, self._status_updates = self._status_updates, []
+                failed_rows, self._failed_rows = self._failed_rows, []
+                failed_updates, self._failed_updates = self._failed_updates, []
+            if not (rows or status_updates or failed_rows or failed_updates):
+                return 0
+
+            written = 0
+            if rows or status_updates:
+                try:
+                    self._write(rows, status_updates)
+                    written = len(rows)
+                    self.flushes += 1
+                    logger.debug(f"Volcadas {len(rows)} notificaciones y {len(status_updates)} actualizaciones de estado")
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(
+                        f"Error volcando {len(rows)} notificaciones y {len(status_updates)} actualizaciones "
+                        f"(se reintentan una a una): {str(e)}"
+                    )
+                    failed_rows += [(row, 0) for row in rows]
+                    failed_updates += [(status_update, 0) for status_update in status_updates]
+
+            written += self._retry_individually(failed_rows, failed_updates)
+            self.rows_written += written
+            return written
+
+    def _write(self, rows: List[dict], status_updates: List[tuple]) -> None:
+        """Inserta y actualiza en una transacción (la deshace si falla)."""
+        db = (self.session_factory or database.session_local)()
+        try:
+            insert_notifications(db, rows)
+            # Las actualizaciones se agrupan por estado: un UPDATE por cada combinación
+            for is_sent in (True, False):
+                ids = [nid for nid, sent in status_updates if sent == is_sent]
+                update_notification_status(db, ids, is_sent)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _retry_individually(self, failed_rows: List[Tuple[dict, int]],
+                            failed_updates: List[Tuple[tuple, int]]) -> int:
+        """
+        Reintenta cada registro en su propia transacción. Los que vuelven a fallar se
+        guardan para el siguiente volcado hasta agotar max_attempts; después se descartan.
+
+        Returns:
+            int: Notificaciones insertadas
+        """
+        written = 0
+        keep_rows, keep_updates = [], []
+        for row, attempts in failed_rows:
+            try:
+                self._write([row], [])
+                written += 1
+            except Exception as e:
+                if attempts + 1 >= self.max_attempts:
+                    self.dropped += 1
+                    logger.error(
+                        f"✗ Notificación descartada tras {attempts + 1} intentos de registro: "
+                        f"user_id={row.get('user_id')}, booking_id={row.get('booking_id')}, "
+                        f"tipo={row.get('notification_type')}, email={row.get('recipient_email')}: {str(e)}"
+                    )
+                else:
+                    keep_rows.append((row, attempts + 1))
+
+        for status_update, attempts in failed_updates:
+            try:
+                self._write([], [status_update])
+            except Exception as e:
+                if attempts + 1 >= self.max_attempts:
+                    self.dropped += 1
+                    logger.error(
+                        f"✗ Actualización de estado descartada tras {attempts + 1} intentos: "
+                        f"notification_id={status_update[0]}, is_sent={status_update[1]}: {str(e)}"
+                    )
+                else:
+                    keep_updates.append((status_update, attempts + 1))
+
+        if keep_rows or keep_updates:
+            with self._lock:
+                self._failed_rows.extend(keep_rows)
+                self._failed_updates.extend(keep_updates)
+        return written
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Detiene el volcado periódico y escribe lo pendiente."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        logger.info(f"Registro de notificaciones detenido ({self.rows_written} escritas en {self.flushes} volcados)")
+
+    def stats(self) -> dict:
+        """Métricas del buffer."""
+        with self._lock:
+            return {
+                "buffered": len(self._rows),
+                "status_updates_buffered": len(self._status_updates),
+                "retrying": len(self._failed_rows) + len(self._failed_updates),
+                "rows_written": self.rows_written,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "dropped": self.dropped
+            }
+
+
+_recorder: Optional[NotificationRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> NotificationRecorder:
+    """Buffer compartido del proceso (se crea en el primer uso)."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = NotificationRecorder()
+        return _recorder
+
+
+def shutdown_recorder() -> None:
+    """Vuelca lo pendiente y detiene el buffer compartido si se llegó a crear."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is not None:
+            _recorder.close()
+            _recorder = None
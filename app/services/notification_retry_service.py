@@ -0,0 +1,231 @@
+"""
+Reintentos de notificaciones cuyo email no se pudo enviar.
+
+Cuando un envío falla, la notificación se registra con status='retry' y un
+`next_attempt_at`. El task worker procesa por lotes las que ya toca reintentar:
+
+- Backoff exponencial: base * 2^reintentos, con tope NOTIFICATION_RETRY_MAX_SECONDS.
+- Jitter: el retraso real es aleatorio entre la mitad y el total, para que los fallos
+  de una caída del servidor SMTP no se reintenten todos a la vez al volver.
+- Tras NOTIFICATION_MAX_RETRIES reintentos fallidos la notificación pasa a 'dead'
+  (dead-letter) y ya no se reintenta; se puede reactivar con requeue_dead.
+- Con el circuit breaker SMTP abierto no se procesa el lote: no tiene sentido
+  gastar reintentos contra un servidor que sabemos caído.
+- Varios procesos (task workers, el endpoint de administración) pueden procesar
+  reintentos a la vez: cada lote se reclama con FOR UPDATE SKIP LOCKED y su
+  next_attempt_at se adelanta NOTIFICATION_RETRY_LEASE_SECONDS antes de enviar,
+  así que nadie más lo toma mientras tanto (ni si el proceso muere a medias).
+"""
+
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from .task_wakeup import notify_work_due
+
+logger = logging.getLogger(__name__)
+
+STATUS_SENT = "sent"
+STATUS_RETRY = "retry"
+STATUS_DEAD = "dead"
+
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", 60))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", 3600))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", 6))
+NOTIFICATION_RETRY_BATCH_SIZE = int(os.getenv("NOTIFICATION_RETRY_BATCH_SIZE", 100))
+NOTIFICATION_RETRY_LEASE_SECONDS = int(os.getenv("NOTIFICATION_RETRY_LEASE_SECONDS", 300))
+
+SEND_FAILED_ERROR = "El servidor SMTP no aceptó el email (ver logs)"
+
+
+def retry_delay(retry_count: int) -> timedelta:
+    """
+    Espera antes del siguiente reintento: exponencial con tope y jitter ("equal jitter").
+
+    Args:
+        retry_count: Reintentos ya realizados (0 para el primer reintento)
+    """
+    delay = min(NOTIFICATION_RETRY_MAX_SECONDS, NOTIFICATION_RETRY_BASE_SECONDS * (2 ** retry_count))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def initial_status_fields(is_sent: bool, now: Optional[datetime] = None) -> dict:
+    """
+    Campos de reintento de una notificación recién registrada: 'sent' si se envió,
+    'retry' con su primer intento programado si no.
+    """
+    if is_sent:
+        return {"status": STATUS_SENT, "retry_count": 0, "next_attempt_at": None, "last_error": None}
+    now = now or datetime.utcnow()
+    return {
+        "status": STATUS_RETRY,
+        "retry_count": 0,
+        "next_attempt_at": now + retry_delay(0),
+        "last_error": SEND_FAILED_ERROR
+    }
+
+
+def claim_due_retries(db: Session, batch_size: int = NOTIFICATION_RETRY_BATCH_SIZE,
+                      lease_seconds: int = NOTIFICATION_RETRY_LEASE_SECONDS) -> list:
+    """
+    Reclama un lote de notificaciones vencidas para este proceso.
+
+    La selección usa FOR UPDATE SKIP LOCKED (en PostgreSQL) y el next_attempt_at de las
+    filas reclamadas se adelanta al fin de la reserva; el UPDATE solo toma filas aún
+    vencidas, lo que también evita duplicados en bases sin bloqueo de filas.
+
+    Returns:
+        list: Notificaciones reclamadas, por orden de vencimiento
+    """
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    due = (models.Notification.status == STATUS_RETRY, models.Notification.next_attempt_at <= now)
+
+    ids = [notification_id for notification_id, in db.query(models.Notification.notification_id).filter(*due)
+           .order_by(models.Notification.next_attempt_at).limit(batch_size)
+           .with_for_update(skip_locked=True).all()]
+    if not ids:
+        db.commit()
+        return []
+
+    db.execute(
+        update(models.Notification)
+        .where(models.Notification.notification_id.in_(ids), *due)
+        .values(next_attempt_at=lease_until)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    # Releer tras el commit: solo las que ganó este proceso (las que llevan su reserva)
+    return db.query(models.Notification).filter(
+        models.Notification.notification_id.in_(ids),
+        models.Notification.next_attempt_at == lease_until
+    ).order_by(models.Notification.notification_id).all()
+
+
+def process_notification_retries(db: Session, batch_size: int = NOTIFICATION_RETRY_BATCH_SIZE) -> dict:
+    """
+    Reintenta un lote de notificaciones vencidas, enviándolas en paralelo con el despachador.
+
+    Args:
+        db: Sesión de base de datos
+        batch_size: Notificaciones como máximo en este lote
+
+    Returns:
+        dict: {"processed", "sent", "rescheduled", "dead", "skipped"}
+    """
+    from .email_dispatcher import EmailJob, get_dispatcher
+    from .notification_service import render_notification_content, smtp_pool
+    from .smtp_pool import CircuitBreaker
+
+    stats = {"processed": 0, "sent": 0, "rescheduled": 0, "dead": 0, "skipped": False}
+
+    if smtp_pool.breaker.state == CircuitBreaker.OPEN:
+        logger.warning("Circuit breaker SMTP abierto: se pospone el lote de reintentos")
+        stats["skipped"] = True
+        return stats
+
+    notifications = claim_due_retries(db, batch_size)
+
+    if not notifications:
+        return stats
+
+    # Preparar y enviar en paralelo; los resultados se escriben aquí en bloque
+    dispatcher = get_dispatcher()
+    attempts = []
+    for notification in notifications:
+        try:
+            html_content = render_notification_content(notification)
+        except Exception as e:
+            attempts.append((notification, None, f"No se pudo generar el contenido: {str(e)}"))
+            continue
+        job = EmailJob(notification.recipient_email, notification.subject, html_content)
+        attempts.append((notification, dispatcher.submit(job), None))
+
+    now = datetime.utcnow()
+    updates = []
+    for notification, future, error in attempts:
+        sent = future.result() if future is not None else False
+        if sent:
+            updates.append({
+                "notification_id": notification.notification_id,
+                "status": STATUS_SENT, "is_sent": True, "sent_at": now,
+                "next_attempt_at": None, "last_error": None,
+                "retry_count": notification.retry_count + 1
+            })
+            stats["sent"] += 1
+            continue
+
+        retry_count = notification.retry_count + 1
+        row = {
+            "notification_id": notification.notification_id,
+            "retry_count": retry_count,
+            "last_error": error or SEND_FAILED_ERROR
+        }
+        # Un error al generar el contenido no se arregla reintentando
+        if retry_count >= NOTIFICATION_MAX_RETRIES or error:
+            row.update(status=STATUS_DEAD, next_attempt_at=None)
+            stats["dead"] += 1
+            logger.error(
+                f"✗ Notificación {notification.notification_id} a {notification.recipient_email} "
+                f"descartada tras {retry_count} reintentos: {row['last_error']}"
+            )
+        else:
+            row.update(next_attempt_at=now + retry_delay(retry_count))
+            stats["rescheduled"] += 1
+        updates.append(row)
+
+    # UPDATE en bloque por clave primaria y un único commit para todo el lote
+    db.execute(update(models.Notification), updates)
+    notify_work_due(db, min((row["next_attempt_at"] for row in updates if row.get("next_attempt_at")), default=None))
+    db.commit()
+
+    stats["processed"] = len(attempts)
+    logger.info(
+        f"Reintentos de notificaciones: {stats['sent']} enviadas, "
+        f"{stats['rescheduled']} reprogramadas, {stats['dead']} descartadas"
+    )
+    return stats
+
+
+def requeue_dead(db: Session, notification_ids: Optional[list] = None) -> int:
+    """
+    Vuelve a poner en cola notificaciones descartadas (todas si no se indican IDs).
+
+    Returns:
+        int: Notificaciones reactivadas
+    """
+    query = update(models.Notification).where(models.Notification.status == STATUS_DEAD)
+    if notification_ids is not None:
+        query = query.where(models.Notification.notification_id.in_(notification_ids))
+    now = datetime.utcnow()
+    result = db.execute(query.values(status=STATUS_RETRY, retry_count=0, next_attempt_at=now))
+    if result.rowcount:
+        notify_work_due(db, now)
+    db.commit()
+    return result.rowcount
+
+
+def get_retry_statistics(db: Session) -> dict:
+    """Notificaciones por estado de reintento y cuántas están ya vencidas."""
+    counts = dict(
+        db.query(models.Notification.status, func.count(models.Notification.notification_id))
+        .filter(models.Notification.status.in_([STATUS_RETRY, STATUS_DEAD]))
+        .group_by(models.Notification.status)
+        .all()
+    )
+    due = db.query(func.count(models.Notification.notification_id)).filter(
+        models.Notification.status == STATUS_RETRY,
+        models.Notification.next_attempt_at <= datetime.utcnow()
+    ).scalar()
+    return {
+        "pending_retry": counts.get(STATUS_RETRY, 0),
+        "due_now": due or 0,
+        "dead": counts.get(STATUS_DEAD, 0)
+    }
@@ -7,14 +7,21 @@ Soporta diferentes tipos de notificaciones:
 - Actualización de precios
 """
 
+import base64
+import json
 import smtplib
 import logging
+import zlib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
 from datetime import datetime
 from sqlalchemy.orm import Session
 from .. import models
+from .smtp_pool import SMTPConnectionPool, CircuitBreaker, SMTPCircuitOpenError
+from . import email_templates
+from .notification_retry_service import initial_status_fields
+from .task_wakeup import notify_work_due
 import os
 
 logger = logging.getLogger(__name__)
@@ -65,24 +72,56 @@ if SENDER_PASSWORD:
     ):
         SENDER_PASSWORD = SENDER_PASSWORD[1:-1]
 
+# STARTTLS y login se pueden desactivar (ej. servidor SMTP local de pruebas)
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() != "false"
+SMTP_USE_LOGIN = os.getenv("SMTP_USE_LOGIN", "true").lower() != "false"
+
+# Pool de conexiones persistentes y circuit breaker
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_POOL_IDLE_SECONDS = float(os.getenv("SMTP_POOL_IDLE_SECONDS", 60))
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 10))
+SMTP_BREAKER_FAILURES = int(os.getenv("SMTP_BREAKER_FAILURES", 5))
+SMTP_BREAKER_RESET_SECONDS = float(os.getenv("SMTP_BREAKER_RESET_SECONDS", 30))
+
 # Log configuración SMTP al cargar el módulo
 logger.info(
     f"SMTP Configuration loaded: "
     f"server={SMTP_SERVER}, "
     f"port={SMTP_PORT}, "
     f"sender={SENDER_EMAIL}, "
-    f"password_set={bool(SENDER_PASSWORD)}"
+    f"password_set={bool(SENDER_PASSWORD)}, "
+    f"tls={SMTP_USE_TLS}, login={SMTP_USE_LOGIN}, pool_size={SMTP_POOL_SIZE}"
+)
+
+# No abre ninguna conexión hasta el primer envío
+smtp_pool = SMTPConnectionPool(
+    host=SMTP_SERVER,
+    port=SMTP_PORT,
+    username=SENDER_EMAIL,
+    password=SENDER_PASSWORD,
+    use_tls=SMTP_USE_TLS,
+    use_login=SMTP_USE_LOGIN,
+    max_size=SMTP_POOL_SIZE,
+    idle_timeout=SMTP_POOL_IDLE_SECONDS,
+    connect_timeout=SMTP_TIMEOUT_SECONDS,
+    breaker=CircuitBreaker(SMTP_BREAKER_FAILURES, SMTP_BREAKER_RESET_SECONDS)
 )
 
 
-def send_email(to_email: str, subject: str, html_content: str) -> bool:
+def shutdown_smtp_pool() -> None:
+    """Cierra las conexiones SMTP persistentes (al apagar la aplicación)."""
+    smtp_pool.close_all()
+
+
+def send_email(to_email: str, subject: str, html_content: str, text_content: str = None) -> bool:
     """
-    Envía un email SMTP.
+    Envía un email SMTP con parte HTML y alternativa en texto plano.
     
     Args:
         to_email: Dirección de correo del destinatario
         subject: Asunto del email
         html_content: Contenido HTML del email
+        text_content: Versión en texto plano (por defecto se genera a partir del HTML)
         
     Returns:
         bool: True si se envió correctamente, False si hubo error
@@ -94,8 +133,11 @@ def send_email(to_email: str, subject: str, html_content: str) -> bool:
         message["From"] = formataddr((FRIENDLY_SENMDER_NAME, SENDER_EMAIL))
         message["To"] = to_email
         
-        # Adjuntar contenido HTML
-        html_part = MIMEText(html_content, "html")
+        # Adjuntar texto plano y HTML (en multipart/alternative la última parte es la preferida)
+        if text_content is None:
+            text_content = email_templates.html_to_text(html_content)
+        message.attach(MIMEText(text_content, "plain", "utf-8"))
+        html_part = MIMEText(html_content, "html", "utf-8")
         message.attach(html_part)
         
         logger.debug(f"SMTP_SERVER: {SMTP_SERVER}")
@@ -105,15 +147,15 @@ def send_email(to_email: str, subject: str, html_content: str) -> bool:
         logger.debug(f"SENDER_PASSWORD: {SENDER_PASSWORD}")
 
 
-        # Enviar email
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, to_email, message.as_string())
+        # Enviar email por una conexión persistente del pool (ya autenticada)
+        smtp_pool.send(SENDER_EMAIL, to_email, message.as_string())
         
         logger.info(f"Email enviado exitosamente a {to_email}: {subject}")
         return True
         
+    except SMTPCircuitOpenError as e:
+        logger.error(f"Email a {to_email} no enviado: {str(e)}")
+        return False
     except smtplib.SMTPAuthenticationError as e:
         logger.error(
             f"Error de autenticación SMTP al enviar a {to_email}. "
@@ -140,10 +182,12 @@ def create_notification_record(
     recipient_email: str,
     notification_type: str,
     subject: str,
-    content: str,
+    content: str = None,
     booking_id: int = None,
     scheduled_for: datetime = None,
-    is_sent: bool = False
+    is_sent: bool = False,
+    template_key: str = None,
+    template_params: dict = None
 ) -> models.Notification:
     """
     Crea un registro de notificación en la base de datos.
@@ -154,10 +198,12 @@ def create_notification_record(
         recipient_email: Email del destinatario
         notification_type: Tipo de notificación ('booking_confirmation', 'reminder_24h', etc)
         subject: Asunto del email
-        content: Contenido del email
+        content: Contenido del email (solo si no se indica template_key)
         booking_id: ID de la reserva asociada (opcional)
         scheduled_for: Fecha/hora en la que se debe enviar (si es programada)
         is_sent: Si ya fue enviada
+        template_key: Plantilla del email; se guarda con sus parámetros en lugar del HTML
+        template_params: Parámetros de la plantilla
         
     Returns:
         models.Notification: Objeto de notificación creado
@@ -167,14 +213,19 @@ def create_notification_record(
         booking_id=booking_id,
         notification_type=notification_type,
         subject=subject,
-        content=content,
+        content=None if template_key else content,
+        template_key=template_key,
+        template_params=json.dumps(template_params) if template_key else None,
         recipient_email=recipient_email,
         scheduled_for=scheduled_for,
         is_sent=is_sent,
-        sent_at=datetime.utcnow() if is_sent else None
+        sent_at=datetime.utcnow() if is_sent else None,
+        # Si no se envió queda en la cola de reintentos
+        **initial_status_fields(is_sent)
     )
     
     db.add(notification)
+    notify_work_due(db, notification.next_attempt_at)
     db.commit()
     db.refresh(notification)
     
@@ -189,24 +240,33 @@ def send_and_record_notification(
     recipient_email: str,
     notification_type: str,
     subject: str,
-    html_content: str,
-    booking_id: int = None
+    html_content: str = None,
+    booking_id: int = None,
+    template_params: dict = None
 ) -> bool:
     """
     Envía un email Y crea el registro en la base de datos.
     
+    Si se pasan template_params, el HTML se genera con la plantilla del tipo de
+    notificación y en la BD solo se guardan los parámetros.
+    
     Args:
         db: Sesión de base de datos
         user_id: ID del usuario
         recipient_email: Email del destinatario
         notification_type: Tipo de notificación
         subject: Asunto del email
-        html_content: Contenido HTML del email
+        html_content: Contenido HTML del email (si no se usa plantilla)
         booking_id: ID de la reserva (opcional)
+        template_params: Parámetros de la plantilla `notification_type`
         
     Returns:
         bool: True si se envió correctamente
     """
+    template_key = notification_type if template_params is not None else None
+    if template_key:
+        html_content = render_email(template_key, template_params)
+    
     # Intenta enviar el email
     email_sent = send_email(recipient_email, subject, html_content)
     
@@ -220,188 +280,163 @@ def send_and_record_notification(
         content=html_content,
         booking_id=booking_id,
         is_sent=email_sent,
-        scheduled_for=None
+        scheduled_for=None,
+        template_key=template_key,
+        template_params=template_params
     )
     
     return email_sent
 
 
+def dispatch_and_record_notification(
+    user_id: int,
+    recipient_email: str,
+    notification_type: str,
+    subject: str,
+    html_content: str = None,
+    booking_id: int = None,
+    template_params: dict = None
+):
+    """
+    Versión asíncrona de send_and_record_notification: encola el email en el
+    despachador y registra la notificación cuando termina el envío, sin bloquear
+    la petición HTTP mientras se habla con el servidor SMTP.
+
+    El registro se acumula en el buffer de notificaciones, que lo escribe en bloque
+    junto con los de otros envíos.
+
+    Si la cola del despachador sigue llena tras EMAIL_DISPATCH_SUBMIT_TIMEOUT segundos,
+    no se espera más: la notificación se registra como no enviada y el task worker
+    la reintenta (ver notification_retry_service).
+
+    Si la agrupación está activa para este tipo (ver notification_digest), la
+    notificación espera en la ventana de su usuario y puede salir en un resumen.
+
+    Returns:
+        Future: Se resuelve con True/False según se haya enviado o no
+    """
+    from concurrent.futures import Future
+    from .email_dispatcher import EMAIL_DISPATCH_SUBMIT_TIMEOUT, DispatcherBusyError, EmailJob, get_dispatcher
+    from .notification_recorder import get_recorder
+    from .notification_digest import get_coalescer
+
+    if template_params is not None and get_coalescer().accepts(notification_type):
+        return get_coalescer().add(
+            user_id=user_id,
+            recipient_email=recipient_email,
+            notification_type=notification_type,
+            subject=subject,
+            template_params=template_params,
+            booking_id=booking_id
+        )
+
+    template_key = notification_type if template_params is not None else None
+    if template_key:
+        html_content = render_email(template_key, template_params)
+
+    def record(job, email_sent):
+        get_recorder().add(
+            user_id=user_id,
+            recipient_email=recipient_email,
+            notification_type=notification_type,
+            subject=subject,
+            content=html_content,
+            booking_id=booking_id,
+            is_sent=email_sent,
+            template_key=template_key,
+            template_params=template_params
+        )
+
+    job = EmailJob(recipient_email, subject, html_content)
+    try:
+        return get_dispatcher().submit(job, on_done=record, timeout=EMAIL_DISPATCH_SUBMIT_TIMEOUT)
+    except DispatcherBusyError as e:
+        logger.warning(f"⚠️  {str(e)}: la notificación a {recipient_email} queda para reintento")
+        record(job, False)
+        future = Future()
+        future.set_result(False)
+        return future
+
+
 # ============================================================
-# TEMPLATES DE EMAILS (Funciones que generan HTML)
+# TEMPLATES DE EMAILS (plantillas Jinja2 en app/templates/emails/)
 # ============================================================
 
 def generate_booking_confirmation_email(user_name: str, court_number: int, start_time: str, end_time: str, price: float) -> str:
     """Genera HTML para confirmación de reserva."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #2ecc71; text-align: center;">✓ Reserva Confirmada</h2>
-                
-                <p>Hola <strong>{user_name}</strong>,</p>
-                
-                <p>Tu reserva ha sido confirmada exitosamente. Aquí están los detalles:</p>
-                
-                <div style="background-color: #f0f8ff; padding: 15px; border-left: 4px solid #2ecc71; margin: 20px 0;">
-                    <p><strong>📍 Pista:</strong> Pista {court_number}</p>
-                    <p><strong>📅 Fecha y Hora:</strong> {start_time} - {end_time}</p>
-                    <p><strong>💰 Precio:</strong> ${price:.2f}</p>
-                </div>
-                
-                <p style="color: #555; font-size: 14px;">
-                    <strong>⚠️ Recuerda:</strong> Puedes cancelar tu reserva hasta 24 horas antes de la hora de inicio sin penalización.
-                </p>
-                
-                <p>¡Disfruta tu actividad!</p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
-    """
+    return email_templates.render_html("booking_confirmation", {
+        "user_name": user_name, "court_number": court_number,
+        "start_time": start_time, "end_time": end_time, "price": price
+    })
 
 
 def generate_welcome_email(user_name: str) -> str:
     """Genera HTML para el email de bienvenida de un nuevo usuario."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #2c3e50; text-align: center;">¡Bienvenido a Reserva de pistas!</h2>
-
-                <p>Hola <strong>{user_name}</strong>,</p>
-
-                <p>Gracias por registrarte en nuestra plataforma. Ya puedes comenzar a reservar pistas, gestionar tus reservas y disfrutar de tus actividades deportivas con facilidad.</p>
-
-                <div style="background-color: #f0f8ff; padding: 15px; border-left: 4px solid #3498db; margin: 20px 0;">
-                    <p><strong>📌 Próximos pasos:</strong></p>
-                    <ul>
-                        <li>Explora las pistas disponibles.</li>
-                        <li>Reserva horarios que se adapten a ti.</li>
-                        <li>Recibe notificaciones de tus reservas y recordatorios.</li>
-                    </ul>
-                </div>
-
-                <p>Si necesitas ayuda, puedes contactarnos desde la plataforma.</p>
-
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
-    """
+    return email_templates.render_html("welcome_email", {"user_name": user_name})
 
 
 def generate_password_reset_email(user_name: str, reset_link: str) -> str:
     """Genera HTML para el email de restablecimiento de contraseña."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #3498db; text-align: center;">🔒 Restablece tu contraseña</h2>
-
-                <p>Hola <strong>{user_name}</strong>,</p>
-
-                <p>Recibimos una solicitud de restablecimiento de contraseña para tu cuenta. Haz clic en el siguiente enlace para establecer una nueva contraseña:</p>
-
-                <p style="text-align: center; margin: 30px 0;">
-                    <a href="{reset_link}" style="display: inline-block; background-color: #3498db; color: white; padding: 12px 25px; border-radius: 5px; text-decoration: none;">Restablecer contraseña</a>
-                </p>
-
-                <p>Si no solicitaste este cambio, puedes ignorar este correo.</p>
-
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
-    """
+    return email_templates.render_html("password_reset", {"user_name": user_name, "reset_link": reset_link})
 
 
 def generate_reminder_email(user_name: str, court_number: int, start_time: str) -> str:
     """Genera HTML para recordatorio 24h antes."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #f39c12; text-align: center;">⏰ Recordatorio de Reserva</h2>
-                
-                <p>Hola <strong>{user_name}</strong>,</p>
-                
-                <p>Tu reserva está a pocas horas. ¡No olvides los detalles!</p>
-                
-                <div style="background-color: #fffacd; padding: 15px; border-left: 4px solid #f39c12; margin: 20px 0;">
-                    <p><strong>📍 Pista:</strong> Pista {court_number}</p>
-                    <p><strong>📅 Hora:</strong> Mañana a las {start_time}</p>
-                </div>
-                
-                <p style="color: #555; font-size: 14px;">
-                    Llega 10 minutos antes de tu horario. ¡Esperamos verte!
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
-    """
+    return email_templates.render_html("reminder_24h", {
+        "user_name": user_name, "court_number": court_number, "start_time": start_time
+    })
 
 
 def generate_cancellation_email(user_name: str, court_number: int, start_time: str, refund_amount: float) -> str:
     """Genera HTML para cancelación de reserva."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #e74c3c; text-align: center;">✗ Reserva Cancelada</h2>
-                
-                <p>Hola <strong>{user_name}</strong>,</p>
-                
-                <p>Tu reserva ha sido cancelada.</p>
-                
-                <div style="background-color: #ffe0e0; padding: 15px; border-left: 4px solid #e74c3c; margin: 20px 0;">
-                    <p><strong>📍 Pista:</strong> Pista {court_number}</p>
-                    <p><strong>📅 Fecha:</strong> {start_time}</p>
-                    <p><strong>💰 Reembolso:</strong> ${refund_amount:.2f}</p>
-                </div>
-                
-                <p style="color: #555; font-size: 14px;">
-                    El reembolso será procesado en 3-5 días hábiles.
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
-    """
+    return email_templates.render_html("cancellation", {
+        "user_name": user_name, "court_number": court_number,
+        "start_time": start_time, "refund_amount": refund_amount
+    })
 
 
 def generate_price_update_email(user_name: str, new_price: float, time_slot: str) -> str:
     """Genera HTML para notificación de cambio de precio."""
-    return f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #3498db; text-align: center;">💰 Actualización de Precios</h2>
-                
-                <p>Hola <strong>{user_name}</strong>,</p>
-                
-                <p>Nos complace informarte que hemos actualizado nuestras tarifas.</p>
-                
-                <div style="background-color: #e3f2fd; padding: 15px; border-left: 4px solid #3498db; margin: 20px 0;">
-                    <p><strong>⏰ Horario:</strong> {time_slot}</p>
-                    <p><strong>💰 Nuevo Precio:</strong> ${new_price:.2f}</p>
-                </div>
-                
-                <p style="color: #555; font-size: 14px;">
-                    Consulta nuestra página de reservas para ver todos los horarios y precios actualizados.
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-                <p style="color: #888; font-size: 12px; text-align: center;">Court Rent - Sistema de Reservas</p>
-            </div>
-        </body>
-    </html>
+    return email_templates.render_html("price_update", {
+        "user_name": user_name, "new_price": new_price, "time_slot": time_slot
+    })
+
+
+# ============================================================
+# PLANTILLAS GUARDADAS (clave + parámetros en lugar del HTML)
+# ============================================================
+
+# Las notificaciones guardan solo la clave de plantilla (igual al tipo de notificación,
+# ver email_templates.EMAIL_TEMPLATE_FILES) y sus parámetros; el HTML se genera al consultarlas.
+
+# Notificaciones antiguas migradas: el HTML original comprimido (zlib + base64)
+LEGACY_HTML_TEMPLATE = "legacy_html"
+
+
+def render_email(template_key: str, params: dict) -> str:
+    """
+    Genera el HTML de una plantilla. Lanza KeyError si la plantilla no existe.
+    """
+    if template_key == LEGACY_HTML_TEMPLATE:
+        return decompress_html(params["html_z"])
+    return email_templates.render_html(template_key, params)
+
+
+def compress_html(html: str) -> str:
+    """Comprime un HTML para guardarlo como texto (zlib + base64)."""
+    return base64.b64encode(zlib.compress(html.encode("utf-8"), 9)).decode("ascii")
+
+
+def decompress_html(data: str) -> str:
+    """Inversa de compress_html."""
+    return zlib.decompress(base64.b64decode(data)).decode("utf-8")
+
+
+def render_notification_content(notification: models.Notification) -> str:
+    """
+    HTML de una notificación guardada, generado a partir de su plantilla o
+    tal cual si es una notificación antigua sin migrar.
     """
+    if notification.template_key:
+        return render_email(notification.template_key, json.loads(notification.template_params or "{}"))
+    return notification.content or ""
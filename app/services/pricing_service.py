@@ -0,0 +1,431 @@
+"""
+Servicio de resolución y programación de precios.
+
+El precio de una franja depende de su nivel de demanda (cuadrante) y de la versión
+de precio vigente para esa demanda en el instante de la franja. Las versiones de
+precio de cada demanda se convierten en una línea temporal de intervalos sin
+solapes (PriceTimeline), de forma que el precio de cualquier instante se obtiene
+con una búsqueda binaria en memoria en lugar de una consulta por franja.
+
+Las líneas temporales de todas las demandas se mantienen cacheadas y ligadas a una
+versión guardada en system_state: cualquier cambio de precios (programar, editar o
+cancelar una versión futura) incrementa la versión y todos los procesos recargan.
+
+Las versiones de una demanda forman una cadena: cada una termina cuando empieza la
+siguiente. Una versión cancelada se conserva con un intervalo vacío
+(end_date == start_date) por si alguna reserva ya la había registrado.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import logging
+import os
+from .. import crud, models
+from .cache_service import VersionedCache
+from .holiday_service import get_day_slots
+
+logger = logging.getLogger(__name__)
+
+# Máximo de franjas que se pueden presupuestar en una sola petición
+MAX_QUOTE_SLOTS = 500
+
+PRICE_VERSION_KEY = "price.version"
+
+# Cada cuánto se comprueba si otro proceso ha cambiado los precios
+PRICE_CACHE_CHECK_SECONDS = float(os.getenv("PRICE_CACHE_CHECK_SECONDS", 5))
+
+_timeline_cache = VersionedCache("price_timeline", PRICE_CACHE_CHECK_SECONDS)
+
+
+class PriceTimeline:
+    """
+    Línea temporal de precios de un nivel de demanda.
+
+    Se construye a partir de las versiones de precio (que pueden solaparse) y guarda
+    intervalos consecutivos sin solapes [inicio, fin) -> (price_id, importe), con la
+    misma regla que la consulta original: entre las versiones que cubren un instante
+    gana la de fecha de inicio más reciente.
+    """
+
+    def __init__(self, prices: Iterable[Tuple[datetime, Optional[datetime], int, float]]):
+        """
+        Args:
+            prices: Versiones como tuplas (start_date, end_date, price_id, amount)
+        """
+        prices = list(prices)
+        boundaries = sorted({p[0] for p in prices} | {p[1] for p in prices if p[1] is not None})
+
+        self._starts: List[datetime] = []
+        self._ends: List[Optional[datetime]] = []
+        self._values: List[Tuple[int, float]] = []
+
+        for index, start in enumerate(boundaries):
+            end = boundaries[index + 1] if index + 1 < len(boundaries) else None
+            covering = [p for p in prices if p[0] <= start and (p[1] is None or p[1] > start)]
+            if not covering:
+                continue
+            winner = max(covering, key=lambda p: p[0])
+            value = (winner[2], winner[3])
+
+            # Fusionamos con el intervalo anterior si es contiguo y con el mismo precio
+            if self._values and self._values[-1] == value and self._ends[-1] == start:
+                self._ends[-1] = end
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+                self._values.append(value)
+
+    def lookup(self, at: datetime) -> Optional[Tuple[int, float]]:
+        """
+        Precio vigente en un instante.
+
+        Returns:
+            Optional[Tuple[int, float]]: (price_id, importe) o None si no hay precio
+        """
+        index = bisect_right(self._starts, at) - 1
+        if index < 0:
+            return None
+        end = self._ends[index]
+        if end is not None and at >= end:
+            return None
+        return self._values[index]
+
+    def intervals(self) -> list:
+        """Intervalos de la línea temporal como tuplas (inicio, fin, price_id, importe)."""
+        return [
+            (start, end, value[0], value[1])
+            for start, end, value in zip(self._starts, self._ends, self._values)
+        ]
+
+
+def get_price_version(db: Session) -> str:
+    """Versión actual de los precios ("0" si nunca se han programado por API)."""
+    return crud.get_state_value(db, PRICE_VERSION_KEY) or "0"
+
+
+def _load_price_timelines(db: Session) -> Dict[int, PriceTimeline]:
+    rows = db.query(
+        models.Price.demand_id, models.Price.start_date, models.Price.end_date,
+        models.Price.price_id, models.Price.amount
+    ).all()
+
+    by_demand: Dict[int, list] = {}
+    for demand_id, start_date, end_date, price_id, amount in rows:
+        by_demand.setdefault(demand_id, []).append((start_date, end_date, price_id, amount))
+
+    return {demand_id: PriceTimeline(prices) for demand_id, prices in by_demand.items()}
+
+
+def get_price_timelines(db: Session) -> Dict[int, PriceTimeline]:
+    """
+    Líneas temporales cacheadas de todas las demandas.
+
+    Returns:
+        Dict[int, PriceTimeline]: {demand_id: línea temporal}
+    """
+    return _timeline_cache.get(
+        version_loader=lambda: get_price_version(db),
+        loader=lambda: _load_price_timelines(db)
+    )
+
+
+def get_price_at(db: Session, demand_id: int, at: datetime) -> Optional[Tuple[int, float]]:
+    """
+    Precio de una demanda en un instante, sin consultar la base de datos.
+
+    Returns:
+        Optional[Tuple[int, float]]: (price_id, importe) o None si no hay precio
+    """
+    timeline = get_price_timelines(db).get(demand_id)
+    return timeline.lookup(at) if timeline else None
+
+
+def get_current_price_ids(db: Session) -> Dict[int, int]:
+    """Versión vigente ahora mismo para cada demanda: {demand_id: price_id}."""
+    now = datetime.utcnow()
+    current = {}
+    for demand_id, timeline in get_price_timelines(db).items():
+        price = timeline.lookup(now)
+        if price:
+            current[demand_id] = price[0]
+    return current
+
+
+def sync_active_flags(db: Session) -> int:
+    """
+    Alinea la columna is_active con la versión vigente de cada demanda (la que
+    indica la línea temporal). Necesario cuando una versión programada entra en vigor.
+    No hace commit.
+
+    Returns:
+        int: Número de filas modificadas
+    """
+    current_ids = list(get_current_price_ids(db).values())
+
+    changed = db.query(models.Price).filter(
+        models.Price.is_active == True,
+        models.Price.price_id.notin_(current_ids)
+    ).update({models.Price.is_active: False}, synchronize_session=False)
+    changed += db.query(models.Price).filter(
+        models.Price.is_active == False,
+        models.Price.price_id.in_(current_ids)
+    ).update({models.Price.is_active: True}, synchronize_session=False)
+
+    if changed:
+        logger.info(f"Indicadores is_active de precios sincronizados ({changed} filas)")
+    return changed
+
+
+def _publish_price_change(db: Session) -> None:
+    """Incrementa la versión, confirma la transacción y recarga la caché local."""
+    crud.increment_state_counter(db, PRICE_VERSION_KEY)
+    db.commit()
+    _timeline_cache.invalidate()
+    sync_active_flags(db)
+    db.commit()
+
+
+def _is_cancelled(price: models.Price) -> bool:
+    return price.end_date is not None and price.end_date <= price.start_date
+
+
+def _chain(db: Session, demand_id: int) -> List[models.Price]:
+    """Versiones no canceladas de una demanda ordenadas por fecha de inicio."""
+    prices = db.query(models.Price).filter(
+        models.Price.demand_id == demand_id
+    ).order_by(models.Price.start_date).all()
+    return [p for p in prices if not _is_cancelled(p)]
+
+
+def get_price_status(price: models.Price, now: Optional[datetime] = None) -> str:
+    """Estado de una versión: "cancelled", "scheduled", "current" o "expired"."""
+    now = now or datetime.utcnow()
+    if _is_cancelled(price):
+        return "cancelled"
+    if price.start_date > now:
+        return "scheduled"
+    if price.end_date is None or price.end_date > now:
+        return "current"
+    return "expired"
+
+
+def list_price_versions(db: Session, demand_id: Optional[int] = None) -> List[dict]:
+    """
+    Versiones de precio (pasadas, vigente y programadas) con su estado.
+
+    Args:
+        db: Sesión de base de datos
+        demand_id: Limitar a una demanda (por defecto todas)
+
+    Returns:
+        List[dict]: Versiones ordenadas por demanda y fecha de inicio
+    """
+    query = db.query(models.Price)
+    if demand_id is not None:
+        query = query.filter(models.Price.demand_id == demand_id)
+    now = datetime.utcnow()
+
+    return [{
+        "price_id": p.price_id,
+        "demand_id": p.demand_id,
+        "amount": p.amount,
+        "start_date": p.start_date,
+        "end_date": p.end_date,
+        "description": p.description,
+        "status": get_price_status(p, now)
+    } for p in query.order_by(models.Price.demand_id, models.Price.start_date).all()]
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    """Las fechas se guardan en UTC sin zona horaria: convierte las que traen zona."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _insert_version(db: Session, chain: List[models.Price], demand_id: int, amount: float,
+                    start_date: datetime, description: Optional[str]) -> models.Price:
+    """
+    Valida e inserta una versión en la cadena de su demanda, sin hacer commit.
+
+    Raises:
+        ValueError: Si la fecha es anterior al precio vigente o ya hay una versión en esa fecha
+    """
+    now = datetime.utcnow()
+    current = next((p for p in reversed(chain) if get_price_status(p, now) == "current"), None)
+    if current and start_date < current.start_date:
+        raise ValueError("La fecha de inicio no puede ser anterior a la del precio vigente")
+    if any(p.start_date == start_date for p in chain):
+        raise ValueError("Ya existe una versión de precio que empieza en esa fecha")
+
+    previous = next((p for p in reversed(chain) if p.start_date < start_date), None)
+    following = next((p for p in chain if p.start_date > start_date), None)
+
+    new_price = models.Price(
+        amount=amount,
+        start_date=start_date,
+        end_date=following.start_date if following else None,
+        description=description or (previous or chain[0]).description,
+        is_active=False,
+        demand_id=demand_id
+    )
+    if previous and (previous.end_date is None or previous.end_date > start_date):
+        previous.end_date = start_date
+
+    db.add(new_price)
+    db.flush()
+    return new_price
+
+
+def _cancel_version(db: Session, price: models.Price) -> None:
+    """
+    Cancela una versión programada sin hacer commit; la anterior recupera su fecha de fin.
+
+    Raises:
+        ValueError: Si la versión ya ha entrado en vigor
+    """
+    if get_price_status(price) != "scheduled":
+        raise ValueError("Solo se pueden modificar versiones programadas que aún no han entrado en vigor")
+
+    chain = _chain(db, price.demand_id)
+    previous = next((p for p in reversed(chain) if p.start_date < price.start_date), None)
+    if previous and previous.end_date == price.start_date:
+        previous.end_date = price.end_date
+
+    # Se conserva la fila (puede haber reservas que ya la registraron) con un intervalo vacío
+    price.end_date = price.start_date
+    price.is_active = False
+    db.flush()
+
+
+def schedule_price_version(db: Session, demand_id: int, amount: float, start_date: datetime,
+                           description: Optional[str] = None) -> Optional[models.Price]:
+    """
+    Programa una nueva versión de precio para una demanda.
+
+    La versión se inserta en la cadena: la anterior termina en start_date y la nueva
+    termina donde empiece la siguiente versión programada (o queda abierta). Si
+    start_date ya ha pasado, el cambio es inmediato.
+
+    Args:
+        db: Sesión de base de datos
+        demand_id: Nivel de demanda
+        amount: Nuevo importe
+        start_date: Fecha de entrada en vigor (si trae zona horaria se convierte a UTC)
+        description: Descripción (por defecto la de la versión anterior)
+
+    Returns:
+        Optional[models.Price]: La nueva versión, o None si la demanda no tiene precios
+    """
+    start_date = _to_naive_utc(start_date)
+    chain = _chain(db, demand_id)
+    if not chain:
+        return None
+
+    new_price = _insert_version(db, chain, demand_id, amount, start_date, description)
+    _publish_price_change(db)
+    db.refresh(new_price)
+
+    logger.info(f"Precio programado: {amount} para demand_id={demand_id} desde {start_date} (price_id={new_price.price_id})")
+    return new_price
+
+
+def cancel_scheduled_price(db: Session, price_id: int) -> Optional[models.Price]:
+    """
+    Cancela una versión programada que aún no ha entrado en vigor.
+    La versión anterior recupera su fecha de fin original.
+
+    Returns:
+        Optional[models.Price]: La versión cancelada, o None si no existe
+    """
+    price = db.query(models.Price).filter(models.Price.price_id == price_id).first()
+    if not price:
+        return None
+
+    _cancel_version(db, price)
+    _publish_price_change(db)
+
+    logger.info(f"Precio programado cancelado: price_id={price_id} (demand_id={price.demand_id})")
+    return price
+
+
+def update_scheduled_price(db: Session, price_id: int, amount: Optional[float] = None,
+                           start_date: Optional[datetime] = None) -> Optional[models.Price]:
+    """
+    Modifica el importe y/o la fecha de una versión programada.
+
+    Se implementa como cancelación más nueva versión (nuevo price_id), de modo que las
+    reservas que ya registraron la versión original conservan su importe. Ambas cosas
+    se hacen en la misma transacción: si la nueva versión no es válida no se cancela nada.
+
+    Returns:
+        Optional[models.Price]: La versión que la sustituye, o None si no existe
+    """
+    price = db.query(models.Price).filter(models.Price.price_id == price_id).first()
+    if not price:
+        return None
+
+    new_amount = amount if amount is not None else price.amount
+    new_start = _to_naive_utc(start_date) if start_date else price.start_date
+    if new_start <= datetime.utcnow():
+        raise ValueError("La nueva fecha de inicio debe ser futura")
+
+    try:
+        _cancel_version(db, price)
+        new_price = _insert_version(db, _chain(db, price.demand_id), price.demand_id,
+                                    new_amount, new_start, price.description)
+    except Exception:
+        db.rollback()
+        raise
+
+    _publish_price_change(db)
+    db.refresh(new_price)
+
+    logger.info(f"Precio programado {price_id} sustituido por {new_price.price_id} ({new_amount} desde {new_start})")
+    return new_price
+
+
+def quote_slots(db: Session, slots: List[Tuple[str, str]]) -> List[dict]:
+    """
+    Presupuesta una lista de franjas (fecha, hora de inicio) sin consultas por franja:
+    el cuadrante, los festivos y las líneas temporales de precios salen de la caché.
+
+    Args:
+        db: Sesión de base de datos
+        slots: Lista de tuplas ("YYYY-MM-DD", "HH:MM")
+
+    Returns:
+        List[dict]: Por cada franja, en el mismo orden: date, time_slot, start_time,
+            demand_id, price_id y amount (None si la franja no existe, está cerrada por
+            festivo o no tiene precio)
+    """
+    resolved = []
+    day_slots = {}
+    for date_str, time_slot in slots:
+        try:
+            start_dt = datetime.strptime(f"{date_str} {time_slot}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            raise ValueError(f"Franja inválida: {date_str} {time_slot}")
+        day = start_dt.date()
+        if day not in day_slots:
+            day_slots[day] = dict(get_day_slots(db, day))
+        # strptime acepta "8:00": se busca con la etiqueta normalizada del cuadrante ("08:00")
+        resolved.append((date_str, time_slot, start_dt, day_slots[day].get(start_dt.strftime("%H:%M"))))
+
+    timelines = get_price_timelines(db)
+
+    quotes = []
+    for date_str, time_slot, start_dt, demand_id in resolved:
+        timeline = timelines.get(demand_id)
+        price = timeline.lookup(start_dt) if timeline else None
+        quotes.append({
+            "date": date_str,
+            "time_slot": time_slot,
+            "start_time": start_dt,
+            "demand_id": demand_id,
+            "price_id": price[0] if price else None,
+            "amount": price[1] if price else None
+        })
+    return quotes
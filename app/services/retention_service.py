@@ -0,0 +1,190 @@
+"""
+Retención de notificaciones y tareas programadas.
+
+`notifications` y `scheduled_tasks` crecen sin límite. Este servicio, por lotes y
+con un commit por lote (se puede interrumpir y relanzar sin perder nada):
+
+- Mueve las notificaciones de más de NOTIFICATION_RETENTION_DAYS días a
+  `notifications_archive`, sin claves foráneas y sin HTML (el contenido antiguo
+  se guarda comprimido como 'legacy_html'). Las que siguen pendientes de
+  reintento no se archivan.
+- Borra las tareas ya ejecutadas de más de TASK_RETENTION_DAYS días.
+
+Se ejecuta cada noche desde el scheduler o a mano con
+`python -m app.workers.maintenance retention`; el resultado de la última
+ejecución queda en system_state.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from .notification_retry_service import STATUS_RETRY
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 180))
+TASK_RETENTION_DAYS = int(os.getenv("TASK_RETENTION_DAYS", 30))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 1000))
+
+LAST_RUN_KEY = "retention.last_run"
+
+
+def _archive_row(notification) -> dict:
+    """Fila de notifications_archive a partir de una notificación."""
+    from .notification_service import LEGACY_HTML_TEMPLATE, compress_html
+
+    template_key, template_params = notification.template_key, notification.template_params
+    if not template_key and notification.content:
+        # Notificación antigua sin migrar: el HTML se guarda comprimido
+        template_key = LEGACY_HTML_TEMPLATE
+        template_params = json.dumps({"html_z": compress_html(notification.content)})
+
+    return {
+        "notification_id": notification.notification_id,
+        "user_id": notification.user_id,
+        "booking_id": notification.booking_id,
+        "notification_type": notification.notification_type,
+        "subject": notification.subject,
+        "recipient_email": notification.recipient_email,
+        "template_key": template_key,
+        "template_params": template_params,
+        "status": notification.status,
+        "is_sent": notification.is_sent,
+        "sent_at": notification.sent_at,
+        "created_at": notification.created_at,
+        "archived_at": datetime.utcnow()
+    }
+
+
+def archive_notifications(db: Session, older_than_days: int = NOTIFICATION_RETENTION_DAYS,
+                          batch_size: int = RETENTION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Mueve a notifications_archive las notificaciones anteriores al corte.
+
+    Returns:
+        dict: {"rows": movidas, "batches": lotes}
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    eligible = db.query(models.Notification).filter(
+        models.Notification.created_at < cutoff,
+        func.coalesce(models.Notification.status, "") != STATUS_RETRY
+    )
+
+    if dry_run:
+        return {"rows": eligible.count(), "batches": 0}
+
+    stats = {"rows": 0, "batches": 0}
+    while True:
+        batch = eligible.order_by(models.Notification.notification_id).limit(batch_size).all()
+        if not batch:
+            break
+
+        ids = [notification.notification_id for notification in batch]
+        db.execute(insert(models.NotificationArchive).values([_archive_row(n) for n in batch]))
+        db.execute(
+            delete(models.Notification)
+            .where(models.Notification.notification_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        db.expunge_all()
+
+        stats["rows"] += len(batch)
+        stats["batches"] += 1
+        logger.info(f"Notificaciones archivadas: {stats['rows']} (hasta id {ids[-1]})")
+
+    return stats
+
+
+def purge_executed_tasks(db: Session, older_than_days: int = TASK_RETENTION_DAYS,
+                         batch_size: int = RETENTION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Borra las tareas ejecutadas anteriores al corte.
+
+    Returns:
+        dict: {"rows": borradas, "batches": lotes}
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    eligible = db.query(models.ScheduledTask.task_id).filter(
+        models.ScheduledTask.is_executed == True,
+        models.ScheduledTask.scheduled_for < cutoff
+    )
+
+    if dry_run:
+        return {"rows": eligible.count(), "batches": 0}
+
+    stats = {"rows": 0, "batches": 0}
+    while True:
+        ids = [task_id for task_id, in eligible.order_by(models.ScheduledTask.task_id).limit(batch_size).all()]
+        if not ids:
+            break
+
+        db.execute(
+            delete(models.ScheduledTask)
+            .where(models.ScheduledTask.task_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        stats["rows"] += len(ids)
+        stats["batches"] += 1
+
+    logger.info(f"Tareas ejecutadas borradas: {stats['rows']}")
+    return stats
+
+
+def run_retention(db: Session, notification_days: int = NOTIFICATION_RETENTION_DAYS,
+                  task_days: int = TASK_RETENTION_DAYS, batch_size: int = RETENTION_BATCH_SIZE,
+                  dry_run: bool = False) -> dict:
+    """
+    Ejecuta la retención completa y guarda sus métricas (salvo en dry_run).
+
+    Returns:
+        dict: Filas archivadas/borradas, lotes, duración y parámetros de la ejecución
+    """
+    start = time.monotonic()
+    archived = archive_notifications(db, notification_days, batch_size, dry_run)
+    purged = purge_executed_tasks(db, task_days, batch_size, dry_run)
+
+    result = {
+        "run_at": datetime.utcnow().isoformat(),
+        "dry_run": dry_run,
+        "notification_days": notification_days,
+        "task_days": task_days,
+        "notifications_archived": archived["rows"],
+        "tasks_purged": purged["rows"],
+        "batches": archived["batches"] + purged["batches"],
+        "duration_seconds": round(time.monotonic() - start, 3)
+    }
+
+    if not dry_run:
+        crud.set_state_value(db, LAST_RUN_KEY, json.dumps(result))
+        db.commit()
+
+    logger.info(
+        f"Retención: {result['notifications_archived']} notificaciones archivadas, "
+        f"{result['tasks_purged']} tareas borradas en {result['duration_seconds']}s"
+    )
+    return result
+
+
+def get_retention_statistics(db: Session) -> dict:
+    """Tamaño actual de las tablas afectadas y resultado de la última ejecución."""
+    last_run: Optional[str] = crud.get_state_value(db, LAST_RUN_KEY)
+    return {
+        "notifications": db.query(func.count(models.Notification.notification_id)).scalar(),
+        "notifications_archive": db.query(func.count(models.NotificationArchive.notification_id)).scalar(),
+        "scheduled_tasks": db.query(func.count(models.ScheduledTask.task_id)).scalar(),
+        "scheduled_tasks_executed": db.query(func.count(models.ScheduledTask.task_id)).filter(
+            models.ScheduledTask.is_executed == True
+        ).scalar(),
+        "last_run": json.loads(last_run) if last_run else None
+    }
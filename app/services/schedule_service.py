@@ -0,0 +1,172 @@
+"""
+Servicio del cuadrante semanal (tabla Schedule).
+
+- Mantiene en memoria el mapa (día, hora) -> demand_id, ligado a una versión guardada
+  en system_state. Cualquier cambio del cuadrante incrementa la versión, de modo que
+  todos los procesos recargan a la vez los datos derivados (disponibilidad, precios).
+- Aplica los cambios del cuadrante (matriz completa o diferencias) con un único
+  INSERT ... ON CONFLICT DO UPDATE sobre el índice único (day_of_week, start_time).
+"""
+
+from datetime import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import logging
+import os
+from .. import crud, models
+from .cache_service import VersionedCache
+
+logger = logging.getLogger(__name__)
+
+# Bloques de 90 minutos del cuadrante (mismos que initialize_schedules)
+SLOT_TIMES = [
+    time(8, 0), time(9, 30), time(11, 0), time(12, 30), time(14, 0),
+    time(15, 30), time(17, 0), time(18, 30), time(20, 0), time(21, 30)
+]
+SLOT_LABELS = [t.strftime("%H:%M") for t in SLOT_TIMES]
+DAYS_PER_WEEK = 7
+
+SCHEDULE_VERSION_KEY = "schedule.version"
+
+# Cada cuánto se comprueba si otro proceso ha cambiado el cuadrante
+SCHEDULE_CACHE_CHECK_SECONDS = float(os.getenv("SCHEDULE_CACHE_CHECK_SECONDS", 5))
+
+_schedule_cache = VersionedCache("schedule", SCHEDULE_CACHE_CHECK_SECONDS)
+
+
+def get_schedule_version(db: Session) -> str:
+    """Versión actual del cuadrante ("0" si nunca se ha editado por API)."""
+    return crud.get_state_value(db, SCHEDULE_VERSION_KEY) or "0"
+
+
+def _load_schedule_map(db: Session) -> Dict[Tuple[int, str], int]:
+    rows = db.query(
+        models.Schedule.day_of_week, models.Schedule.start_time, models.Schedule.demand_id
+    ).all()
+    return {(day, start.strftime("%H:%M")): demand_id for day, start, demand_id in rows}
+
+
+def get_schedule_map(db: Session) -> Dict[Tuple[int, str], int]:
+    """
+    Mapa cacheado (day_of_week, "HH:MM") -> demand_id.
+
+    Returns:
+        Dict[Tuple[int, str], int]: Demanda de cada bloque del cuadrante
+    """
+    return _schedule_cache.get(
+        version_loader=lambda: get_schedule_version(db),
+        loader=lambda: _load_schedule_map(db)
+    )
+
+
+def get_schedule_matrix(db: Session) -> List[List[Optional[int]]]:
+    """
+    Cuadrante como matriz 7x10 (días x bloques) de demand_id.
+
+    Returns:
+        List[List[Optional[int]]]: matrix[día][bloque]
+    """
+    schedule_map = get_schedule_map(db)
+    return [
+        [schedule_map.get((day, label)) for label in SLOT_LABELS]
+        for day in range(DAYS_PER_WEEK)
+    ]
+
+
+def matrix_to_changes(matrix: List[List[int]]) -> List[Tuple[int, time, int]]:
+    """
+    Convierte una matriz completa 7x10 en la lista de cambios a aplicar.
+    Lanza ValueError si las dimensiones no son correctas.
+    """
+    if len(matrix) != DAYS_PER_WEEK or any(len(row) != len(SLOT_TIMES) for row in matrix):
+        raise ValueError(f"La matriz debe tener {DAYS_PER_WEEK} filas de {len(SLOT_TIMES)} bloques")
+
+    return [
+        (day, SLOT_TIMES[index], demand_id)
+        for day, row in enumerate(matrix)
+        for index, demand_id in enumerate(row)
+    ]
+
+
+def _validate_changes(db: Session, changes: List[Tuple[int, time, int]]) -> None:
+    """Comprueba días, bloques y niveles de demanda. Lanza ValueError si algo no es válido."""
+    demand_ids = {d for (d,) in db.query(models.Demand.demand_id).all()}
+    seen = set()
+
+    for day, start, demand_id in changes:
+        if not 0 <= day < DAYS_PER_WEEK:
+            raise ValueError(f"Día de la semana inválido: {day}")
+        if start not in SLOT_TIMES:
+            raise ValueError(f"Bloque horario inválido: {start.strftime('%H:%M')}")
+        if demand_id not in demand_ids:
+            raise ValueError(f"Nivel de demanda inexistente: {demand_id}")
+        if (day, start) in seen:
+            raise ValueError(f"Bloque repetido: día {day} a las {start.strftime('%H:%M')}")
+        seen.add((day, start))
+
+
+def _upsert_statement(db: Session, rows: list):
+    """INSERT ... ON CONFLICT (day_of_week, start_time) DO UPDATE según el dialecto."""
+    if db.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+
+    stmt = insert(models.Schedule).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["day_of_week", "start_time"],
+        set_={"demand_id": stmt.excluded.demand_id, "is_weekend": stmt.excluded.is_weekend}
+    )
+
+
+def apply_schedule_changes(db: Session, changes: List[Tuple[int, time, int]],
+                           expected_version: Optional[str] = None) -> dict:
+    """
+    Aplica cambios al cuadrante en una sola sentencia y publica una nueva versión.
+    La versión se incrementa de forma atómica en la base de datos, así que dos
+    ediciones simultáneas nunca publican el mismo número.
+
+    Args:
+        db: Sesión de base de datos
+        changes: Lista de (day_of_week, start_time, demand_id)
+        expected_version: Si se indica, lanza ValueError (sin aplicar nada) si el
+            cuadrante ya no está en esa versión
+
+    Returns:
+        dict: {"updated": número de bloques, "version": nueva versión}
+    """
+    if not changes:
+        return {"updated": 0, "version": get_schedule_version(db)}
+
+    _validate_changes(db, changes)
+
+    rows = [{
+        "day_of_week": day,
+        "start_time": start,
+        "demand_id": demand_id,
+        "is_weekend": day >= 5
+    } for day, start, demand_id in changes]
+
+    db.execute(_upsert_statement(db, rows))
+
+    # La versión se confirma en la misma transacción que el cuadrante
+    new_version = crud.increment_state_counter(db, SCHEDULE_VERSION_KEY, expected=expected_version)
+    if new_version is None:
+        db.rollback()
+        raise ValueError(f"El cuadrante ya no está en la versión {expected_version}")
+    db.commit()
+
+    _schedule_cache.invalidate()
+    _refresh_dependents(db)
+
+    logger.info(f"Cuadrante actualizado: {len(rows)} bloques, versión {new_version}")
+    return {"updated": len(rows), "version": new_version}
+
+
+def _refresh_dependents(db: Session) -> None:
+    """Regenera los datos derivados del cuadrante (capacidad futura y estadísticas)."""
+    from .capacity_service import rebuild_future_capacity
+    from .stats_service import stats_cache
+
+    rebuild_future_capacity(db)
+    stats_cache.invalidate()
@@ -17,6 +17,11 @@ from .notification_service import (
     generate_reminder_email
 )
 from .task_service import process_pending_tasks
+from .capacity_service import extend_capacity_calendar
+from .pricing_service import sync_active_flags
+from .demand_tier_service import run_nightly_job
+from .retention_service import run_retention
+from .stats_service import ensure_daily_stats
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +57,75 @@ def init_scheduler():
             logger.info("Job periódico 'process_pending_tasks_cron' añadido al scheduler")
         except Exception as _e:
             logger.error(f"No se pudo añadir job periódico: {_e}")
+        try:
+            # Extender cada noche el calendario de capacidad de las pistas
+            scheduler.add_job(
+                func=_extend_capacity_calendar_job,
+                trigger='cron',
+                hour=0,
+                minute=5,
+                id='extend_capacity_calendar_cron',
+                replace_existing=True,
+                name='Extender calendario de capacidad'
+            )
+            logger.info("Job periódico 'extend_capacity_calendar_cron' añadido al scheduler")
+        except Exception as _e:
+            logger.error(f"No se pudo añadir job de capacidad: {_e}")
+        try:
+            # Consolidar cada noche los días cerrados en el agregado de estadísticas
+            scheduler.add_job(
+                func=_daily_stats_job,
+                trigger='cron',
+                hour=0,
+                minute=10,
+                id='daily_stats_cron',
+                replace_existing=True,
+                name='Consolidar estadísticas diarias'
+            )
+            logger.info("Job periódico 'daily_stats_cron' añadido al scheduler")
+        except Exception as _e:
+            logger.error(f"No se pudo añadir job de estadísticas: {_e}")
+        try:
+            # Activar las versiones de precio programadas cuando entran en vigor
+            scheduler.add_job(
+                func=_sync_price_flags_job,
+                trigger='cron',
+                minute='*/5',
+                id='sync_price_flags_cron',
+                replace_existing=True,
+                name='Sincronizar precios vigentes'
+            )
+            logger.info("Job periódico 'sync_price_flags_cron' añadido al scheduler")
+        except Exception as _e:
+            logger.error(f"No se pudo añadir job de precios: {_e}")
+        try:
+            # Proponer (o aplicar) cada noche los niveles de demanda según la ocupación
+            scheduler.add_job(
+                func=_demand_tier_job,
+                trigger='cron',
+                hour=3,
+                minute=30,
+                id='demand_tier_cron',
+                replace_existing=True,
+                name='Propuesta nocturna de niveles de demanda'
+            )
+            logger.info("Job periódico 'demand_tier_cron' añadido al scheduler")
+        except Exception as _e:
+            logger.error(f"No se pudo añadir job de niveles de demanda: {_e}")
+        try:
+            # Archivar notificaciones antiguas y borrar tareas ejecutadas cada noche
+            scheduler.add_job(
+                func=_retention_job,
+                trigger='cron',
+                hour=4,
+                minute=15,
+                id='retention_cron',
+                replace_existing=True,
+                name='Retención de notificaciones y tareas'
+            )
+            logger.info("Job periódico 'retention_cron' añadido al scheduler")
+        except Exception as _e:
+            logger.error(f"No se pudo añadir job de retención: {_e}")
         scheduler_configured = True
         logger.info("APScheduler inicializado correctamente")
     except Exception as e:
@@ -81,6 +155,94 @@ def _process_pending_tasks_job():
             pass
 
 
+def _extend_capacity_calendar_job():
+    """
+    Runner diario que extiende el calendario de capacidad (court_capacity)
+    hasta el horizonte configurado.
+    """
+    db = None
+    try:
+        db = database.session_local()
+        inserted = extend_capacity_calendar(db)
+        logger.info(f"Job extend_capacity_calendar: {inserted} filas nuevas")
+    except Exception as e:
+        logger.error(f"Error en job extend_capacity_calendar: {str(e)}", exc_info=True)
+    finally:
+        if db is not None:
+            db.close()
+
+
+def _daily_stats_job():
+    """
+    Runner diario que consolida en booking_daily_stats los días ya cerrados.
+    """
+    db = None
+    try:
+        db = database.session_local()
+        closed_through = ensure_daily_stats(db)
+        logger.info(f"Job daily_stats: consolidado hasta {closed_through}")
+    except Exception as e:
+        logger.error(f"Error en job daily_stats: {str(e)}", exc_info=True)
+    finally:
+        if db is not None:
+            db.close()
+
+
+def _sync_price_flags_job():
+    """
+    Runner que alinea is_active con la versión de precio vigente, de modo que
+    una versión programada pasa a ser la activa cuando llega su fecha.
+    """
+    db = None
+    try:
+        db = database.session_local()
+        changed = sync_active_flags(db)
+        db.commit()
+        if changed:
+            logger.info(f"Job sync_price_flags: {changed} precios actualizados")
+    except Exception as e:
+        logger.error(f"Error en job sync_price_flags: {str(e)}", exc_info=True)
+    finally:
+        if db is not None:
+            db.close()
+
+
+def _demand_tier_job():
+    """
+    Runner nocturno que calcula la propuesta de niveles de demanda por ocupación
+    (y la aplica si así está configurado).
+    """
+    db = None
+    try:
+        db = database.session_local()
+        result = run_nightly_job(db)
+        logger.info(f"Job demand_tier: {result['changes']} cambios propuestos (aplicados={result['applied']})")
+    except Exception as e:
+        logger.error(f"Error en job demand_tier: {str(e)}", exc_info=True)
+    finally:
+        if db is not None:
+            db.close()
+
+
+def _retention_job():
+    """
+    Runner nocturno de retención: archiva notificaciones y borra tareas ejecutadas antiguas.
+    """
+    db = None
+    try:
+        db = database.session_local()
+        result = run_retention(db)
+        logger.info(
+            f"Job retention: {result['notifications_archived']} notificaciones archivadas, "
+            f"{result['tasks_purged']} tareas borradas"
+        )
+    except Exception as e:
+        logger.error(f"Error en job retention: {str(e)}", exc_info=True)
+    finally:
+        if db is not None:
+            db.close()
+
+
 def schedule_reminder_email(booking_id: int, user_id: int, recipient_email: str, 
                            court_number: int, start_time: datetime) -> bool:
     """
@@ -145,7 +307,8 @@ def _send_reminder_task(booking_id: int, user_id: int, recipient_email: str,
         
         # Generar contenido del email
         start_time_str = start_time.strftime("%d/%m/%Y %H:%M")
-        html_content = generate_reminder_email(user.name, court_number, start_time.strftime("%H:%M"))
+        params = {"user_name": user.name, "court_number": court_number, "start_time": start_time.strftime("%H:%M")}
+        html_content = generate_reminder_email(**params)
         
         # Enviar y registrar notificación
         email_sent = send_email(recipient_email, "⏰ Recordatorio de tu reserva", html_content)
@@ -156,9 +319,10 @@ def _send_reminder_task(booking_id: int, user_id: int, recipient_email: str,
             recipient_email=recipient_email,
             notification_type="reminder_24h",
             subject="⏰ Recordatorio de tu reserva",
-            content=html_content,
             booking_id=booking_id,
-            is_sent=email_sent
+            is_sent=email_sent,
+            template_key="reminder_24h",
+            template_params=params
         )
         
         if email_sent:
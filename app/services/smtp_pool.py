@@ -0,0 +1,378 @@
+"""
+Pool de conexiones SMTP persistentes con circuit breaker.
+
+Abrir una conexión SMTP cuesta varios viajes de red (saludo, EHLO, STARTTLS con su
+handshake TLS y AUTH). El pool mantiene conexiones ya autenticadas y las reutiliza:
+
+- Hasta `max_size` conexiones simultáneas; si están todas ocupadas se espera.
+- Las conexiones ociosas más de `idle_timeout` se cierran (el servidor las cortaría).
+- Antes de reutilizar una conexión que lleva tiempo parada se comprueba con NOOP.
+- Si el servidor corta la conexión a mitad de envío, se reintenta una vez con una
+  conexión recién abierta (las ociosas se descartan: probablemente también están cortadas).
+
+El circuit breaker evita que, con el servidor caído, cada envío se quede bloqueado
+hasta el timeout del socket: tras `failure_threshold` fallos de conexión seguidos el
+circuito se abre y los envíos fallan al instante durante `reset_timeout` segundos;
+después se deja pasar un envío de prueba (semiabierto) que decide si se cierra o no.
+Solo cuentan los envíos que llegan al servidor: esperar una conexión libre del pool
+no dice nada de su salud.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Errores que indican que el servidor no es accesible (cuentan para el circuit breaker).
+# Un destinatario rechazado o un mensaje inválido no dicen nada de la salud del servidor.
+CONNECTION_ERRORS = (OSError, smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """
+    Indica si un error se debe a la conexión y no a una respuesta del servidor.
+
+    smtplib.SMTPException hereda de OSError, así que hay que excluir a mano las
+    respuestas (4xx/5xx a un comando): la sesión sigue siendo válida. La excepción
+    es 421, con la que el servidor cierra la conexión.
+    """
+    if isinstance(exc, smtplib.SMTPResponseException) and not isinstance(exc, smtplib.SMTPConnectError):
+        return exc.smtp_code == 421
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return False
+    return isinstance(exc, CONNECTION_ERRORS)
+
+
+class SMTPCircuitOpenError(smtplib.SMTPException):
+    """El circuito está abierto: el envío se rechaza sin intentar conectar."""
+
+
+class SMTPPoolError(smtplib.SMTPException):
+    """El pool no pudo prestar una conexión (está cerrado). No se habló con el servidor."""
+
+
+class SMTPPoolTimeoutError(SMTPPoolError):
+    """Todas las conexiones del pool siguieron ocupadas durante el timeout."""
+
+
+def is_server_reply(exc: BaseException) -> bool:
+    """Indica si el error es una respuesta del servidor (prueba de que está accesible)."""
+    return isinstance(exc, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados (closed, open, half_open), seguro entre hilos.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Args:
+            failure_threshold: Fallos seguidos que abren el circuito
+            reset_timeout: Segundos que el circuito permanece abierto antes de probar de nuevo
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Indica si se puede intentar un envío ahora mismo."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Semiabierto: solo un envío de prueba a la vez
+            if self._probe_in_flight:
+                return False
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Circuit breaker SMTP cerrado: el servidor vuelve a responder")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def cancel_probe(self) -> None:
+        """
+        Libera el envío de prueba sin decidir nada: el intento no llegó al servidor
+        (ej. no había conexión libre en el pool).
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"Circuit breaker SMTP abierto tras {self._failures} fallos: "
+                        f"los envíos fallarán al instante durante {self.reset_timeout}s"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    Pool de conexiones SMTP autenticadas, seguro entre hilos.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, use_login: bool = True, max_size: int = 4,
+                 idle_timeout: float = 60, health_check_after: float = 15, connect_timeout: float = 10,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Args:
+            host: Servidor SMTP
+            port: Puerto SMTP
+            username: Usuario para AUTH
+            password: Contraseña para AUTH
+            use_tls: Ejecutar STARTTLS tras conectar
+            use_login: Autenticarse tras conectar
+            max_size: Máximo de conexiones abiertas a la vez
+            idle_timeout: Segundos de inactividad tras los que se cierra una conexión
+            health_check_after: Segundos de inactividad a partir de los que se hace NOOP antes de reutilizar
+            connect_timeout: Timeout del socket (conexión y operaciones)
+            breaker: Circuit breaker compartido (por defecto uno nuevo)
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_login = use_login
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        self._idle = deque()  # (conexión, instante de último uso)
+        self._open_count = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Métricas
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.sends = 0
+        self.failures = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.connect_timeout)
+        try:
+            server.ehlo()
+            if self.use_tls:
+                server.starttls()
+                server.ehlo()
+            if self.use_login and self.username:
+                server.login(self.username, self.password or "")
+        except Exception:
+            self._close_quietly(server)
+            raise
+        with self._cond:
+            self.connections_created += 1
+        logger.debug(f"Nueva conexión SMTP a {self.host}:{self.port} ({self._open_count} abiertas)")
+        return server
+
+    @staticmethod
+    def _close_quietly(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self, timeout: Optional[float], fresh: bool = False) -> smtplib.SMTP:
+        """
+        Obtiene una conexión ociosa sana o abre una nueva si hay hueco.
+        El NOOP de comprobación y los cierres se hacen fuera del lock: una conexión
+        lenta no frena a los demás hilos.
+
+        Con fresh=True siempre se abre una conexión nueva; las ociosas que se
+        encuentren por el camino se cierran para dejarle hueco.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            server, idle_for = self._take(deadline)
+            if server is None:
+                break
+            if fresh or idle_for > self.idle_timeout:
+                self._discard(server)
+                continue
+            if idle_for > self.health_check_after and not self._is_alive(server):
+                self._discard(server)
+                continue
+            with self._cond:
+                self.connections_reused += 1
+            return server
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+
+    def _take(self, deadline: Optional[float]) -> tuple:
+        """
+        Con el lock tomado, saca la conexión ociosa más reciente o reserva el hueco
+        para abrir una nueva, esperando hasta `deadline` si el pool está lleno.
+
+        Returns:
+            tuple: (conexión, segundos ociosa) o (None, 0) si hay que abrir una nueva
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise SMTPPoolError("El pool SMTP está cerrado")
+
+                if self._idle:
+                    # Sigue contando en _open_count mientras se comprueba
+                    server, last_used = self._idle.pop()
+                    return server, time.monotonic() - last_used
+
+                if self._open_count < self.max_size:
+                    # Reservamos el hueco y conectamos fuera del lock
+                    self._open_count += 1
+                    return None, 0.0
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise SMTPPoolTimeoutError("Tiempo de espera agotado esperando una conexión SMTP libre")
+                self._cond.wait(remaining)
+
+    def _release(self, server: smtplib.SMTP) -> None:
+        with self._cond:
+            if not self._closed:
+                self._idle.append((server, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(server)
+
+    def _discard(self, server: smtplib.SMTP) -> None:
+        """Cierra una conexión (fuera del lock) y libera su hueco."""
+        self._close_quietly(server)
+        with self._cond:
+            self._open_count -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None, fresh: bool = False):
+        """
+        Context manager que presta una conexión del pool. Si el bloque lanza un error
+        de conexión, la conexión se descarta en lugar de devolverse al pool.
+        Con fresh=True la conexión es nueva (no se reutiliza ninguna ociosa).
+        """
+        server = self._acquire(timeout, fresh=fresh)
+        try:
+            yield server
+        except Exception as e:
+            if is_connection_error(e):
+                self._discard(server)
+            else:
+                self._release(server)
+            raise
+        else:
+            self._release(server)
+
+    def send(self, from_addr: str, to_addrs, message: str, timeout: Optional[float] = None) -> None:
+        """
+        Envía un mensaje usando una conexión del pool.
+
+        Lanza SMTPCircuitOpenError si el circuito está abierto, SMTPPoolError si no
+        se obtuvo conexión del pool, o la excepción SMTP original si el envío falla.
+        """
+        if not self.breaker.allow():
+            with self._cond:
+                self.failures += 1
+            raise SMTPCircuitOpenError(f"Servidor SMTP {self.host}:{self.port} no disponible (circuito abierto)")
+
+        try:
+            for attempt in range(2):
+                try:
+                    with self.connection(timeout, fresh=attempt > 0) as server:
+                        server.sendmail(from_addr, to_addrs, message)
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    # Conexión reutilizada cortada por el servidor: un reintento con una recién abierta
+                    if attempt == 1:
+                        raise
+                    logger.debug("Conexión SMTP cortada por el servidor, reintentando con una nueva")
+        except Exception as e:
+            with self._cond:
+                self.failures += 1
+            if isinstance(e, SMTPPoolError):
+                # No se llegó a hablar con el servidor: el circuito no cambia
+                self.breaker.cancel_probe()
+            elif is_connection_error(e):
+                self.breaker.record_failure()
+            elif is_server_reply(e):
+                # El servidor respondió (ej. destinatario rechazado): está sano
+                self.breaker.record_success()
+            else:
+                self.breaker.cancel_probe()
+            raise
+
+        with self._cond:
+            self.sends += 1
+        self.breaker.record_success()
+
+    def close_all(self) -> None:
+        """Cierra todas las conexiones ociosas y rechaza nuevos préstamos."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for server, _ in idle:
+            self._discard(server)
+        logger.info(f"Pool SMTP cerrado ({self.connections_created} conexiones creadas, {self.sends} envíos)")
+
+    def stats(self) -> dict:
+        """Métricas del pool y estado del circuit breaker."""
+        with self._cond:
+            return {
+                "open_connections": self._open_count,
+                "idle_connections": len(self._idle),
+                "connections_created": self.connections_created,
+                "connections_reused": self.connections_reused,
+                "sends": self.sends,
+                "failures": self.failures,
+                "breaker_state": self.breaker.state
+            }
@@ -0,0 +1,587 @@
+"""
+Servicio de estadísticas del panel de administración.
+
+Separa el cálculo de las estadísticas (consultas agregadas sobre reservas) del router,
+y lo expone a través de una caché stale-while-revalidate para que los administradores
+que dejan la página abierta no recalculen todo en cada refresco.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, desc, extract, case, text, Date
+from sqlalchemy.orm import Session
+import logging
+import os
+from .. import crud, models, database
+from .cache_service import StaleWhileRevalidateCache
+from . import capacity_service
+
+logger = logging.getLogger(__name__)
+
+# Periodos admitidos (en días) para las estadísticas
+ALLOWED_PERIODS = [30, 60, 90]
+
+# Granularidades admitidas para los informes por rango de fechas
+ALLOWED_GRANULARITIES = ["day", "week", "month"]
+
+# Longitud máxima (en días) de un informe por rango
+MAX_RANGE_DAYS = int(os.getenv("STATS_MAX_RANGE_DAYS", 366 * 5))
+
+# Días anteriores a hoy que se siguen calculando en vivo; los anteriores se consideran
+# cerrados y se leen del agregado diario
+SETTLED_DAYS = 2
+
+# Clave de system_state con el último día consolidado en booking_daily_stats
+DAILY_STATS_WATERMARK_KEY = "booking_daily_stats.closed_through"
+
+# Clave del advisory lock de PostgreSQL que serializa las escrituras en booking_daily_stats
+DAILY_STATS_LOCK_ID = 72011
+
+# Segundos durante los que una respuesta se sirve sin recalcular
+STATS_CACHE_TTL_SECONDS = int(os.getenv("STATS_CACHE_TTL_SECONDS", 60))
+# Edad máxima a la que se sirve una respuesta antigua mientras se recalcula en segundo plano
+STATS_CACHE_MAX_STALE_SECONDS = int(os.getenv("STATS_CACHE_MAX_STALE_SECONDS", 600))
+# Respuestas distintas (periodos y rangos) que se guardan como máximo; se descartan las menos usadas
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", 64))
+
+stats_cache = StaleWhileRevalidateCache(
+    name="admin-stats",
+    ttl_seconds=STATS_CACHE_TTL_SECONDS,
+    max_stale_seconds=STATS_CACHE_MAX_STALE_SECONDS,
+    max_entries=STATS_CACHE_MAX_ENTRIES
+)
+
+
+def get_stats_cached(period: int = 30, force_refresh: bool = False) -> dict:
+    """
+    Devuelve las estadísticas del periodo desde la caché, recalculándolas si hace falta.
+
+    El cálculo usa su propia sesión de BD, ya que puede ejecutarse en segundo plano
+    después de que la petición que lo disparó haya terminado.
+
+    Args:
+        period: Número de días a considerar (30, 60 o 90)
+        force_refresh: Fuerza el recálculo ignorando la caché
+
+    Returns:
+        dict: Estadísticas del periodo más el campo "computed_at" (ISO, UTC)
+    """
+    if period not in ALLOWED_PERIODS:
+        period = 30
+
+    def loader():
+        db = database.session_local()
+        try:
+            return compute_stats(db, period)
+        finally:
+            db.close()
+
+    stats, computed_at = stats_cache.get(("stats", period), loader, force_refresh=force_refresh)
+
+    # Copia superficial para no mutar la entrada compartida de la caché
+    response = dict(stats)
+    response["computed_at"] = computed_at.isoformat()
+    return response
+
+
+def get_range_stats_cached(date_from: date, date_to: date, granularity: str = "day", force_refresh: bool = False) -> dict:
+    """
+    Devuelve el informe de un rango arbitrario desde la caché (clave: rango y granularidad).
+
+    Args:
+        date_from: Primer día del rango (incluido)
+        date_to: Último día del rango (incluido)
+        granularity: "day", "week" o "month"
+        force_refresh: Fuerza el recálculo ignorando la caché
+
+    Returns:
+        dict: Informe del rango más el campo "computed_at" (ISO, UTC)
+    """
+    def loader():
+        db = database.session_local()
+        try:
+            return compute_range_stats(db, date_from, date_to, granularity)
+        finally:
+            db.close()
+
+    key = ("range", date_from.isoformat(), date_to.isoformat(), granularity)
+    stats, computed_at = stats_cache.get(key, loader, force_refresh=force_refresh)
+
+    response = dict(stats)
+    response["computed_at"] = computed_at.isoformat()
+    return response
+
+
+def compute_stats(db: Session, period: int) -> dict:
+    """
+    Calcula estadísticas avanzadas de uso e ingresos: comparativas, tendencias, heatmap de ocupación, KPIs.
+
+    Args:
+        db: Sesión de base de datos
+        period: Número de días a considerar
+
+    Returns:
+        dict: Estadísticas del periodo
+    """
+    now = datetime.utcnow()
+    period_start = now - timedelta(days=period)
+    previous_period_start = now - timedelta(days=period * 2)
+    previous_period_end = period_start
+
+    # === PERÍODO ACTUAL ===
+    current_bookings = db.query(models.Booking).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).count()
+
+    current_income = db.query(
+        func.sum(models.Price.amount)
+    ).join(
+        models.Booking, models.Booking.price_id == models.Price.price_id
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).scalar() or 0.0
+
+    # === PERÍODO ANTERIOR ===
+    previous_bookings = db.query(models.Booking).filter(
+        models.Booking.start_time >= previous_period_start,
+        models.Booking.start_time < previous_period_end,
+        models.Booking.is_cancelled == False
+    ).count()
+
+    previous_income = db.query(
+        func.sum(models.Price.amount)
+    ).join(
+        models.Booking, models.Booking.price_id == models.Price.price_id
+    ).filter(
+        models.Booking.start_time >= previous_period_start,
+        models.Booking.start_time < previous_period_end,
+        models.Booking.is_cancelled == False
+    ).scalar() or 0.0
+
+    # Calcular variaciones porcentuales
+    booking_variation = 0.0
+    income_variation = 0.0
+    if previous_bookings > 0:
+        booking_variation = round(((current_bookings - previous_bookings) / previous_bookings) * 100, 1)
+    if previous_income > 0:
+        income_variation = round(((current_income - previous_income) / previous_income) * 100, 1)
+
+    # === TASA DE CANCELACIÓN ===
+    total_all_time = db.query(models.Booking).count()
+    total_cancelled = db.query(models.Booking).filter(models.Booking.is_cancelled == True).count()
+    cancellation_rate = 0.0
+    if total_all_time > 0:
+        cancellation_rate = round((total_cancelled / total_all_time) * 100, 1)
+
+    # === INGRESOS POR DEMANDA ===
+    income_by_demand_query = db.query(
+        models.Demand.description,
+        func.sum(models.Price.amount)
+    ).select_from(models.Booking).join(
+        models.Price, models.Booking.price_id == models.Price.price_id
+    ).join(
+        models.Demand, models.Price.demand_id == models.Demand.demand_id
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).group_by(models.Demand.description).all()
+
+    income_by_demand = {desc: round(amount or 0, 2) for desc, amount in income_by_demand_query}
+
+    # === OCUPACIÓN POR PISTA ===
+    occupancy_by_court = db.query(
+        models.Booking.court_id, func.count(models.Booking.booking_id)
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).group_by(models.Booking.court_id).all()
+    
+    court_stats = {f"Pista {c_id}": count for c_id, count in occupancy_by_court}
+
+    # === HORAS PUNTA ===
+    peak_hours_query = db.query(
+        extract('hour', models.Booking.start_time).label('hour'),
+        func.count(models.Booking.booking_id).label('count')
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).group_by('hour').order_by(desc('count')).limit(3).all()
+
+    peak_hours = [{"hour": int(h), "count": c} for h, c in peak_hours_query]
+
+    # === TOP USUARIOS ===
+    top_users_query = db.query(
+        models.User.email,
+        models.User.name,
+        models.User.surname,
+        func.count(models.Booking.booking_id).label('count')
+    ).join(
+        models.Booking, models.Booking.user_id == models.User.user_id
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).group_by(models.User.user_id).order_by(desc('count')).limit(5).all()
+
+    top_users = [
+        {"email": u.email, "name": f"{u.name} {u.surname}", "count": u.count} 
+        for u in top_users_query
+    ]
+
+    # === DATOS DIARIOS (TENDENCIA) ===
+    # Se sirven desde el agregado diario (booking_daily_stats) en lugar de agrupar reserva a reserva
+    daily_income_trend = {}
+    for i in range(period, 0, -1):
+        date = (now - timedelta(days=i)).date().isoformat()
+        daily_income_trend[date] = 0.0
+    
+    daily_bookings_trend = {k: 0 for k in daily_income_trend.keys()}
+
+    trend_rows = get_daily_stat_rows(db, (now - timedelta(days=period)).date(), (now - timedelta(days=1)).date())
+    for row in trend_rows:
+        date = row["stat_date"].isoformat()
+        if date in daily_income_trend:
+            daily_income_trend[date] = round(daily_income_trend[date] + row["income"], 2)
+            daily_bookings_trend[date] += row["bookings"]
+    
+    # === OCUPACIÓN POR PISTA Y HORA (HEATMAP) ===
+    occupancy_matrix = db.query(
+        models.Booking.court_id,
+        extract('hour', models.Booking.start_time).label('hour'),
+        func.count(models.Booking.booking_id).label('count')
+    ).filter(
+        models.Booking.start_time >= period_start,
+        models.Booking.is_cancelled == False
+    ).group_by(models.Booking.court_id, 'hour').all()
+
+    # Estructura: {"Pista 1": {8: 2, 9: 5, ...}, ...}
+    heatmap = {}
+    for court_id, hour, count in occupancy_matrix:
+        court_label = f"Pista {court_id}"
+        if court_label not in heatmap:
+            heatmap[court_label] = {}
+        heatmap[court_label][int(hour)] = count
+
+    # === MÉTRICAS KPI ===
+    # Ocupación exacta: reservas de los días ya cerrados del periodo frente a las franjas
+    # reservables según el calendario de capacidad (cuadrante, mantenimiento y festivos)
+    total_slots = capacity_service.get_total_capacity(
+        db, (now - timedelta(days=period)).date(), (now - timedelta(days=1)).date()
+    )
+    played_bookings = sum(daily_bookings_trend.values())
+    avg_occupancy = round((played_bookings / total_slots) * 100, 1) if total_slots > 0 else 0.0
+    avg_ticket = round(current_income / max(current_bookings, 1), 2)
+
+    # === PISTAS MENOS USADAS (ALERTAS) ===
+    all_courts = db.query(models.Court).all()
+    court_usage = {c.court_id: 0 for c in all_courts}
+    for court_id, count in occupancy_by_court:
+        court_usage[court_id] = count
+    
+    underutilized_courts = [cid for cid, count in court_usage.items() if count < (current_bookings / len(all_courts) * 0.3)]
+
+    return {
+        # Período actual
+        "total_bookings_30d": current_bookings,
+        "total_income": round(current_income, 2),
+        "period": period,
+        
+        # Período anterior (comparativa)
+        "previous_bookings_30d": previous_bookings,
+        "previous_income": round(previous_income, 2),
+        "booking_variation": booking_variation,
+        "income_variation": income_variation,
+        
+        # Tasas y ratios
+        "cancellation_rate": cancellation_rate,
+        "avg_occupancy": avg_occupancy,
+        "avg_ticket": avg_ticket,
+        
+        # Ocupación
+        "court_occupancy": court_stats,
+        "occupancy_by_hour_and_court": heatmap,
+        
+        # Demanda
+        "income_by_demand": income_by_demand,
+        
+        # Tendencias
+        "peak_hours": peak_hours,
+        "daily_income_trend": daily_income_trend,
+        "daily_bookings_trend": daily_bookings_trend,
+        
+        # Top
+        "top_users": top_users,
+        
+        # Alertas
+        "underutilized_courts": underutilized_courts
+    }
+
+
+# ============================================================
+# AGREGADO DIARIO (booking_daily_stats)
+# ============================================================
+
+def _daily_stats_query(db: Session, date_from: date, date_to: date):
+    """
+    Consulta agrupada por (día, pista, demanda) sobre la tabla de reservas.
+    Es la misma agregación que se guarda en booking_daily_stats.
+    """
+    stat_date = func.date(models.Booking.start_time, type_=Date)
+    return db.query(
+        stat_date.label("stat_date"),
+        models.Booking.court_id.label("court_id"),
+        models.Price.demand_id.label("demand_id"),
+        func.sum(case((models.Booking.is_cancelled == False, 1), else_=0)).label("bookings"),
+        func.sum(case((models.Booking.is_cancelled == True, 1), else_=0)).label("cancelled"),
+        func.sum(case((models.Booking.is_cancelled == False, models.Price.amount), else_=0.0)).label("income")
+    ).join(
+        models.Price, models.Booking.price_id == models.Price.price_id
+    ).filter(
+        models.Booking.start_time >= datetime.combine(date_from, datetime.min.time()),
+        models.Booking.start_time < datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    ).group_by(stat_date, models.Booking.court_id, models.Price.demand_id)
+
+
+def refresh_daily_stats(db: Session, date_from: date, date_to: date) -> None:
+    """
+    Recalcula el agregado diario para un rango de días (borra y reinserta en bloque).
+    No hace commit.
+
+    Args:
+        db: Sesión de base de datos
+        date_from: Primer día a recalcular (incluido)
+        date_to: Último día a recalcular (incluido)
+    """
+    if date_from > date_to:
+        return
+
+    db.query(models.DailyBookingStat).filter(
+        models.DailyBookingStat.stat_date >= date_from,
+        models.DailyBookingStat.stat_date <= date_to
+    ).delete(synchronize_session=False)
+
+    # INSERT ... SELECT: la agregación se hace íntegramente en la base de datos
+    source = _daily_stats_query(db, date_from, date_to).subquery()
+    db.execute(
+        models.DailyBookingStat.__table__.insert().from_select(
+            ["stat_date", "court_id", "demand_id", "bookings", "cancelled", "income"],
+            db.query(
+                source.c.stat_date, source.c.court_id, source.c.demand_id,
+                source.c.bookings, source.c.cancelled, source.c.income
+            )
+        )
+    )
+    logger.info(f"Agregado diario recalculado: {date_from} -> {date_to}")
+
+
+def _lock_daily_stats(db: Session) -> None:
+    """
+    Serializa las escrituras en booking_daily_stats entre procesos (advisory lock de
+    PostgreSQL hasta el final de la transacción). En otras bases no hace nada.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": DAILY_STATS_LOCK_ID})
+
+
+def get_closed_through(db: Session) -> Optional[date]:
+    """Último día consolidado en booking_daily_stats (None si aún no se ha consolidado nada)."""
+    raw_watermark = crud.get_state_value(db, DAILY_STATS_WATERMARK_KEY)
+    return date.fromisoformat(raw_watermark) if raw_watermark else None
+
+
+def ensure_daily_stats(db: Session) -> date:
+    """
+    Consolida en booking_daily_stats todos los días cerrados que aún no lo estén.
+
+    Solo recorre los días nuevos desde la última ejecución (marca de agua en system_state),
+    por lo que en régimen normal procesa uno o dos días. Se ejecuta al arrancar y en un
+    job diario del scheduler, nunca desde las lecturas del panel; si varios procesos lo
+    lanzan a la vez, el advisory lock hace que solo uno consolide cada día.
+
+    Returns:
+        date: Último día consolidado
+    """
+    closed_through = datetime.utcnow().date() - timedelta(days=SETTLED_DAYS)
+    _lock_daily_stats(db)
+    watermark = get_closed_through(db)
+
+    if watermark:
+        if watermark >= closed_through:
+            db.commit()
+            return watermark
+        start = watermark + timedelta(days=1)
+    else:
+        # Primera ejecución: consolidamos desde la reserva más antigua
+        first_booking = db.query(func.min(models.Booking.start_time)).scalar()
+        start = first_booking.date() if first_booking else closed_through
+
+    refresh_daily_stats(db, start, closed_through)
+    crud.set_state_value(db, DAILY_STATS_WATERMARK_KEY, closed_through.isoformat())
+    db.commit()
+    return closed_through
+
+
+def invalidate_daily_stats(db: Session, day: date) -> None:
+    """
+    Recalcula un día ya consolidado cuando cambia una de sus reservas (ej. cancelación tardía).
+    Los días aún abiertos se calculan en vivo y no necesitan tratamiento. No hace commit.
+    """
+    watermark = get_closed_through(db)
+    if watermark and day <= watermark:
+        _lock_daily_stats(db)
+        refresh_daily_stats(db, day, day)
+
+
+def get_daily_stat_rows(db: Session, date_from: date, date_to: date) -> list:
+    """
+    Devuelve las filas (día, pista, demanda) del rango combinando el agregado consolidado
+    con el cálculo en vivo de los días todavía no consolidados. Solo lee: la consolidación
+    la hace ensure_daily_stats desde el scheduler.
+
+    Returns:
+        list: Lista de dicts con stat_date, court_id, demand_id, bookings, cancelled, income
+    """
+    closed_through = get_closed_through(db) or date.min
+    rows = []
+
+    if date_from <= closed_through:
+        stored = db.query(models.DailyBookingStat).filter(
+            models.DailyBookingStat.stat_date >= date_from,
+            models.DailyBookingStat.stat_date <= min(date_to, closed_through)
+        ).all()
+        rows.extend({
+            "stat_date": r.stat_date,
+            "court_id": r.court_id,
+            "demand_id": r.demand_id,
+            "bookings": r.bookings,
+            "cancelled": r.cancelled,
+            "income": r.income
+        } for r in stored)
+
+    live_from = max(date_from, closed_through + timedelta(days=1))
+    if live_from <= date_to:
+        rows.extend({
+            "stat_date": r.stat_date,
+            "court_id": r.court_id,
+            "demand_id": r.demand_id,
+            "bookings": int(r.bookings or 0),
+            "cancelled": int(r.cancelled or 0),
+            "income": float(r.income or 0.0)
+        } for r in _daily_stats_query(db, live_from, date_to).all())
+
+    return rows
+
+
+def _bucket_start(day: date, granularity: str) -> date:
+    """Primer día del intervalo (día, semana ISO o mes) al que pertenece una fecha."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: date, granularity: str) -> date:
+    """Primer día del intervalo siguiente."""
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return _bucket_start(start + timedelta(days=32), granularity)
+    return start + timedelta(days=1)
+
+
+def _bucket_label(start: date, granularity: str) -> str:
+    """Etiqueta legible del intervalo: 2026-01-15, 2026-W03 o 2026-01."""
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return start.strftime("%Y-%m")
+    return start.isoformat()
+
+
+def compute_range_stats(db: Session, date_from: date, date_to: date, granularity: str = "day") -> dict:
+    """
+    Calcula el informe de un rango arbitrario de fechas agrupado por día, semana o mes.
+
+    Trabaja sobre el agregado diario, de modo que un informe anual lee unas pocas miles
+    de filas pre-agregadas en lugar de todas las reservas del año.
+
+    Args:
+        db: Sesión de base de datos
+        date_from: Primer día del rango (incluido)
+        date_to: Último día del rango (incluido)
+        granularity: "day", "week" o "month"
+
+    Returns:
+        dict: Totales, desgloses por pista y demanda y serie temporal ("trend")
+    """
+    rows = get_daily_stat_rows(db, date_from, date_to)
+
+    # Serie temporal con todos los intervalos del rango (incluidos los vacíos)
+    buckets = {}
+    day = _bucket_start(date_from, granularity)
+    while day <= date_to:
+        buckets[day] = {"bookings": 0, "cancelled": 0, "income": 0.0}
+        day = _next_bucket(day, granularity)
+
+    court_occupancy = {}
+    income_by_demand_id = {}
+    for row in rows:
+        bucket = buckets[_bucket_start(row["stat_date"], granularity)]
+        bucket["bookings"] += row["bookings"]
+        bucket["cancelled"] += row["cancelled"]
+        bucket["income"] += row["income"]
+
+        court_label = f"Pista {row['court_id']}"
+        court_occupancy[court_label] = court_occupancy.get(court_label, 0) + row["bookings"]
+        income_by_demand_id[row["demand_id"]] = income_by_demand_id.get(row["demand_id"], 0.0) + row["income"]
+
+    demand_names = {d.demand_id: d.description for d in db.query(models.Demand).all()}
+    income_by_demand = {
+        demand_names.get(demand_id, f"Demanda {demand_id}"): round(amount, 2)
+        for demand_id, amount in income_by_demand_id.items()
+    }
+
+    total_bookings = sum(b["bookings"] for b in buckets.values())
+    total_cancelled = sum(b["cancelled"] for b in buckets.values())
+    total_income = sum(b["income"] for b in buckets.values())
+    total_all = total_bookings + total_cancelled
+
+    # Ocupación frente al calendario de capacidad (franjas realmente reservables)
+    capacity_by_court = capacity_service.get_capacity_by_court(db, date_from, date_to)
+    total_capacity = sum(capacity_by_court.values())
+    court_occupancy_pct = {
+        f"Pista {court_id}": round(court_occupancy.get(f"Pista {court_id}", 0) / slots * 100, 1)
+        for court_id, slots in sorted(capacity_by_court.items()) if slots > 0
+    }
+
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "granularity": granularity,
+
+        "total_bookings": total_bookings,
+        "total_cancelled": total_cancelled,
+        "total_income": round(total_income, 2),
+        "cancellation_rate": round((total_cancelled / total_all) * 100, 1) if total_all > 0 else 0.0,
+        "avg_ticket": round(total_income / max(total_bookings, 1), 2),
+        "total_capacity": total_capacity,
+        "avg_occupancy": round(total_bookings / total_capacity * 100, 1) if total_capacity > 0 else 0.0,
+
+        "court_occupancy": court_occupancy,
+        "court_occupancy_pct": court_occupancy_pct,
+        "income_by_demand": income_by_demand,
+
+        "trend": [
+            {
+                "period": _bucket_label(start, granularity),
+                "period_start": start.isoformat(),
+                "bookings": values["bookings"],
+                "cancelled": values["cancelled"],
+                "income": round(values["income"], 2)
+            }
+            for start, values in buckets.items()
+        ]
+    }
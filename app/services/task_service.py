@@ -9,19 +9,39 @@ Este servicio:
 4. Mantiene un historial de ejecuciones
 """
 
+from collections import namedtuple
+from concurrent.futures import wait
 from datetime import datetime, timedelta
+from sqlalchemy import func, cast, extract, and_, or_, update, Integer
 from sqlalchemy.orm import Session
 import logging
 import json
+import os
+import socket
+import time
+import uuid
 from .. import models, database
 from .notification_service import (
     send_email,
-    create_notification_record,
-    generate_reminder_email
+    render_email
 )
+from .notification_recorder import notification_row, insert_notifications
+from .task_wakeup import notify_work_due
 
 logger = logging.getLogger(__name__)
 
+# Número de emails de cambio de precio que se encolan por cada INSERT en bloque
+PRICE_FANOUT_BATCH_SIZE = int(os.getenv("PRICE_FANOUT_BATCH_SIZE", 500))
+
+# Tareas reclamadas y procesadas por lote (un commit por lote)
+TASK_CLAIM_BATCH_SIZE = int(os.getenv("TASK_CLAIM_BATCH_SIZE", 200))
+
+# Segundos que una tarea reclamada queda reservada para su worker. Si el worker
+# muere antes de terminarla, otro la vuelve a tomar al vencer (puede repetirse el envío).
+# Mientras un lote se procesa, la reserva se renueva cada TASK_LEASE_SECONDS / 3
+# (ver TaskLease), así que un lote lento (límite por dominio, timeouts SMTP) no la pierde
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", 300))
+
 
 def schedule_reminder_task(
     db: Session,
@@ -77,6 +97,7 @@ def schedule_reminder_task(
         )
         
         db.add(scheduled_task)
+        notify_work_due(db, scheduled_for)
         db.commit()
         db.refresh(scheduled_task)
         
@@ -96,7 +117,93 @@ def schedule_reminder_task(
         return False
 
 
-def process_pending_tasks(db: Session) -> dict:
+def claim_pending_tasks(db: Session, limit: int = None, lease_seconds: int = TASK_LEASE_SECONDS) -> list:
+    """
+    Reclama tareas vencidas para este proceso, de forma que varios workers (el worker,
+    el cron del scheduler, el arranque de la aplicación) no ejecuten la misma tarea.
+
+    En PostgreSQL la selección usa FOR UPDATE SKIP LOCKED: las filas que otro worker
+    está reclamando en ese momento se saltan en lugar de esperar. La reserva dura
+    lease_seconds (locked_until); el UPDATE solo toma filas sin reserva vigente, lo que
+    también evita duplicados en bases sin bloqueo de filas.
+
+    Args:
+        db: Sesión de base de datos
+        limit: Máximo de tareas a reclamar (None = todas las vencidas)
+        lease_seconds: Duración de la reserva
+
+    Returns:
+        list: Tareas reclamadas, por orden de vencimiento
+    """
+    now = datetime.utcnow()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    available = or_(models.ScheduledTask.locked_until.is_(None), models.ScheduledTask.locked_until < now)
+
+    query = db.query(models.ScheduledTask.task_id).filter(
+        models.ScheduledTask.is_executed == False,
+        models.ScheduledTask.scheduled_for <= now,
+        available
+    ).order_by(models.ScheduledTask.scheduled_for)
+    if limit:
+        query = query.limit(limit)
+    ids = [task_id for task_id, in query.with_for_update(skip_locked=True).all()]
+
+    if not ids:
+        db.commit()
+        return []
+
+    db.execute(
+        update(models.ScheduledTask)
+        .where(models.ScheduledTask.task_id.in_(ids), available)
+        .values(locked_by=owner, locked_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    # Releer tras el commit: solo las que ganó este proceso, y sin atributos caducados
+    return db.query(models.ScheduledTask).filter(
+        models.ScheduledTask.task_id.in_(ids),
+        models.ScheduledTask.locked_by == owner
+    ).order_by(models.ScheduledTask.scheduled_for).all()
+
+
+class TaskLease:
+    """
+    Reserva de un lote de tareas reclamadas. Se renueva desde el propio hilo del worker
+    mientras se procesa el lote, con una conexión aparte para no caducar los objetos
+    de la sesión.
+    """
+
+    def __init__(self, db: Session, tasks: list, lease_seconds: int = TASK_LEASE_SECONDS):
+        self.bind = db.get_bind()
+        self.task_ids = [task.task_id for task in tasks]
+        self.owner = tasks[0].locked_by if tasks else None
+        self.lease_seconds = lease_seconds
+        self.renew_every = lease_seconds / 3
+        self._renewed = time.monotonic()
+
+    def renew_if_due(self) -> None:
+        """Amplía la reserva de las tareas aún no ejecutadas si ha pasado un tercio de ella."""
+        if not self.task_ids or time.monotonic() - self._renewed < self.renew_every:
+            return
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(
+                    update(models.ScheduledTask)
+                    .where(
+                        models.ScheduledTask.task_id.in_(self.task_ids),
+                        models.ScheduledTask.locked_by == self.owner,
+                        models.ScheduledTask.is_executed == False
+                    )
+                    .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                )
+            self._renewed = time.monotonic()
+            logger.debug(f"Reserva renovada para {len(self.task_ids)} tareas ({self.owner})")
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo renovar la reserva de las tareas: {str(e)}")
+
+
+def process_pending_tasks(db: Session, batch_size: int = None) -> dict:
     """
     Procesa todas las tareas programadas que están pendientes.
     
@@ -105,39 +212,55 @@ def process_pending_tasks(db: Session) -> dict:
     - Un worker de Celery
     - Un endpoint POST interno (como APScheduler hace polling)
     
+    Se puede llamar desde varios procesos a la vez: cada uno ejecuta solo las
+    tareas que ha reclamado (ver claim_pending_tasks).
+    
+    Las tareas se reclaman por lotes de batch_size. Por cada lote se cargan los
+    usuarios en una consulta, los emails se envían en paralelo con el despachador
+    y el estado de las tareas se guarda con un único commit, así que ponerse al
+    día tras una parada depende del ritmo de envío y no de los viajes a la BD.
+    
+    Args:
+        db: Sesión de base de datos
+        batch_size: Tareas por lote (por defecto TASK_CLAIM_BATCH_SIZE)
+    
     Returns:
         dict: Estadísticas de ejecución {
             "total_processed": int,
             "successful": int,
             "failed": int,
-            "still_pending": int
+            "still_pending": int,
+            "batches": int
         }
     """
+    batch_size = batch_size or TASK_CLAIM_BATCH_SIZE
     stats = {
         "total_processed": 0,
         "successful": 0,
         "failed": 0,
-        "still_pending": 0
+        "still_pending": 0,
+        "batches": 0
     }
     
     try:
-        # Obtener todas las tareas pendientes que ya deberían haberse ejecutado
-        pending_tasks = db.query(models.ScheduledTask).filter(
-            models.ScheduledTask.is_executed == False,
-            models.ScheduledTask.scheduled_for <= datetime.utcnow()
-        ).all()
-        
-        logger.info(f"Procesando {len(pending_tasks)} tareas pendientes...")
-        
-        for task in pending_tasks:
-            success = _execute_task(db, task)
+        while True:
+            # Reclamar el siguiente lote de tareas que ya deberían haberse ejecutado
+            pending_tasks = claim_pending_tasks(db, limit=batch_size)
+            if not pending_tasks:
+                break
             
-            if success:
-                stats["successful"] += 1
-            else:
-                stats["failed"] += 1
+            logger.info(f"Procesando lote de {len(pending_tasks)} tareas pendientes...")
+            for success in _process_task_batch(db, pending_tasks):
+                if success:
+                    stats["successful"] += 1
+                else:
+                    stats["failed"] += 1
+                stats["total_processed"] += 1
+            stats["batches"] += 1
             
-            stats["total_processed"] += 1
+            # Las tareas fallidas siguen reservadas, así que un lote incompleto es el último
+            if len(pending_tasks) < batch_size:
+                break
         
         # Contar tareas que todavía están pendientes (futuro)
         still_pending = db.query(models.ScheduledTask).filter(
@@ -160,6 +283,66 @@ def process_pending_tasks(db: Session) -> dict:
     return stats
 
 
+def _process_task_batch(db: Session, tasks: list) -> list:
+    """
+    Ejecuta un lote de tareas reclamadas.
+    
+    Las tareas de email se preparan con los usuarios ya cargados, se envían en paralelo
+    y se registran todas con un INSERT en bloque y un commit. Las demás (ej. fan-out de
+    precios) se ejecutan después, en serie y con su propia transacción.
+    
+    La reserva del lote se renueva mientras se esperan los envíos y antes de cada
+    tarea en serie.
+    
+    Returns:
+        list: Por cada tarea procesada, True si se ejecutó correctamente
+    """
+    lease = TaskLease(db, tasks)
+    email_tasks = [task for task in tasks if task.task_type in _EMAIL_TASK_BUILDERS]
+    other_tasks = [task for task in tasks if task.task_type not in _EMAIL_TASK_BUILDERS]
+    results = _process_email_batch(db, email_tasks, lease) if email_tasks else []
+    for task in other_tasks:
+        lease.renew_if_due()
+        results.append(_execute_task(db, task))
+    return results
+
+
+def _process_email_batch(db: Session, email_tasks: list, lease: TaskLease) -> list:
+    """Envía en paralelo los emails de un lote y guarda su estado con un único commit."""
+    # Cargar de una vez los usuarios del lote: los constructores los obtienen con
+    # db.get del mapa de identidad de la sesión, sin una consulta por tarea
+    # (la lista mantiene las referencias mientras dura el lote)
+    user_ids = {task.user_id for task in email_tasks}
+    users = db.query(models.User).filter(models.User.user_id.in_(user_ids)).all()
+    
+    prepared, failed = [], []
+    for task in email_tasks:
+        try:
+            prepared.append(_prepare_email_task(db, task))
+        except Exception as e:
+            failed.append((task, e))
+    
+    sent = []
+    if prepared:
+        from .email_dispatcher import get_dispatcher
+        dispatcher = get_dispatcher()
+        # submit espera si la cola del despachador está llena (backpressure)
+        futures = [dispatcher.submit(job) for _, job, _, _ in prepared]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=lease.renew_every)
+            lease.renew_if_due()
+        
+        # Los resultados se registran en este hilo (la sesión de BD no se comparte)
+        sent = [
+            (task, job, notification_type, params, future.result())
+            for (task, job, notification_type, params), future in zip(prepared, futures)
+        ]
+    
+    del users
+    return _finish_email_tasks(db, sent, failed) + [False] * len(failed)
+
+
 def _execute_task(db: Session, task: models.ScheduledTask) -> bool:
     """
     Ejecuta una tarea programada.
@@ -175,8 +358,12 @@ def _execute_task(db: Session, task: models.ScheduledTask) -> bool:
         # Parsear datos
         task_data = json.loads(task.task_data)
         
-        if task.task_type == "reminder_24h":
-            return _execute_reminder_task(db, task, task_data)
+        if task.task_type in _EMAIL_TASK_BUILDERS:
+            job, notification_type, params = _EMAIL_TASK_BUILDERS[task.task_type](db, task, task_data)
+            email_sent = send_email(job.to_email, job.subject, job.html_content)
+            return _finish_email_tasks(db, [(task, job, notification_type, params, email_sent)])[0]
+        elif task.task_type == "price_update_fanout":
+            return _execute_price_update_fanout(db, task, task_data)
         else:
             logger.error(f"Tipo de tarea desconocida: {task.task_type}")
             task.is_executed = True
@@ -186,112 +373,356 @@ def _execute_task(db: Session, task: models.ScheduledTask) -> bool:
             return False
             
     except Exception as e:
-        logger.error(f"✗ Error ejecutando tarea {task.task_id}: {str(e)}", exc_info=True)
-        
-        # Registrar el error en la BD
-        task.retry_count += 1
-        task.last_error = str(e)
-        
-        # Marcar como ejecutada después de 3 reintentos
-        if task.retry_count >= 3:
-            task.is_executed = True
-            task.executed_at = datetime.utcnow()
-            logger.error(f"✗ Tarea {task.task_id} abortada tras 3 reintentos")
-        
-        db.commit()
+        _record_task_error(db, task, e)
         return False
 
 
-def _execute_reminder_task(db: Session, task: models.ScheduledTask, task_data: dict) -> bool:
+def _record_task_error(db: Session, task: models.ScheduledTask, error: Exception) -> None:
+    """
+    Registra el error de una tarea y la da por fallida tras 3 reintentos.
+    """
+    db.rollback()
+    _mark_task_error(task, error)
+    db.commit()
+
+
+def _mark_task_error(task: models.ScheduledTask, error: Exception) -> None:
+    """
+    Anota el error en la tarea sin hacer commit (se guarda con el resto del lote).
     """
-    Ejecuta una tarea de recordatorio de reserva.
+    logger.error(f"✗ Error ejecutando tarea {task.task_id}: {str(error)}", exc_info=error)
+    
+    task.retry_count += 1
+    task.last_error = str(error)
+    
+    # Marcar como ejecutada después de 3 reintentos; mientras tanto se vuelve
+    # a intentar cuando vence la reserva del worker (locked_until)
+    if task.retry_count >= 3:
+        task.is_executed = True
+        task.executed_at = datetime.utcnow()
+        logger.error(f"✗ Tarea {task.task_id} abortada tras 3 reintentos")
+
+
+def _prepare_email_task(db: Session, task: models.ScheduledTask):
+    """
+    Construye el email de una tarea sin enviarlo.
+    
+    Returns:
+        tuple: (task, EmailJob, notification_type, template_params)
+    
+    Raises:
+        Exception: Si no se pudo construir (datos inválidos, usuario inexistente...)
+    """
+    task_data = json.loads(task.task_data)
+    job, notification_type, params = _EMAIL_TASK_BUILDERS[task.task_type](db, task, task_data)
+    return task, job, notification_type, params
+
+
+def _finish_email_tasks(db: Session, results: list, failed: list = ()) -> list:
+    """
+    Registra las notificaciones de varias tareas de email y las marca como ejecutadas
+    (se haya enviado o no el email, como hasta ahora) en una sola transacción.
     
     Args:
         db: Sesión de base de datos
-        task: Objeto ScheduledTask
-        task_data: Datos de la tarea (diccionario)
+        results: Lista de (task, EmailJob, notification_type, template_params, email_sent)
+        failed: Lista de (task, error) de tareas del mismo lote que no se pudieron
+            preparar; su error se guarda en la misma transacción
         
     Returns:
-        bool: True si ejecutó exitosamente
+        list: Por cada tarea de results, True si el email se envió
     """
+    now = datetime.utcnow()
+    # Datos para el log antes del commit (después los objetos quedan caducados)
+    summary = [
+        (task.task_id, task.booking_id, job.to_email, notification_type, email_sent)
+        for task, job, notification_type, _, email_sent in results
+    ]
     try:
-        recipient_email = task_data.get("recipient_email")
-        court_number = task_data.get("court_number")
-        start_time_str = task_data.get("start_time_str")
-        
-        # Obtener usuario
-        user = db.query(models.User).filter(
-            models.User.user_id == task.user_id
-        ).first()
-        
-        if not user:
-            raise ValueError(f"Usuario {task.user_id} no encontrado")
-        
-        # Parsear fecha
-        from datetime import datetime as dt_class
-        start_time = dt_class.fromisoformat(start_time_str)
-        
-        # Generar y enviar email
-        html_content = generate_reminder_email(
-            user_name=user.name,
-            court_number=court_number,
-            start_time=start_time.strftime("%H:%M")
-        )
-        
-        email_sent = send_email(
-            to_email=recipient_email,
-            subject="⏰ Recordatorio de tu reserva",
-            html_content=html_content
-        )
-        
-        # Registrar notificación
-        create_notification_record(
-            db=db,
-            user_id=task.user_id,
-            recipient_email=recipient_email,
-            notification_type="reminder_24h",
-            subject="⏰ Recordatorio de tu reserva",
-            content=html_content,
-            booking_id=task.booking_id,
-            is_sent=email_sent
-        )
+        insert_notifications(db, [
+            notification_row(
+                user_id=task.user_id,
+                recipient_email=job.to_email,
+                notification_type=notification_type,
+                subject=job.subject,
+                booking_id=task.booking_id,
+                is_sent=email_sent,
+                template_key=notification_type,
+                template_params=params
+            )
+            for task, job, notification_type, params, email_sent in results
+        ])
         
-        # Marcar tarea como ejecutada
-        task.is_executed = True
-        task.executed_at = datetime.utcnow()
+        # Marcar tareas como ejecutadas
+        for task, *_ in results:
+            task.is_executed = True
+            task.executed_at = now
+        for task, error in failed:
+            _mark_task_error(task, error)
         db.commit()
-        
+    except Exception as e:
+        db.rollback()
+        for task, error in failed:
+            _mark_task_error(task, error)
+        for task, *_ in results:
+            _mark_task_error(task, e)
+        db.commit()
+        return [False] * len(results)
+    
+    for task_id, booking_id, to_email, notification_type, email_sent in summary:
         if email_sent:
             logger.info(
-                f"✓ Recordatorio enviado: booking_id={task.booking_id}, "
-                f"email={recipient_email}, task_id={task.task_id}"
+                f"✓ Email '{notification_type}' enviado: booking_id={booking_id}, "
+                f"email={to_email}, task_id={task_id}"
             )
         else:
             logger.warning(
-                f"⚠️ Email de recordatorio no se envió (pero tarea marcada como ejecutada): "
-                f"booking_id={task.booking_id}, email={recipient_email}"
+                f"⚠️ Email '{notification_type}' no se envió (pero tarea marcada como ejecutada): "
+                f"booking_id={booking_id}, email={to_email}"
             )
+    
+    return [email_sent for *_, email_sent in summary]
+
+
+def _build_reminder_email(db: Session, task: models.ScheduledTask, task_data: dict):
+    """
+    Construye el email de recordatorio de reserva.
+    
+    Args:
+        db: Sesión de base de datos
+        task: Objeto ScheduledTask
+        task_data: Datos de la tarea (diccionario)
         
-        return email_sent
-        
-    except Exception as e:
-        logger.error(
-            f"✗ Error ejecutando tarea de recordatorio {task.task_id}: {str(e)}",
-            exc_info=True
+    Returns:
+        tuple: (EmailJob, notification_type, template_params)
+    """
+    from .email_dispatcher import EmailJob
+    
+    recipient_email = task_data.get("recipient_email")
+    court_number = task_data.get("court_number")
+    start_time_str = task_data.get("start_time_str")
+    
+    # Obtener usuario (sin consulta si el lote ya lo cargó en la sesión)
+    user = db.get(models.User, task.user_id)
+    
+    if not user:
+        raise ValueError(f"Usuario {task.user_id} no encontrado")
+    
+    # Parsear fecha
+    start_time = datetime.fromisoformat(start_time_str)
+    
+    params = {
+        "user_name": user.name,
+        "court_number": court_number,
+        "start_time": start_time.strftime("%H:%M")
+    }
+    html_content = render_email("reminder_24h", params)
+    
+    return EmailJob(recipient_email, "⏰ Recordatorio de tu reserva", html_content), "reminder_24h", params
+
+
+def schedule_price_update_fanout(db: Session, demand_id: int, price_id: int, amount: float,
+                                 start_date: datetime, requested_by: int) -> models.ScheduledTask:
+    """
+    Encola el aviso de un cambio de precio a los usuarios afectados.
+
+    Solo inserta UNA tarea: la búsqueda de usuarios y el envío se hacen después en el worker,
+    nunca dentro de la petición del administrador.
+
+    Args:
+        db: Sesión de base de datos
+        demand_id: Nivel de demanda cuyo precio ha cambiado
+        price_id: ID del nuevo precio
+        amount: Nuevo importe
+        start_date: Fecha de entrada en vigor del nuevo precio
+        requested_by: ID del administrador que hizo el cambio (propietario de la tarea)
+
+    Returns:
+        models.ScheduledTask: La tarea creada
+    """
+    task = models.ScheduledTask(
+        user_id=requested_by,
+        booking_id=None,
+        task_type="price_update_fanout",
+        scheduled_for=datetime.utcnow(),
+        task_data=json.dumps({
+            "demand_id": demand_id,
+            "price_id": price_id,
+            "amount": amount,
+            "start_date": start_date.isoformat()
+        }),
+        is_executed=False
+    )
+    db.add(task)
+    notify_work_due(db, task.scheduled_for)
+    db.commit()
+    db.refresh(task)
+
+    logger.info(f"✓ Fan-out de cambio de precio encolado: demand_id={demand_id}, price_id={price_id}, task_id={task.task_id}")
+    return task
+
+
+AffectedUser = namedtuple("AffectedUser", ["user_id", "email", "name", "bookings", "first_start"])
+
+
+def find_users_affected_by_demand(db: Session, demand_id: int, since: datetime) -> list:
+    """
+    Usuarios con reservas futuras en franjas asignadas a un nivel de demanda.
+
+    Las reservas de días normales se resuelven con una única consulta: reservas activas
+    desde 'since' cruzadas con el cuadrante (Schedule) por día de la semana y hora de
+    inicio. Las de días festivos (pocas) se excluyen de esa consulta y se resuelven con
+    las reglas de festivo (holiday_service.get_demand_at).
+
+    Returns:
+        list: AffectedUser (user_id, email, name, bookings, first_start)
+    """
+    from .holiday_service import get_demand_at, get_holiday_map
+
+    # Día de la semana con 0=Lunes (igual que Schedule.day_of_week); 'dow' devuelve 0=Domingo
+    booking_weekday = (cast(extract('dow', models.Booking.start_time), Integer) + 6) % 7
+    booking_minutes = cast(extract('hour', models.Booking.start_time), Integer) * 60 + \
+        cast(extract('minute', models.Booking.start_time), Integer)
+    schedule_minutes = cast(extract('hour', models.Schedule.start_time), Integer) * 60 + \
+        cast(extract('minute', models.Schedule.start_time), Integer)
+
+    holiday_days = [day for day in get_holiday_map(db) if day >= since.date()]
+    on_holiday = or_(*[
+        and_(
+            models.Booking.start_time >= datetime.combine(day, datetime.min.time()),
+            models.Booking.start_time < datetime.combine(day + timedelta(days=1), datetime.min.time())
         )
-        
-        # Registrar error
-        task.retry_count += 1
-        task.last_error = str(e)
-        
-        # Después de 3 reintentos, marcar como ejecutada (dar por fallida)
-        if task.retry_count >= 3:
-            task.is_executed = True
-            task.executed_at = datetime.utcnow()
-            logger.error(f"✗ Tarea {task.task_id} abortada tras 3 reintentos")
-        
-        db.commit()
-        return False
+        for day in holiday_days
+    ]) if holiday_days else None
+
+    query = db.query(
+        models.User.user_id,
+        models.User.email,
+        models.User.name,
+        func.count(models.Booking.booking_id).label("bookings"),
+        func.min(models.Booking.start_time).label("first_start")
+    ).join(
+        models.Booking, models.Booking.user_id == models.User.user_id
+    ).join(
+        models.Schedule, and_(
+            models.Schedule.day_of_week == booking_weekday,
+            schedule_minutes == booking_minutes
+        )
+    ).filter(
+        models.Schedule.demand_id == demand_id,
+        models.Booking.start_time >= since,
+        models.Booking.is_cancelled == False
+    )
+    if on_holiday is not None:
+        query = query.filter(~on_holiday)
+
+    affected = {
+        row.user_id: AffectedUser(row.user_id, row.email, row.name, row.bookings, row.first_start)
+        for row in query.group_by(models.User.user_id, models.User.email, models.User.name).all()
+    }
+    if on_holiday is None:
+        return list(affected.values())
+
+    holiday_bookings = db.query(
+        models.User.user_id, models.User.email, models.User.name, models.Booking.start_time
+    ).join(
+        models.Booking, models.Booking.user_id == models.User.user_id
+    ).filter(
+        on_holiday,
+        models.Booking.start_time >= since,
+        models.Booking.is_cancelled == False
+    ).all()
+
+    for user_id, email, name, start_time in holiday_bookings:
+        if get_demand_at(db, start_time) != demand_id:
+            continue
+        user = affected.get(user_id)
+        if user is None:
+            affected[user_id] = AffectedUser(user_id, email, name, 1, start_time)
+        else:
+            affected[user_id] = user._replace(bookings=user.bookings + 1,
+                                              first_start=min(user.first_start, start_time))
+
+    return list(affected.values())
+
+
+def _execute_price_update_fanout(db: Session, task: models.ScheduledTask, task_data: dict) -> bool:
+    """
+    Ejecuta el fan-out de un cambio de precio: localiza a los usuarios afectados con una
+    consulta set-based y encola un email por usuario (deduplicado) en INSERTs por lotes,
+    todo en una transacción.
+    """
+    demand_id = task_data["demand_id"]
+    amount = task_data["amount"]
+    start_date = datetime.fromisoformat(task_data["start_date"])
+
+    demand = db.query(models.Demand).filter(models.Demand.demand_id == demand_id).first()
+    time_slot = f"Franjas de {demand.description.lower() if demand and demand.description else f'demanda {demand_id}'} " \
+        f"(desde el {start_date.strftime('%d/%m/%Y %H:%M')})"
+
+    affected = find_users_affected_by_demand(db, demand_id, max(datetime.utcnow(), start_date))
+    now = datetime.utcnow()
+
+    rows = [{
+        "user_id": user.user_id,
+        "booking_id": None,
+        "task_type": "price_update_email",
+        "scheduled_for": now,
+        "task_data": json.dumps({
+            "recipient_email": user.email,
+            "user_name": user.name,
+            "amount": amount,
+            "time_slot": time_slot,
+            "bookings": user.bookings
+        }),
+        "is_executed": False,
+        "retry_count": 0,
+        "created_at": now
+    } for user in affected]
+
+    # Los INSERT por lotes y la tarea ejecutada van en la misma transacción: si algo falla
+    # y la tarea se vuelve a reclamar, no quedan avisos duplicados de un intento anterior
+    for start in range(0, len(rows), PRICE_FANOUT_BATCH_SIZE):
+        db.execute(models.ScheduledTask.__table__.insert(), rows[start:start + PRICE_FANOUT_BATCH_SIZE])
+    if rows:
+        notify_work_due(db, now)
+
+    task.is_executed = True
+    task.executed_at = datetime.utcnow()
+    db.commit()
+
+    logger.info(
+        f"✓ Fan-out de precio completado: demand_id={demand_id}, "
+        f"{len(rows)} usuarios avisados, task_id={task.task_id}"
+    )
+    return True
+
+
+def _build_price_update_email(db: Session, task: models.ScheduledTask, task_data: dict):
+    """
+    Construye el email de cambio de precio de un usuario (tarea generada por el fan-out).
+    Los datos del destinatario viajan en la tarea, sin volver a consultar el usuario.
+    
+    Returns:
+        tuple: (EmailJob, notification_type, template_params)
+    """
+    from .email_dispatcher import EmailJob
+    
+    params = {
+        "user_name": task_data.get("user_name", ""),
+        "new_price": task_data["amount"],
+        "time_slot": task_data["time_slot"]
+    }
+    html_content = render_email("price_update", params)
+    
+    return EmailJob(task_data["recipient_email"], "💰 Actualización de precios", html_content), "price_update", params
+
+
+# Tareas que consisten en enviar un email: tipo de tarea -> constructor del email
+_EMAIL_TASK_BUILDERS = {
+    "reminder_24h": _build_reminder_email,
+    "price_update_email": _build_price_update_email,
+}
 
 
 def cancel_pending_task(db: Session, booking_id: int) -> bool:
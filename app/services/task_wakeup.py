@@ -0,0 +1,148 @@
+"""
+Despertar del task worker cuando hay trabajo, en lugar de revisar cada 60 segundos.
+
+- El worker duerme hasta el siguiente vencimiento (tarea programada o reintento
+  de notificación), que obtiene con una sola consulta MIN.
+- En PostgreSQL, cada vez que se programa trabajo se emite un NOTIFY en el canal
+  TASK_CHANNEL con su vencimiento: al crear una tarea (`scheduled_for`) y al dejar
+  una notificación en la cola de reintentos (`next_attempt_at`, desde el buffer de
+  notificaciones, el despachador o los reintentos). El worker hace LISTEN y se
+  despierta antes si el nuevo trabajo vence antes de lo que iba a dormir. El NOTIFY
+  se entrega al hacer commit, así que el worker nunca ve trabajo que aún no existe.
+- En otras bases de datos (o si LISTEN falla) el worker duerme como mucho el
+  intervalo de sondeo, como antes.
+"""
+
+import logging
+import select
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, case, func, select as sql_select, text
+from sqlalchemy.orm import Session
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+TASK_CHANNEL = "scheduled_tasks"
+
+
+def notify_work_due(db: Session, due_at: Optional[datetime]) -> None:
+    """
+    Avisa a los workers de trabajo nuevo que vence en `due_at`: una tarea programada
+    o un reintento de notificación (solo PostgreSQL; en otras bases no hace nada).
+    Se entrega al hacer commit de la transacción actual.
+    """
+    if due_at is None or db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(text("SELECT pg_notify(:channel, :payload)"),
+               {"channel": TASK_CHANNEL, "payload": due_at.isoformat()})
+
+
+def get_next_due_time(db: Session) -> Optional[datetime]:
+    """
+    Próximo vencimiento entre las tareas pendientes y los reintentos de notificaciones.
+    Las tareas reclamadas por un worker cuentan a partir del fin de su reserva.
+
+    Returns:
+        datetime o None si no hay nada pendiente
+    """
+    from .notification_retry_service import STATUS_RETRY
+
+    # Una tarea reclamada por otro worker no está disponible hasta que vence su reserva
+    task = models.ScheduledTask
+    available_at = case(
+        (and_(task.locked_until.isnot(None), task.locked_until > task.scheduled_for), task.locked_until),
+        else_=task.scheduled_for
+    )
+    next_task = sql_select(func.min(available_at)).where(task.is_executed == False).scalar_subquery()
+    next_retry = sql_select(func.min(models.Notification.next_attempt_at)).where(
+        models.Notification.status == STATUS_RETRY
+    ).scalar_subquery()
+
+    task_due, retry_due = db.execute(sql_select(next_task, next_retry)).one()
+    due = [d for d in (task_due, retry_due) if d is not None]
+    return min(due) if due else None
+
+
+class TaskWakeup:
+    """
+    Espera del worker entre ciclos: LISTEN en PostgreSQL, simple sleep en otras bases.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._raw = None
+        self._conn = None
+        if engine.dialect.name == "postgresql":
+            self._listen()
+
+    @property
+    def listening(self) -> bool:
+        """Indica si se reciben avisos de tareas nuevas."""
+        return self._conn is not None
+
+    def _listen(self) -> None:
+        try:
+            # Conexión propia fuera del pool: al cerrarla se cierra de verdad
+            self._raw = self.engine.raw_connection()
+            self._raw.detach()
+            conn = self._raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {TASK_CHANNEL}")
+            self._conn = conn
+            logger.info(f"Escuchando avisos de tareas nuevas (LISTEN {TASK_CHANNEL})")
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo hacer LISTEN {TASK_CHANNEL}, se usará sondeo: {str(e)}")
+            self.close()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Duerme hasta `timeout` segundos o hasta que se cree una tarea que venza antes.
+
+        Returns:
+            bool: True si se despertó por una tarea nueva
+        """
+        if self._conn is None and self.engine.dialect.name == "postgresql":
+            self._listen()
+        if self._conn is None:
+            time.sleep(max(0.0, timeout))
+            return False
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if select.select([self._conn], [], [], remaining) == ([], [], []):
+                    return False
+
+                self._conn.poll()
+                wake_at = datetime.utcnow() + timedelta(seconds=deadline - time.monotonic())
+                notifies, self._conn.notifies[:] = list(self._conn.notifies), []
+                for notify in notifies:
+                    try:
+                        scheduled_for = datetime.fromisoformat(notify.payload)
+                    except ValueError:
+                        return True
+                    if scheduled_for < wake_at:
+                        return True
+        except Exception as e:
+            # Conexión perdida: se vuelve a escuchar en la siguiente espera
+            logger.warning(f"⚠️  Error esperando avisos de tareas: {str(e)}")
+            self.close()
+            return True
+
+    def close(self) -> None:
+        """Cierra la conexión de escucha."""
+        if self._raw is not None:
+            try:
+                self._raw.close()
+            except Exception:
+                pass
+        self._raw = None
+        self._conn = None
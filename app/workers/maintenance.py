@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tareas de mantenimiento de la base de datos.
+
+Uso:
+    python -m app.workers.maintenance compact-notifications [--batch-size 1000] [--dry-run]
+    python -m app.workers.maintenance retention [--notification-days 180] [--task-days 30] [--batch-size 1000] [--dry-run]
+    python -m app.workers.maintenance stats
+
+compact-notifications:
+    Las notificaciones antiguas guardan el HTML completo del email en `content`.
+    Este comando lo comprime (zlib + base64) en `template_params` con la plantilla
+    'legacy_html' y vacía `content`, por lotes y con un commit por lote, de modo que
+    se puede interrumpir y relanzar. Las notificaciones nuevas ya se guardan como
+    plantilla + parámetros y no hace falta migrarlas.
+
+    Antes hay que aplicar scripts_sql/alter_notifications.sql. En PostgreSQL el
+    espacio liberado no vuelve al sistema hasta un VACUUM FULL notifications
+    (o pg_repack); un VACUUM normal basta para que se reutilice.
+
+retention:
+    Archiva las notificaciones antiguas en notifications_archive y borra las tareas
+    ejecutadas antiguas (ver services/retention_service.py). Es lo mismo que ejecuta
+    cada noche el scheduler. Requiere scripts_sql/create_notifications_archive.sql.
+
+stats:
+    Filas de las tablas de notificaciones y tareas y resultado de la última retención.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Agregar la raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import update
+
+from app import database, models
+from app.services.notification_service import LEGACY_HTML_TEMPLATE, compress_html
+from app.services import retention_service
+
+logger = logging.getLogger(__name__)
+
+# Notificaciones que se migran por transacción
+DEFAULT_BATCH_SIZE = 1000
+
+
+def compact_notifications(db, batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Comprime el HTML de las notificaciones que aún no usan plantilla.
+
+    Args:
+        db: Sesión de base de datos
+        batch_size: Notificaciones por lote
+        dry_run: Solo calcula el ahorro, sin escribir
+
+    Returns:
+        dict: Filas migradas y bytes de contenido antes/después
+    """
+    stats = {"rows": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+
+    while True:
+        rows = db.query(models.Notification.notification_id, models.Notification.content).filter(
+            models.Notification.template_key.is_(None),
+            models.Notification.content.isnot(None),
+            models.Notification.notification_id > last_id
+        ).order_by(models.Notification.notification_id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        updates = []
+        for notification_id, content in rows:
+            params = json.dumps({"html_z": compress_html(content)})
+            stats["bytes_before"] += len(content.encode("utf-8"))
+            stats["bytes_after"] += len(params)
+            updates.append({
+                "notification_id": notification_id,
+                "template_key": LEGACY_HTML_TEMPLATE,
+                "template_params": params,
+                "content": None
+            })
+
+        if not dry_run:
+            # UPDATE en bloque por clave primaria
+            db.execute(update(models.Notification), updates)
+            db.commit()
+
+        stats["rows"] += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"Notificaciones compactadas: {stats['rows']} (hasta id {last_id})")
+
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de la base de datos")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact = commands.add_parser("compact-notifications", help="Comprime el HTML de las notificaciones antiguas")
+    compact.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    compact.add_argument("--dry-run", action="store_true", help="Solo calcula el ahorro, sin escribir")
+
+    retention = commands.add_parser("retention", help="Archiva notificaciones y borra tareas ejecutadas antiguas")
+    retention.add_argument("--notification-days", type=int, default=retention_service.NOTIFICATION_RETENTION_DAYS)
+    retention.add_argument("--task-days", type=int, default=retention_service.TASK_RETENTION_DAYS)
+    retention.add_argument("--batch-size", type=int, default=retention_service.RETENTION_BATCH_SIZE)
+    retention.add_argument("--dry-run", action="store_true", help="Solo cuenta las filas afectadas")
+
+    commands.add_parser("stats", help="Tamaño de las tablas y última retención")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    db = database.session_local()
+    try:
+        if args.command == "compact-notifications":
+            stats = compact_notifications(db, args.batch_size, args.dry_run)
+            ratio = stats["bytes_before"] / stats["bytes_after"] if stats["bytes_after"] else 0
+            print(
+                f"{'[dry-run] ' if args.dry_run else ''}{stats['rows']} notificaciones: "
+                f"{stats['bytes_before']} -> {stats['bytes_after']} bytes ({ratio:.1f}x)"
+            )
+        elif args.command == "retention":
+            result = retention_service.run_retention(
+                db, args.notification_days, args.task_days, args.batch_size, args.dry_run
+            )
+            print(
+                f"{'[dry-run] ' if args.dry_run else ''}{result['notifications_archived']} notificaciones archivadas, "
+                f"{result['tasks_purged']} tareas borradas ({result['batches']} lotes, {result['duration_seconds']}s)"
+            )
+        elif args.command == "stats":
+            print(json.dumps(retention_service.get_retention_statistics(db), indent=2))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
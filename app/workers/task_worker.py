@@ -3,7 +3,10 @@
 Worker que procesa tareas programadas pendientes.
 
 Este script debe correrse en paralelo con la aplicación principal.
-Periódicamente revisa la BD y procesa tareas que están listas para ejecutarse.
+Duerme hasta el siguiente vencimiento (tarea programada o reintento de
+notificación) y entonces procesa lo que esté listo. En PostgreSQL se despierta
+antes si se crea una tarea que vence antes (LISTEN/NOTIFY, ver
+services/task_wakeup.py); en otras bases duerme como mucho el intervalo de sondeo.
 
 Uso:
     python app/workers/task_worker.py
@@ -13,11 +16,10 @@ O en Docker:
     docker run --network court_rent_network -e DATABASE_URL=... court_rent python app/workers/task_worker.py
 """
 
-import time
 import logging
 import sys
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -25,56 +27,88 @@ logger = logging.getLogger(__name__)
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import database
-from app.services.task_service import process_pending_tasks, get_task_statistics
+from app.services.task_service import process_pending_tasks
+from app.services.notification_retry_service import process_notification_retries
+from app.services.task_wakeup import TaskWakeup, get_next_due_time
 
-# Revisar cada 60 segundos
+# Sin LISTEN/NOTIFY, revisar como mínimo cada 60 segundos (también es la espera
+# antes de reintentar tareas que siguen vencidas tras un ciclo, ej. por errores)
 POLL_INTERVAL_SECONDS = 60
+# Con LISTEN/NOTIFY, espera máxima sin nada pendiente (por si se pierde un aviso)
+MAX_SLEEP_SECONDS = int(os.getenv("TASK_WORKER_MAX_SLEEP_SECONDS", 600))
 # Detener después de 5 errores consecutivos  
 MAX_CONSECUTIVE_ERRORS = 5  
 
 
+def seconds_until(next_due, max_sleep: float, poll_interval: float) -> float:
+    """
+    Segundos a dormir hasta el siguiente vencimiento.
+
+    Args:
+        next_due: Próximo vencimiento (None si no hay nada pendiente)
+        max_sleep: Espera máxima
+        poll_interval: Espera si lo pendiente ya venció (quedó tras el ciclo por errores)
+    """
+    if next_due is None:
+        return max_sleep
+    remaining = (next_due - datetime.utcnow()).total_seconds()
+    if remaining <= 0:
+        return min(poll_interval, max_sleep)
+    return min(remaining, max_sleep)
+
+
+def run_cycle(db) -> None:
+    """Procesa las tareas y los reintentos de notificaciones vencidos."""
+    result = process_pending_tasks(db)
+    if result.get("total_processed"):
+        logger.info(
+            f"Procesadas: "
+            f"{result.get('successful', 0)} exitosas, "
+            f"{result.get('failed', 0)} fallidas"
+        )
+
+    # Reintentar por lotes los emails que fallaron y ya toca reenviar
+    retry_stats = process_notification_retries(db)
+    if retry_stats["processed"]:
+        logger.info(
+            f"Reintentos: {retry_stats['sent']} enviados, "
+            f"{retry_stats['rescheduled']} reprogramados, {retry_stats['dead']} descartados"
+        )
+
+
 def run_worker(poll_interval: int = POLL_INTERVAL_SECONDS):
     """
     Inicia el worker que procesa tareas programadas.
     
     Args:
-        poll_interval: Segundos entre cada revisión de tareas
+        poll_interval: Espera máxima entre revisiones cuando no hay LISTEN/NOTIFY
     """
     logger.info("INICIANDO TASK WORKER")
     logger.info("="*60)
-    logger.info(f"Revisando tareas pendientes cada {poll_interval} segundos...")
-    
+
+    wakeup = TaskWakeup(database.engine)
+    max_sleep = MAX_SLEEP_SECONDS if wakeup.listening else poll_interval
+    logger.info(
+        f"Esperando al siguiente vencimiento (máximo {max_sleep} segundos, "
+        f"{'con' if wakeup.listening else 'sin'} avisos de tareas nuevas)..."
+    )
     
     consecutive_errors = 0
     
     try:
         while True:
+            sleep_seconds = poll_interval
             try:
-                # Obtener conexión a BD
                 db = database.session_local()
-                # Obtener estadísticas
-                stats = get_task_statistics(db)
-                
-                # Procesar tareas si hay pendientes
-                if stats.get("pending_overdue", 0) > 0:
-                    logger.info(f"⏳ Encontradas {stats['pending_overdue']} tareas vencidas. Procesando...")
-                    
-                    result = process_pending_tasks(db)
-                    
-                    logger.info(
-                        f"Procesadas: "
-                        f"{result.get('successful', 0)} exitosas, "
-                        f"{result.get('failed', 0)} fallidas"
-                    )
-                else:
-                    logger.debug(
-                        f"Estado: "
-                        f"total={stats.get('total_tasks', 0)}, "
-                        f"ejecutadas={stats.get('executed', 0)}, "
-                        f"pendientes={stats.get('pending_future', 0)}"
-                    )
-                
-                db.close()
+                try:
+                    # Una sola consulta: ¿vence algo ya?
+                    next_due = get_next_due_time(db)
+                    if next_due is not None and next_due <= datetime.utcnow():
+                        run_cycle(db)
+                        next_due = get_next_due_time(db)
+                    sleep_seconds = seconds_until(next_due, max_sleep, poll_interval)
+                finally:
+                    db.close()
                 consecutive_errors = 0  # Reset contador de errores
                 
             except Exception as e:
@@ -88,8 +122,10 @@ def run_worker(poll_interval: int = POLL_INTERVAL_SECONDS):
                     logger.critical(f"✗ {MAX_CONSECUTIVE_ERRORS} errores consecutivos. Deteniendo worker.")
                     raise
             
-            # Esperar al siguiente ciclo
-            time.sleep(poll_interval)
+            # Esperar al siguiente vencimiento o a un aviso de tarea nueva
+            logger.debug(f"Durmiendo {sleep_seconds:.1f}s")
+            if wakeup.wait(sleep_seconds):
+                logger.debug("Despertado por una tarea nueva")
             
     except KeyboardInterrupt:
         logger.info(" Worker detenido por el usuario (Ctrl+C)")
@@ -97,6 +133,7 @@ def run_worker(poll_interval: int = POLL_INTERVAL_SECONDS):
         logger.critical(f"✗ Error fatal en el worker: {str(e)}", exc_info=True)
         sys.exit(1)
     finally:
+        wakeup.close()
         logger.info("Task Worker finalizado")
 
 
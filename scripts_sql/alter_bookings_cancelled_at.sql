@@ -0,0 +1,8 @@
+-- Momento de la cancelación de una reserva
+-- La instantánea de analítica solo relee las cancelaciones posteriores a su último refresco.
+-- Las reservas canceladas antes de este cambio quedan con cancelled_at NULL: la instantánea
+-- las carga ya canceladas al arrancar, así que no hace falta rellenarlas.
+
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS ix_bookings_cancelled_at ON bookings (cancelled_at) WHERE cancelled_at IS NOT NULL;
@@ -0,0 +1,8 @@
+-- Festivos con nivel de demanda propio y cuadrante reducido
+-- demand_id nulo: el festivo usa los niveles de demanda del domingo
+-- open_time/close_time nulos: se abren todos los bloques del cuadrante
+
+ALTER TABLE holidays ADD COLUMN IF NOT EXISTS description VARCHAR;
+ALTER TABLE holidays ADD COLUMN IF NOT EXISTS demand_id INTEGER REFERENCES demands (demand_id);
+ALTER TABLE holidays ADD COLUMN IF NOT EXISTS open_time TIME;
+ALTER TABLE holidays ADD COLUMN IF NOT EXISTS close_time TIME;
@@ -0,0 +1,6 @@
+-- Notificaciones guardadas como plantilla + parámetros en lugar del HTML completo
+-- content queda solo para las notificaciones antiguas (python -m app.workers.maintenance compact-notifications las migra)
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS template_key VARCHAR;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS template_params VARCHAR;
+ALTER TABLE notifications ALTER COLUMN content DROP NOT NULL;
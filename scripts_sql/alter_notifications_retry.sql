@@ -0,0 +1,12 @@
+-- Reintentos de notificaciones fallidas con backoff exponencial
+-- Las notificaciones antiguas quedan con status NULL y no se reintentan
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS status VARCHAR;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS retry_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS last_error VARCHAR;
+
+UPDATE notifications SET status = 'sent' WHERE is_sent = true AND status IS NULL;
+
+-- Cola de reintentos: solo las notificaciones pendientes de reintento
+CREATE INDEX IF NOT EXISTS ix_notifications_retry_due ON notifications (next_attempt_at) WHERE status = 'retry';
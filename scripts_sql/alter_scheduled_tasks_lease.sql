@@ -0,0 +1,5 @@
+-- Reclamo de tareas programadas por varios workers (SELECT ... FOR UPDATE SKIP LOCKED + lease)
+-- Una tarea reclamada no la toma otro worker hasta locked_until
+
+ALTER TABLE scheduled_tasks ADD COLUMN IF NOT EXISTS locked_by VARCHAR;
+ALTER TABLE scheduled_tasks ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP;
@@ -4,3 +4,19 @@
 CREATE UNIQUE INDEX IF NOT EXISTS ix_active_booking 
 ON bookings (court_id, start_time) 
 WHERE is_cancelled = false;
+
+-- Índices para la búsqueda administrativa de reservas (paginación keyset por start_time, booking_id)
+CREATE INDEX IF NOT EXISTS ix_bookings_start_id ON bookings (start_time, booking_id);
+CREATE INDEX IF NOT EXISTS ix_bookings_court_start ON bookings (court_id, start_time, booking_id);
+CREATE INDEX IF NOT EXISTS ix_bookings_user_start ON bookings (user_id, start_time, booking_id);
+
+-- Búsqueda por prefijo de email sin distinguir mayúsculas: lower(email) LIKE 'abc%'
+CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email) text_pattern_ops);
+
+-- Directorio de usuarios: búsqueda por prefijo de nombre y apellidos sin distinguir mayúsculas
+CREATE INDEX IF NOT EXISTS ix_users_name_lower ON users (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS ix_users_surname_lower ON users (lower(surname) text_pattern_ops);
+
+-- Cuadrante: un único bloque por día y hora (necesario para el upsert del editor de cuadrante).
+-- Si existieran duplicados, eliminarlos antes de crear el índice.
+CREATE UNIQUE INDEX IF NOT EXISTS ux_schedules_day_time ON schedules (day_of_week, start_time);
@@ -0,0 +1,25 @@
+-- Retención: histórico compacto de notificaciones y limpieza de tareas ejecutadas
+-- (python -m app.workers.maintenance retention)
+
+CREATE TABLE IF NOT EXISTS notifications_archive (
+    notification_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    booking_id INTEGER,
+    notification_type VARCHAR NOT NULL,
+    subject VARCHAR NOT NULL,
+    recipient_email VARCHAR NOT NULL,
+    template_key VARCHAR,
+    template_params VARCHAR,
+    status VARCHAR,
+    is_sent BOOLEAN DEFAULT false,
+    sent_at TIMESTAMP,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_notifications_archive_user_id ON notifications_archive (user_id);
+
+-- Selección de lotes por antigüedad
+CREATE INDEX IF NOT EXISTS ix_notifications_created_at ON notifications (created_at);
+
+-- Tareas pendientes: índice parcial que no crece con las tareas ya ejecutadas
+CREATE INDEX IF NOT EXISTS ix_scheduled_tasks_pending ON scheduled_tasks (scheduled_for) WHERE is_executed = false;
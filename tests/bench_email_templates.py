@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de las plantillas de email: renders por segundo de cada tipo.
+
+Compara, para cada plantilla:
+- get_template: templates.env.get_template en cada email (con auto_reload,
+  comprueba si el fichero ha cambiado en cada llamada)
+- compilada: plantilla compilada una vez (email_templates.render_html)
+- html + texto: además genera la alternativa text/plain (email_templates.render)
+
+No necesita base de datos ni SMTP.
+
+Uso:
+    python tests/bench_email_templates.py
+    python tests/bench_email_templates.py --seconds 2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import email_templates
+from app.templates import templates
+
+
+SAMPLE_PARAMS = {
+    "booking_confirmation": {"user_name": "Ana García", "court_number": 3, "start_time": "12/03/2026 18:30",
+                             "end_time": "20:00", "price": 14.5},
+    "welcome_email": {"user_name": "Ana García"},
+    "password_reset": {"user_name": "Ana García", "reset_link": "https://example.com/auth/password-reset?token=abc"},
+    "reminder_24h": {"user_name": "Ana García", "court_number": 3, "start_time": "18:30"},
+    "cancellation": {"user_name": "Ana García", "court_number": 3, "start_time": "12/03/2026 18:30",
+                     "refund_amount": 14.5},
+    "price_update": {"user_name": "Ana García", "new_price": 16.0, "time_slot": "18:30"},
+}
+
+
+def renders_per_second(func, seconds: float) -> float:
+    """Ejecuta func durante `seconds` segundos y devuelve llamadas por segundo."""
+    func()  # Calentamiento (primera compilación)
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            func()
+        count += 50
+    return count / (time.perf_counter() - start)
+
+
+def run_benchmark(seconds: float = 0.5):
+    """Imprime renders/s por plantilla y modo."""
+    email_templates.precompile_all()
+    print(f"{'plantilla':22} {'get_template':>12} {'compilada':>12} {'html + texto':>14}")
+    print("-" * 64)
+
+    for template_key, params in SAMPLE_PARAMS.items():
+        template_file = email_templates.EMAIL_TEMPLATE_FILES[template_key]
+        loader = renders_per_second(lambda: templates.env.get_template(template_file).render(**params), seconds)
+        compiled = renders_per_second(lambda: email_templates.render_html(template_key, params), seconds)
+        with_text = renders_per_second(lambda: email_templates.render(template_key, params), seconds)
+        print(f"{template_key:22} {loader:12,.0f} {compiled:12,.0f} {with_text:14,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders por segundo de las plantillas de email")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Duración de cada medición")
+    args = parser.parse_args()
+    run_benchmark(args.seconds)
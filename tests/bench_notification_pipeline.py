@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark del envío de notificaciones de extremo a extremo contra el servidor SMTP
+local de tests/smtp_sink.py: emails por segundo en cada capa.
+
+Etapas:
+- send_email: envíos en serie por el pool SMTP (una conexión reutilizada)
+- despachador: EmailDispatcher.send_many con N hilos (y un pool de N conexiones)
+- task worker: process_pending_tasks sobre N recordatorios vencidos, incluyendo
+  la lectura de tareas, el render, el envío y el registro de notificaciones
+
+El servidor local puede simular latencia y fallos (451) para acercarse a un
+servidor real. Por defecto la etapa del task worker usa una base de datos SQLite
+temporal; con --database-url se puede apuntar a otra (se insertan y borran
+las filas del benchmark).
+
+Uso:
+    python tests/bench_notification_pipeline.py
+    python tests/bench_notification_pipeline.py --emails 500 --latency-ms 20 --workers 1,4,8
+    python tests/bench_notification_pipeline.py --failure-rate 0.05 --skip-tasks
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.smtp_sink import SMTPSink
+
+
+BENCH_EMAIL = "bench-user@bench.local"
+RECIPIENT = "destinatario@bench.local"
+
+
+def configure_environment(sink: SMTPSink, database_url: str, workers: int) -> None:
+    """Apunta la aplicación al servidor local. Debe llamarse antes de importar app.services."""
+    os.environ.update({
+        "SMTP_SERVER": sink.host,
+        "SMTP_PORT": str(sink.port),
+        "SMTP_USE_TLS": "false",
+        "SMTP_USE_LOGIN": "false",
+        "SENDER_EMAIL": "bench@bench.local",
+        "DATABASE_URL": database_url,
+        "EMAIL_DISPATCH_WORKERS": str(workers),
+        "SMTP_POOL_SIZE": str(workers),
+        # Todos los emails van al mismo dominio: sin límite por dominio ni agrupación
+        "EMAIL_DOMAIN_RATE_PER_SECOND": "0",
+        "NOTIFICATION_COALESCE_SECONDS": "0",
+    })
+
+
+def use_pool(size: int) -> None:
+    """Sustituye el pool SMTP compartido por uno nuevo de `size` conexiones."""
+    from app.services import notification_service
+    from app.services.smtp_pool import SMTPConnectionPool
+
+    notification_service.smtp_pool.close_all()
+    notification_service.smtp_pool = SMTPConnectionPool(
+        host=notification_service.SMTP_SERVER,
+        port=notification_service.SMTP_PORT,
+        use_tls=False,
+        use_login=False,
+        max_size=size
+    )
+
+
+def measure(sink: SMTPSink, label: str, count: int, func) -> dict:
+    """Ejecuta func() y devuelve emails/s y conexiones abiertas en el servidor."""
+    connections, rejected = sink.connections, sink.rejected
+    start = time.perf_counter()
+    sent = func()
+    elapsed = time.perf_counter() - start
+    return {
+        "stage": label,
+        "emails": count,
+        "sent": sent,
+        "seconds": elapsed,
+        "rate": count / elapsed if elapsed else 0,
+        "connections": sink.connections - connections,
+        "rejected": sink.rejected - rejected
+    }
+
+
+def bench_send_email(sink: SMTPSink, count: int) -> dict:
+    from app.services.notification_service import send_email
+
+    use_pool(1)
+    html = "<html><body><h1>Prueba</h1><p>Benchmark de envío</p></body></html>"
+    return measure(sink, "send_email (serie)", count,
+                   lambda: sum(send_email(RECIPIENT, f"Prueba {i}", html) for i in range(count)))
+
+
+def bench_dispatcher(sink: SMTPSink, count: int, workers: int) -> dict:
+    from app.services.email_dispatcher import EmailDispatcher, EmailJob
+
+    use_pool(workers)
+    dispatcher = EmailDispatcher(workers=workers, queue_size=count, domain_rate=0, name="bench")
+    html = "<html><body><h1>Prueba</h1><p>Benchmark de envío</p></body></html>"
+    jobs = [EmailJob(RECIPIENT, f"Prueba {i}", html) for i in range(count)]
+    try:
+        return measure(sink, f"despachador ({workers} hilos)", count,
+                       lambda: sum(dispatcher.send_many(jobs)))
+    finally:
+        dispatcher.shutdown()
+
+
+def bench_task_worker(sink: SMTPSink, count: int, workers: int) -> dict:
+    """Inserta `count` recordatorios vencidos y mide process_pending_tasks."""
+    from sqlalchemy import delete, insert
+
+    from app import database, models
+    from app.services import task_service
+    from app.services.email_dispatcher import shutdown_dispatcher
+
+    use_pool(workers)
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.session_local()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if not user:
+            user = models.User(name="Bench", surname="Benchmark", email=BENCH_EMAIL, password_hash="-")
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+
+        due = datetime.utcnow() - timedelta(minutes=1)
+        db.execute(insert(models.ScheduledTask).values([{
+            "user_id": user.user_id,
+            "task_type": "reminder_24h",
+            "scheduled_for": due,
+            "task_data": f'{{"recipient_email": "{RECIPIENT}", "court_number": {i % 8 + 1}, '
+                         f'"start_time_str": "{(due + timedelta(hours=24)).isoformat()}"}}',
+            "is_executed": False
+        } for i in range(count)]))
+        db.commit()
+
+        result = measure(sink, f"task worker ({workers} hilos)", count,
+                         lambda: task_service.process_pending_tasks(db)["successful"])
+        shutdown_dispatcher()
+
+        # Limpiar las filas del benchmark
+        db.execute(delete(models.Notification).where(models.Notification.user_id == user.user_id))
+        db.execute(delete(models.ScheduledTask).where(models.ScheduledTask.user_id == user.user_id))
+        db.execute(delete(models.User).where(models.User.user_id == user.user_id))
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+def print_results(results: list) -> None:
+    print(f"{'etapa':28} {'emails':>7} {'ok':>7} {'seg':>8} {'emails/s':>10} {'conex.':>7} {'451':>5}")
+    print("-" * 78)
+    for r in results:
+        print(f"{r['stage']:28} {r['emails']:7} {r['sent']:7} {r['seconds']:8.2f} "
+              f"{r['rate']:10,.1f} {r['connections']:7} {r['rejected']:5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emails por segundo a través de la cadena de notificaciones")
+    parser.add_argument("--emails", type=int, default=200, help="Emails por etapa")
+    parser.add_argument("--workers", default="1,4,8", help="Hilos del despachador a probar (separados por comas)")
+    parser.add_argument("--latency-ms", type=float, default=10, help="Latencia del servidor por mensaje")
+    parser.add_argument("--connect-latency-ms", type=float, default=50, help="Latencia del saludo por conexión")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Proporción de mensajes rechazados con 451")
+    parser.add_argument("--database-url", help="Base de datos para la etapa del task worker (por defecto SQLite temporal)")
+    parser.add_argument("--skip-tasks", action="store_true", help="No ejecutar la etapa del task worker")
+    args = parser.parse_args()
+
+    workers = [int(w) for w in args.workers.split(",") if w.strip()]
+    sink = SMTPSink(
+        latency=args.latency_ms / 1000,
+        connect_latency=args.connect_latency_ms / 1000,
+        failure_rate=args.failure_rate
+    ).start()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir.name, 'bench.db')}"
+    configure_environment(sink, database_url, max(workers))
+
+    print(
+        f"Servidor SMTP local en {sink.host}:{sink.port} (latencia {args.latency_ms:g} ms/mensaje, "
+        f"{args.connect_latency_ms:g} ms/conexión, fallos {args.failure_rate:.0%})\n"
+    )
+    try:
+        results = [bench_send_email(sink, args.emails)]
+        results += [bench_dispatcher(sink, args.emails, w) for w in workers]
+        if not args.skip_tasks:
+            results.append(bench_task_worker(sink, args.emails, max(workers)))
+        print_results(results)
+    finally:
+        sink.stop()
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Servidor SMTP mínimo (solo librería estándar) para pruebas locales.
+
+Acepta cualquier remitente, destinatario y credencial, y guarda los mensajes
+recibidos en memoria. No soporta STARTTLS: usar con SMTP_USE_TLS=false.
+
+Para simular un servidor real se puede inyectar latencia (al conectar y por
+mensaje) y una tasa de fallos: los mensajes fallidos se rechazan con un 451
+(error temporal), como haría un servidor saturado.
+
+Uso:
+    sink = SMTPSink(latency=0.02, failure_rate=0.05)
+    sink.start()
+    ... enviar a ("127.0.0.1", sink.port) ...
+    print(len(sink.messages), sink.connections)
+    sink.stop()
+
+Como servidor independiente (por ejemplo para tests/test_smtp_debug.py):
+    python -m tests.smtp_sink --port 1025 --latency-ms 20 --failure-rate 0.05
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_USE_TLS=false SMTP_USE_LOGIN=false python tests/test_smtp_debug.py
+"""
+
+import random
+import socket
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Sesión SMTP de un cliente."""
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+            sink.active.add(self.connection)
+        try:
+            self._session(sink)
+        finally:
+            with sink.lock:
+                sink.active.discard(self.connection)
+
+    def _session(self, sink) -> None:
+        if sink.connect_latency:
+            time.sleep(sink.connect_latency)
+        self._reply("220 smtp-sink ESMTP listo")
+        mail_from, rcpt_to = None, []
+
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            command = line[:4].upper()
+
+            if command in ("EHLO", "HELO"):
+                if command == "EHLO":
+                    self._reply("250-smtp-sink")
+                    self._reply("250 AUTH PLAIN LOGIN")
+                else:
+                    self._reply("250 smtp-sink")
+            elif command == "AUTH":
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].upper() == "LOGIN":
+                    # Usuario y contraseña en dos pasos
+                    for _ in range(2 if len(parts) == 2 else 1):
+                        self._reply("334 ")
+                        self.rfile.readline()
+                elif len(parts) == 2:
+                    self._reply("334 ")
+                    self.rfile.readline()
+                self._reply("235 Autenticación correcta")
+            elif command == "MAIL":
+                mail_from, rcpt_to = line[10:].strip(), []
+                self._reply("250 OK")
+            elif command == "RCPT":
+                rcpt_to.append(line[8:].strip())
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 Fin con <CRLF>.<CRLF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                if sink.failure_rate and random.random() < sink.failure_rate:
+                    with sink.lock:
+                        sink.rejected += 1
+                    self._reply("451 4.3.0 Fallo temporal simulado")
+                    continue
+                with sink.lock:
+                    sink.messages.append({"from": mail_from, "to": rcpt_to, "data": b"".join(data)})
+                self._reply("250 OK mensaje aceptado")
+            elif command == "RSET":
+                mail_from, rcpt_to = None, []
+                self._reply("250 OK")
+            elif command == "NOOP":
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Adiós")
+                return
+            else:
+                self._reply("502 Comando no implementado")
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Servidor SMTP en segundo plano que guarda los mensajes recibidos."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 connect_latency: float = 0.0, failure_rate: float = 0.0):
+        """
+        Args:
+            host: Interfaz de escucha
+            port: Puerto (0 = uno libre elegido por el sistema)
+            latency: Segundos que tarda en aceptar cada mensaje
+            connect_latency: Segundos que tarda en saludar a cada conexión nueva
+            failure_rate: Proporción de mensajes rechazados con 451 (0 a 1)
+        """
+        self.host = host
+        self.requested_port = port
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.failure_rate = failure_rate
+        self.messages = []
+        self.rejected = 0
+        self.connections = 0
+        self.active = set()
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "SMTPSink":
+        self._server = _ThreadingSMTPServer((self.host, self.requested_port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # Cortar también las sesiones abiertas, como haría un servidor real al caer
+        with self.lock:
+            for conn in list(self.active):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor SMTP local para pruebas")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latencia por mensaje")
+    parser.add_argument("--connect-latency-ms", type=float, default=0, help="Latencia del saludo por conexión")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Proporción de mensajes rechazados con 451")
+    args = parser.parse_args()
+
+    sink = SMTPSink(
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        connect_latency=args.connect_latency_ms / 1000,
+        failure_rate=args.failure_rate
+    ).start()
+    print(f"SMTP sink escuchando en {sink.host}:{sink.port} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Mensajes recibidos: {len(sink.messages)} | rechazados: {sink.rejected} | conexiones: {sink.connections}")
+    except KeyboardInterrupt:
+        sink.stop()
@@ -0,0 +1,172 @@
+"""
+Pruebas de la asignación automática de niveles de demanda (demand_tier_service):
+capacidad a partir del calendario, propuestas, bloques bloqueados y aplicación
+de la propuesta revisada. Usan una base de datos SQLite temporal.
+
+Uso:
+    python -m tests.test_demand_tiers
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir.name, 'demand_tiers.db')}"
+
+from app import database, initialize, models
+from app.services import demand_tier_service, schedule_service
+
+LOOKBACK_DAYS = 28
+COURT_IN_MAINTENANCE = 8
+
+
+def _setup_database():
+    """
+    Cuadrante inicial, calendario de capacidad con la pista 8 cerrada y reservas:
+    los lunes a las 08:00 (demanda baja) se llenan todas las pistas abiertas y
+    los lunes a las 18:30 (demanda alta) no se reserva nada.
+    """
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.session_local()
+    initialize.initialize_demands(db)
+    initialize.initialize_prices(db)
+    initialize.initialize_courts(db)
+    initialize.initialize_schedules(db)
+    db.add(models.User(user_id=1, name="Ana", surname="García", email="ana@test.com", password_hash="-"))
+
+    today = datetime.utcnow().date()
+    mondays = 0
+    for offset in range(1, LOOKBACK_DAYS + 1):
+        day = today - timedelta(days=offset)
+        for court_id in range(1, 9):
+            open_court = court_id != COURT_IN_MAINTENANCE
+            db.add(models.CourtCapacity(cap_date=day, court_id=court_id, slots=10 if open_court else 0))
+            if open_court and day.weekday() == 0:
+                db.add(models.Booking(user_id=1, court_id=court_id, price_id=3,
+                                      start_time=datetime.combine(day, datetime.min.time()).replace(hour=8)))
+        mondays += day.weekday() == 0
+    db.commit()
+    return db, mondays
+
+
+def _settings(**overrides):
+    settings = dict(demand_tier_service.DEFAULT_SETTINGS, lookback_days=LOOKBACK_DAYS, min_capacity=1)
+    settings.update(overrides)
+    return settings
+
+
+def _change(proposal, day, label):
+    return next((c for c in proposal["changes"] if (c["day_of_week"], c["start_time"]) == (day, label)), None)
+
+
+def test_capacity_uses_calendar():
+    """La capacidad cuenta solo las pistas abiertas según el calendario de capacidad."""
+    db, mondays = _setup_database()
+    try:
+        rates = demand_tier_service.compute_fill_rates(db, LOOKBACK_DAYS)
+        slot = schedule_service.SLOT_LABELS.index("08:00")
+        assert rates["capacity"][0, slot] == mondays * 7, rates["capacity"][0, slot]
+        assert rates["booked"][0, slot] == mondays * 7
+        assert rates["fill"][0, slot] == 1.0
+        print("✓ La pista en mantenimiento no cuenta como capacidad")
+        return True
+    finally:
+        db.close()
+
+
+def test_proposal_changes():
+    """Los bloques llenos suben de nivel, los vacíos bajan, y se respeta max_step y locked."""
+    db, _ = _setup_database()
+    try:
+        proposal = demand_tier_service.build_proposal(db, _settings())
+        full = _change(proposal, 0, "08:00")
+        empty = _change(proposal, 0, "18:30")
+        # De baja (3) a alta (1) con max_step=1: solo sube a media (2)
+        assert (full["current_demand_id"], full["proposed_demand_id"]) == (3, 2), full
+        assert (empty["current_demand_id"], empty["proposed_demand_id"]) == (1, 2), empty
+
+        locked = demand_tier_service.build_proposal(db, _settings(locked=[[0, "18:30"]]))
+        assert _change(locked, 0, "18:30") is None
+        assert _change(locked, 0, "08:00") is not None
+
+        few_data = demand_tier_service.build_proposal(db, _settings(min_capacity=1000))
+        assert few_data["changes"] == []
+        print("✓ Propuesta con max_step, bloques bloqueados y mínimo de capacidad")
+        return True
+    finally:
+        db.close()
+
+
+def test_save_settings_validates_locked():
+    """Un bloque bloqueado mal formado se rechaza con ValueError en lugar de romper la propuesta."""
+    db, _ = _setup_database()
+    try:
+        for locked in (["08:00"], [[0]], [[7, "08:00"]], [[0, "08:15"]], [["0", "08:00"]]):
+            try:
+                demand_tier_service.save_settings(db, _settings(locked=locked))
+            except ValueError:
+                continue
+            raise AssertionError(f"Se aceptó locked={locked!r}")
+
+        saved = demand_tier_service.save_settings(db, _settings(locked=[[0, "18:30"]]))
+        assert saved["locked"] == [[0, "18:30"]]
+        assert demand_tier_service.get_settings(db)["locked"] == [[0, "18:30"]]
+        print("✓ Validación de bloques bloqueados")
+        return True
+    finally:
+        db.close()
+
+
+def test_apply_previewed_proposal():
+    """Solo se aplica la propuesta cuya huella coincide con la revisada."""
+    db, _ = _setup_database()
+    try:
+        demand_tier_service.save_settings(db, _settings())
+        proposal = demand_tier_service.build_proposal(db)
+        version = proposal["schedule_version"]
+
+        assert demand_tier_service.find_previewed_proposal(db, version, "otra-huella") is None
+        previewed = demand_tier_service.find_previewed_proposal(db, version, proposal["proposal_hash"])
+        assert previewed is not None and previewed["changes"] == proposal["changes"]
+
+        result = demand_tier_service.apply_proposal(db, previewed)
+        assert result["updated"] == len(proposal["changes"]), result
+        assert schedule_service.get_schedule_map(db)[(0, "08:00")] == 2
+
+        # La misma propuesta ya no vale: el cuadrante está en otra versión
+        assert demand_tier_service.find_previewed_proposal(db, version, proposal["proposal_hash"]) is None
+        try:
+            demand_tier_service.apply_proposal(db, previewed)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Se aplicó una propuesta sobre una versión antigua del cuadrante")
+        print("✓ Se aplica exactamente la propuesta revisada")
+        return True
+    finally:
+        db.close()
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Capacidad del calendario", test_capacity_uses_calendar()),
+        ("Propuesta", test_proposal_changes()),
+        ("Bloques bloqueados", test_save_settings_validates_locked()),
+        ("Aplicar propuesta revisada", test_apply_previewed_proposal()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()
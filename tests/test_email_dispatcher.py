@@ -0,0 +1,142 @@
+"""
+Pruebas del despachador de emails (EmailDispatcher) con una función de envío
+simulada: límite por dominio sin bloquear a los demás, cola llena y parada.
+
+Uso:
+    python -m tests.test_email_dispatcher
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir.name, 'dispatcher.db')}")
+
+from app.services.email_dispatcher import DispatcherBusyError, EmailDispatcher, EmailJob
+
+
+def _job(to_email: str) -> EmailJob:
+    return EmailJob(to_email, "Prueba", "<p>Prueba</p>")
+
+
+def test_rate_limited_domain_does_not_block_others():
+    """Un dominio que agota su límite se aplaza y el hilo sigue enviando a otros dominios."""
+    sent_at = {}
+
+    def send(to_email, subject, html_content):
+        sent_at.setdefault(to_email.rsplit("@", 1)[-1], []).append(time.monotonic())
+        return True
+
+    dispatcher = EmailDispatcher(workers=1, queue_size=100, domain_rate=2, domain_burst=1, send_func=send, name="test")
+    try:
+        start = time.monotonic()
+        slow = [dispatcher.submit(_job(f"user{i}@lento.com")) for i in range(4)]
+        fast = dispatcher.submit(_job("user@rapido.com"))
+
+        assert fast.result(timeout=5) is True
+        assert sent_at["rapido.com"][0] - start < 0.3, "El dominio rápido esperó al lento"
+        assert all(f.result(timeout=5) for f in slow)
+
+        # 4 emails a 2/s con ráfaga 1: el último sale pasados ~1.5 s
+        assert sent_at["lento.com"][-1] - start >= 1.4
+        assert dispatcher.stats()["rate_limited_seconds"] > 0
+        print("✓ El límite por dominio no frena a los demás dominios")
+        return True
+    finally:
+        dispatcher.shutdown()
+
+
+def test_submit_timeout_when_queue_is_full():
+    """Con la cola llena, submit falla pasado el timeout en lugar de bloquear."""
+    release = threading.Event()
+    dispatcher = EmailDispatcher(workers=1, queue_size=2, domain_rate=0,
+                                 send_func=lambda *args: release.wait(5), name="test")
+    try:
+        dispatcher.submit(_job("a@test.com"))
+        time.sleep(0.1)  # El hilo ya está enviando el primero
+        dispatcher.submit(_job("b@test.com"))
+
+        start = time.monotonic()
+        try:
+            dispatcher.submit(_job("c@test.com"), timeout=0.2)
+        except DispatcherBusyError:
+            pass
+        else:
+            raise AssertionError("submit no falló con la cola llena")
+        assert time.monotonic() - start < 1
+        print("✓ submit respeta el timeout con la cola llena")
+        return True
+    finally:
+        release.set()
+        dispatcher.shutdown()
+
+
+def test_deferred_jobs_count_against_capacity():
+    """Los emails aplazados por su dominio ocupan hueco: submit acaba fallando con el timeout."""
+    dispatcher = EmailDispatcher(workers=2, queue_size=5, domain_rate=0.5, domain_burst=1,
+                                 send_func=lambda *args: True, name="test")
+    try:
+        accepted = 0
+        try:
+            for _ in range(50):
+                dispatcher.submit(_job("user@lento.com"), timeout=0.2)
+                accepted += 1
+        except DispatcherBusyError:
+            pass
+        else:
+            raise AssertionError("submit nunca se bloqueó con el dominio limitado")
+
+        # El primero sale con la ráfaga; el resto queda aplazado ocupando la capacidad
+        assert accepted <= 6, accepted
+        assert dispatcher.stats()["delayed"] <= 5
+        print("✓ Los aplazados cuentan para la capacidad del despachador")
+        return True
+    finally:
+        dispatcher.shutdown(wait=False)
+
+
+def test_shutdown_with_full_queue():
+    """shutdown no se bloquea con la cola llena y termina lo que ya estaba encolado."""
+    release = threading.Event()
+    dispatcher = EmailDispatcher(workers=1, queue_size=2, domain_rate=0,
+                                 send_func=lambda *args: release.wait(5), name="test")
+    first = dispatcher.submit(_job("a@test.com"))
+    time.sleep(0.1)
+    second = dispatcher.submit(_job("b@test.com"))
+
+    start = time.monotonic()
+    dispatcher.shutdown(wait=False)
+    assert time.monotonic() - start < 0.5, "shutdown se bloqueó con la cola llena"
+
+    release.set()
+    assert first.result(timeout=5) and second.result(timeout=5)
+    for thread in dispatcher._threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    print("✓ shutdown no se bloquea con la cola llena")
+    return True
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Límite por dominio", test_rate_limited_domain_does_not_block_others()),
+        ("Timeout de submit", test_submit_timeout_when_queue_is_full()),
+        ("Aplazados y capacidad", test_deferred_jobs_count_against_capacity()),
+        ("Parada con cola llena", test_shutdown_with_full_queue()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,124 @@
+"""
+Pruebas de los festivos (holiday_service): bloques reservables de un día con su
+nivel de demanda, horarios reducidos e importación en bloque.
+Usan una base de datos SQLite temporal.
+
+Uso:
+    python -m tests.test_holidays
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, datetime, time
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir.name, 'holidays.db')}"
+
+from app import database, initialize, models
+from app.services import holiday_service, pricing_service, schedule_service
+
+# Miércoles; el domingo siguiente es 2026-12-13
+WEDNESDAY = date(2026, 12, 9)
+SUNDAY = date(2026, 12, 13)
+CHRISTMAS = date(2026, 12, 25)
+
+
+def _setup_database():
+    """Cuadrante inicial sin festivos."""
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.session_local()
+    initialize.initialize_demands(db)
+    initialize.initialize_schedules(db)
+    return db
+
+
+def test_regular_day_uses_schedule():
+    """Un día normal devuelve los bloques de su día de la semana en el cuadrante."""
+    db = _setup_database()
+    try:
+        slots = holiday_service.get_day_slots(db, WEDNESDAY)
+        schedule_map = schedule_service.get_schedule_map(db)
+        assert [label for label, _ in slots] == schedule_service.SLOT_LABELS
+        assert slots == [(label, schedule_map[(WEDNESDAY.weekday(), label)]) for label in schedule_service.SLOT_LABELS]
+
+        # Una hora sin cero a la izquierda es la misma franja
+        quotes = pricing_service.quote_slots(db, [(WEDNESDAY.isoformat(), "8:00"), (WEDNESDAY.isoformat(), "08:00")])
+        assert quotes[0]["demand_id"] == quotes[1]["demand_id"] == schedule_map[(WEDNESDAY.weekday(), "08:00")], quotes
+        print("✓ Un día normal usa el cuadrante")
+        return True
+    finally:
+        db.close()
+
+
+def test_holiday_overrides():
+    """Un festivo usa su nivel de demanda o el del domingo, y su horario reducido."""
+    db = _setup_database()
+    try:
+        sunday_slots = holiday_service.get_day_slots(db, SUNDAY)
+        result = holiday_service.import_holidays(db, [
+            {"date": WEDNESDAY, "description": "Sin nivel propio"},
+            {"date": CHRISTMAS, "description": "Navidad", "demand_id": 3,
+             "open_time": time(11, 0), "close_time": time(14, 0)},
+        ])
+        assert result["imported"] == 2 and result["version"] == "1", result
+
+        # Sin demand_id ni horario: como un domingo
+        assert holiday_service.get_day_slots(db, WEDNESDAY) == sunday_slots
+
+        # Horario reducido: bloques que empiezan entre open_time (incluido) y close_time (excluido)
+        assert holiday_service.get_day_slots(db, CHRISTMAS) == [("11:00", 3), ("12:30", 3)]
+        assert holiday_service.get_demand_at(db, datetime.combine(CHRISTMAS, time(12, 30))) == 3
+        assert holiday_service.get_demand_at(db, datetime.combine(CHRISTMAS, time(14, 0))) is None
+        print("✓ Festivos con nivel propio, como domingo y con horario reducido")
+        return True
+    finally:
+        db.close()
+
+
+def test_import_replaces_year():
+    """Reimportar un año elimina los festivos que ya no vienen y publica otra versión."""
+    db = _setup_database()
+    try:
+        holiday_service.import_holidays(db, [{"date": WEDNESDAY}, {"date": CHRISTMAS}])
+        result = holiday_service.import_holidays(db, [{"date": CHRISTMAS}], replace_year=2026)
+        assert result["removed"] == 1 and result["version"] == "2", result
+        assert set(holiday_service.get_holiday_map(db)) == {CHRISTMAS}
+
+        for invalid in (
+            [{"date": date(2027, 1, 1)}],
+            [{"date": CHRISTMAS, "open_time": time(14, 0), "close_time": time(11, 0)}],
+            [{"date": CHRISTMAS, "demand_id": 99}],
+        ):
+            try:
+                holiday_service.import_holidays(db, invalid, replace_year=2026)
+            except ValueError:
+                continue
+            raise AssertionError(f"Se aceptó {invalid!r}")
+        assert holiday_service.get_holiday_version(db) == "2"
+        print("✓ Importación de festivos por año")
+        return True
+    finally:
+        db.close()
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Día normal", test_regular_day_uses_schedule()),
+        ("Festivos", test_holiday_overrides()),
+        ("Importación por año", test_import_replaces_year()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()
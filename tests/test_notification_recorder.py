@@ -0,0 +1,119 @@
+"""
+Pruebas del buffer de notificaciones (NotificationRecorder) cuando falla un volcado.
+Usan una base de datos SQLite temporal con claves foráneas activas.
+
+Uso:
+    python -m tests.test_notification_recorder
+"""
+
+import os
+import sys
+import tempfile
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir.name, 'recorder.db')}")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.notification_recorder import NotificationRecorder
+
+
+def _session_factory():
+    """Sesiones sobre una base SQLite nueva que comprueba las claves foráneas."""
+    engine = create_engine(f"sqlite:///{os.path.join(_tmp_dir.name, 'fk.db')}")
+    event.listen(engine, "connect", lambda conn, _: conn.execute("PRAGMA foreign_keys=ON"))
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(models.User(user_id=1, name="Ana", surname="García", email="ana@test.com", password_hash="-"))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _fields(booking_id=None):
+    return dict(user_id=1, recipient_email="ana@test.com", notification_type="reminder_24h",
+                subject="Recordatorio", booking_id=booking_id, is_sent=True,
+                template_key="reminder_24h", template_params={"user_name": "Ana"})
+
+
+def test_bad_row_does_not_block_buffer():
+    """Una fila inválida no impide registrar las demás y se descarta tras max_attempts."""
+    factory = _session_factory()
+    recorder = NotificationRecorder(max_batch=1000, flush_interval=0, session_factory=factory, max_attempts=2)
+
+    recorder.add(**_fields())
+    recorder.add(**_fields(booking_id=999))  # Reserva inexistente: viola la clave foránea
+    recorder.add(**_fields())
+
+    # El lote falla, pero las filas válidas se escriben una a una en el mismo volcado
+    assert recorder.flush() == 2
+    assert recorder.stats()["retrying"] == 1
+
+    # Las notificaciones nuevas se vuelcan en bloque aunque quede la fila inválida
+    recorder.add(**_fields())
+    assert recorder.flush() == 1
+
+    stats = recorder.stats()
+    assert stats["dropped"] == 1, stats
+    assert stats["retrying"] == 0, stats
+    assert recorder.pending() == 0
+
+    db = factory()
+    try:
+        assert db.query(models.Notification).count() == 3
+    finally:
+        db.close()
+    recorder.close()
+    print("✓ Una fila inválida se descarta sin bloquear el buffer")
+    return True
+
+
+def test_failed_flush_is_retried():
+    """Si la base de datos no está disponible, los registros se reintentan en el siguiente volcado."""
+    factory = _session_factory()
+    available = {"ok": False}
+
+    def flaky_factory():
+        if not available["ok"]:
+            raise ConnectionError("Base de datos no disponible")
+        return factory()
+
+    recorder = NotificationRecorder(max_batch=1000, flush_interval=0, session_factory=flaky_factory, max_attempts=3)
+    recorder.add(**_fields())
+    recorder.add(**_fields())
+
+    assert recorder.flush() == 0
+    assert recorder.pending() == 2
+
+    available["ok"] = True
+    assert recorder.flush() == 2
+    assert recorder.pending() == 0
+    assert recorder.stats()["dropped"] == 0
+    recorder.close()
+    print("✓ Los registros se reintentan cuando la base de datos vuelve")
+    return True
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Fila inválida", test_bad_row_does_not_block_buffer()),
+        ("Base de datos caída", test_failed_flush_is_retried()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -4,6 +4,9 @@ Permite verificar que el sistema de emails está correctamente configurado.
 
 Uso:
     python -m tests.test_notifications
+
+Sin servidor de correo real se puede usar el servidor local de tests/smtp_sink.py
+(python -m tests.smtp_sink) con SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_USE_TLS=false.
 """
 
 import os
@@ -62,9 +62,9 @@ def test_password_reset():
 
     # 3. Get user id
     print("\nObteniendo lista de usuarios...")
-    status, users = make_request(f"{BASE_URL}/admin/users-list", method="GET", headers=headers)
+    status, users = make_request(f"{BASE_URL}/admin/users-list?q=testuser@example.com", method="GET", headers=headers)
     
-    test_user = next((u for u in users if u["email"] == "testuser@example.com"), None)
+    test_user = next((u for u in users["items"] if u["email"] == "testuser@example.com"), None)
     
     if not test_user:
         print("No se encontró el usuario de prueba en la lista.")
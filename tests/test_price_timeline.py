@@ -0,0 +1,152 @@
+"""
+Pruebas de las versiones de precio programadas (pricing_service): línea temporal
+(PriceTimeline), programación, modificación y cancelación de versiones futuras.
+Usan una base de datos SQLite temporal.
+
+Uso:
+    python -m tests.test_price_timeline
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir.name, 'prices.db')}"
+
+from app import database, initialize, models
+from app.services import pricing_service
+from app.services.pricing_service import PriceTimeline
+
+HIGH_DEMAND_ID = 1
+
+
+def _setup_database():
+    """Demandas y precios base (30/20/10) vigentes desde hace un día."""
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.session_local()
+    initialize.initialize_demands(db)
+    initialize.initialize_prices(db)
+    db.query(models.Price).update({"start_date": datetime.utcnow() - timedelta(days=1)})
+    db.commit()
+    return db
+
+
+def _statuses(db):
+    return {v["price_id"]: v["status"] for v in pricing_service.list_price_versions(db, HIGH_DEMAND_ID)}
+
+
+def test_timeline_lookup():
+    """Entre versiones solapadas gana la de inicio más reciente; fuera de rango no hay precio."""
+    t0 = datetime(2026, 1, 1)
+    timeline = PriceTimeline([
+        (t0, None, 1, 30.0),
+        (t0 + timedelta(days=10), t0 + timedelta(days=20), 2, 35.0),
+        (t0 + timedelta(days=15), None, 3, 40.0),
+    ])
+
+    assert timeline.lookup(t0 - timedelta(seconds=1)) is None
+    assert timeline.lookup(t0) == (1, 30.0)
+    assert timeline.lookup(t0 + timedelta(days=10) - timedelta(seconds=1)) == (1, 30.0)
+    assert timeline.lookup(t0 + timedelta(days=10)) == (2, 35.0)
+    assert timeline.lookup(t0 + timedelta(days=15)) == (3, 40.0)
+    assert timeline.lookup(t0 + timedelta(days=400)) == (3, 40.0)
+
+    # Intervalos sin solapes y contiguos
+    intervals = timeline.intervals()
+    assert [i[2] for i in intervals] == [1, 2, 3], intervals
+    assert all(a[1] == b[0] for a, b in zip(intervals, intervals[1:]))
+
+    closed = PriceTimeline([(t0, t0 + timedelta(days=1), 1, 30.0)])
+    assert closed.lookup(t0 + timedelta(days=1)) is None
+    print("✓ Búsqueda en la línea temporal de precios")
+    return True
+
+
+def test_schedule_and_cancel():
+    """Una versión programada se aplica desde su fecha y al cancelarla vuelve el precio anterior."""
+    db = _setup_database()
+    try:
+        current_id, _ = pricing_service.get_price_at(db, HIGH_DEMAND_ID, datetime.utcnow())
+        start = datetime.utcnow() + timedelta(days=7)
+
+        scheduled = pricing_service.schedule_price_version(db, HIGH_DEMAND_ID, 35.0, start)
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, start - timedelta(minutes=1)) == (current_id, 30.0)
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, start) == (scheduled.price_id, 35.0)
+        assert _statuses(db)[scheduled.price_id] == "scheduled"
+
+        # Dos versiones no pueden empezar a la vez
+        try:
+            pricing_service.schedule_price_version(db, HIGH_DEMAND_ID, 40.0, start)
+        except ValueError:
+            db.rollback()
+        else:
+            raise AssertionError("Se aceptaron dos versiones con la misma fecha")
+
+        pricing_service.cancel_scheduled_price(db, scheduled.price_id)
+        assert _statuses(db)[scheduled.price_id] == "cancelled"
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, start + timedelta(days=30)) == (current_id, 30.0)
+        print("✓ Programar y cancelar una versión de precio")
+        return True
+    finally:
+        db.close()
+
+
+def test_update_scheduled_price():
+    """Modificar una versión la sustituye por otra; si la nueva no es válida no se cancela nada."""
+    db = _setup_database()
+    try:
+        first_start = datetime.utcnow() + timedelta(days=7)
+        second_start = datetime.utcnow() + timedelta(days=14)
+        first = pricing_service.schedule_price_version(db, HIGH_DEMAND_ID, 35.0, first_start)
+        second = pricing_service.schedule_price_version(db, HIGH_DEMAND_ID, 40.0, second_start)
+        first_id, second_id = first.price_id, second.price_id
+
+        # Mover la primera a la fecha de la segunda falla sin tocar ninguna de las dos
+        try:
+            pricing_service.update_scheduled_price(db, first_id, start_date=second_start)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Se aceptó una fecha ya ocupada")
+        statuses = _statuses(db)
+        assert statuses[first_id] == statuses[second_id] == "scheduled", statuses
+
+        # Una fecha con zona horaria se guarda en UTC sin zona
+        new_start = (first_start + timedelta(days=2)).replace(microsecond=0)
+        aware = new_start.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+        replacement = pricing_service.update_scheduled_price(db, first_id, amount=36.0, start_date=aware)
+
+        assert replacement.price_id != first_id
+        assert replacement.start_date == new_start, replacement.start_date
+        assert _statuses(db)[first_id] == "cancelled"
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, first_start)[1] == 30.0
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, new_start) == (replacement.price_id, 36.0)
+        assert pricing_service.get_price_at(db, HIGH_DEMAND_ID, second_start) == (second_id, 40.0)
+        print("✓ Modificar una versión programada")
+        return True
+    finally:
+        db.close()
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Línea temporal", test_timeline_lookup()),
+        ("Programar y cancelar", test_schedule_and_cancel()),
+        ("Modificar versión", test_update_scheduled_price()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()
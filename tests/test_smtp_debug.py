@@ -6,6 +6,9 @@ Verifica configuración y envía email de prueba.
 Uso:
     python tests/test_smtp_debug.py
     python tests/test_smtp_debug.py --email tu@ejemplo.com
+
+Sin servidor de correo real se puede usar el servidor local de tests/smtp_sink.py
+(python -m tests.smtp_sink) con SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_USE_TLS=false.
 """
 
 import os
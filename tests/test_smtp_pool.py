@@ -0,0 +1,215 @@
+"""
+Pruebas del pool de conexiones SMTP y del circuit breaker contra un servidor SMTP local.
+No necesita base de datos ni credenciales reales.
+
+Uso:
+    python -m tests.test_smtp_pool
+"""
+
+import os
+import smtplib
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.smtp_pool import SMTPConnectionPool, CircuitBreaker, SMTPCircuitOpenError, SMTPPoolTimeoutError
+from tests.smtp_sink import SMTPSink
+
+
+MESSAGE = "Subject: prueba\r\n\r\nHola"
+
+
+def _free_port() -> int:
+    """Puerto local sin nadie escuchando."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_connections_are_reused():
+    """100 envíos desde 4 hilos deben usar como mucho 4 conexiones."""
+    sink = SMTPSink().start()
+    pool = SMTPConnectionPool("127.0.0.1", sink.port, "user", "secret", use_tls=False, max_size=4)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: pool.send("from@test.com", f"user{i}@test.com", MESSAGE), range(100)))
+
+        assert len(sink.messages) == 100
+        assert sink.connections <= 4
+        assert pool.stats()["connections_created"] <= 4
+        print(f"✓ 100 emails con {sink.connections} conexiones")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_reconnects_after_server_restart():
+    """Si el servidor corta las conexiones, el siguiente envío reconecta solo."""
+    sink = SMTPSink().start()
+    port = sink.port
+    pool = SMTPConnectionPool("127.0.0.1", port, use_tls=False, use_login=False, max_size=1)
+    try:
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+        sink.stop()
+
+        sink = SMTPSink(port=port).start()
+        pool.send("from@test.com", "b@test.com", MESSAGE)
+
+        assert len(sink.messages) == 1
+        assert pool.stats()["connections_created"] == 2
+        print("✓ Reconexión automática tras reiniciar el servidor")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_retry_uses_fresh_connection():
+    """Tras un corte, el reintento abre una conexión nueva aunque queden otras ociosas cortadas."""
+    sink = SMTPSink().start()
+    port = sink.port
+    pool = SMTPConnectionPool("127.0.0.1", port, use_tls=False, use_login=False, max_size=2)
+    try:
+        # Dos conexiones ociosas en el pool
+        with pool.connection(), pool.connection():
+            pass
+        sink.stop()
+
+        sink = SMTPSink(port=port).start()
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+
+        assert len(sink.messages) == 1
+        assert pool.stats()["connections_created"] == 3
+        print("✓ El reintento tras un corte usa una conexión nueva")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_idle_connections_expire():
+    """Una conexión ociosa más de idle_timeout se cierra y se abre otra."""
+    sink = SMTPSink().start()
+    pool = SMTPConnectionPool("127.0.0.1", sink.port, use_tls=False, use_login=False, idle_timeout=0.2)
+    try:
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+        time.sleep(0.3)
+        pool.send("from@test.com", "b@test.com", MESSAGE)
+
+        assert sink.connections == 2
+        print("✓ Las conexiones ociosas caducan")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_circuit_breaker_fails_fast():
+    """Con el servidor caído, tras N fallos los envíos se rechazan al instante."""
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+    pool = SMTPConnectionPool("127.0.0.1", _free_port(), use_tls=False, use_login=False, breaker=breaker)
+
+    for _ in range(3):
+        try:
+            pool.send("from@test.com", "a@test.com", MESSAGE)
+        except OSError:
+            pass
+    assert breaker.state == CircuitBreaker.OPEN
+
+    start = time.monotonic()
+    try:
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+        assert False, "Se esperaba SMTPCircuitOpenError"
+    except SMTPCircuitOpenError:
+        pass
+    assert time.monotonic() - start < 0.05
+
+    # Pasado reset_timeout se deja pasar un envío de prueba; si funciona, el circuito se cierra
+    sink = SMTPSink().start()
+    pool.port = sink.port
+    try:
+        time.sleep(0.6)
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+        assert breaker.state == CircuitBreaker.CLOSED
+        print("✓ El circuit breaker se abre y se recupera")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_pool_timeout_keeps_circuit_state():
+    """Esperar una conexión libre no cierra un circuito semiabierto ni bloquea la prueba."""
+    sink = SMTPSink().start()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    pool = SMTPConnectionPool("127.0.0.1", sink.port, use_tls=False, use_login=False, max_size=1, breaker=breaker)
+    try:
+        breaker.record_failure()
+        time.sleep(0.15)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        with pool.connection():
+            try:
+                pool.send("from@test.com", "a@test.com", MESSAGE, timeout=0.1)
+                assert False, "Se esperaba SMTPPoolTimeoutError"
+            except SMTPPoolTimeoutError:
+                pass
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        # La prueba quedó libre: el siguiente envío llega al servidor y cierra el circuito
+        pool.send("from@test.com", "a@test.com", MESSAGE)
+        assert breaker.state == CircuitBreaker.CLOSED
+        print("✓ El timeout del pool no cambia el circuit breaker")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def test_rejected_message_keeps_connection():
+    """Un mensaje rechazado (451) no abre el circuito ni descarta la conexión."""
+    sink = SMTPSink(failure_rate=1.0).start()
+    pool = SMTPConnectionPool("127.0.0.1", sink.port, use_tls=False, use_login=False)
+    try:
+        for _ in range(3):
+            try:
+                pool.send("from@test.com", "a@test.com", MESSAGE)
+                assert False, "Se esperaba SMTPDataError"
+            except smtplib.SMTPDataError:
+                pass
+
+        assert sink.rejected == 3
+        assert sink.connections == 1
+        assert pool.breaker.state == CircuitBreaker.CLOSED
+        print("✓ Los rechazos del servidor no abren el circuito")
+        return True
+    finally:
+        pool.close_all()
+        sink.stop()
+
+
+def run_all_tests():
+    """Ejecuta todos los tests"""
+    results = [
+        ("Reutilizar conexiones", test_connections_are_reused()),
+        ("Reconexión", test_reconnects_after_server_restart()),
+        ("Reintento con conexión nueva", test_retry_uses_fresh_connection()),
+        ("Caducidad de ociosas", test_idle_connections_expire()),
+        ("Circuit breaker", test_circuit_breaker_fails_fast()),
+        ("Timeout del pool", test_pool_timeout_keeps_circuit_state()),
+        ("Rechazo de mensajes", test_rejected_message_keeps_connection()),
+    ]
+
+    print("\n" + "=" * 60)
+    for test_name, passed in results:
+        status = "✓ PASADO" if passed else "✗ FALLIDO"
+        print(f"{status:12} - {test_name}")
+
+
+if __name__ == "__main__":
+    run_all_tests()